@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+from collections import defaultdict
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+
+from src.database.base import AsyncSessionLocal
+from src.database import models, crud
+from src.utils.phone import normalize_phone
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Размер пачки при заполнении phone_normalized
+BATCH_SIZE = 1000
+
+
+async def dedupe_clients(dry_run: bool):
+    """Объединение клиентов с одинаковым телефоном и заполнение phone_normalized"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(models.Client.id, models.Client.phone, models.Client.telegram_id, models.Client.phone_normalized)
+            .where(models.Client.phone.isnot(None), models.Client.phone != "")
+            .order_by(models.Client.id)
+        )
+        rows = result.all()
+
+        groups: Dict[str, List] = defaultdict(list)
+        for row in rows:
+            phone_normalized = normalize_phone(row.phone)
+            if phone_normalized:
+                groups[phone_normalized].append(row)
+
+        # Объединение дубликатов: остаётся клиент с Telegram, иначе самый старый
+        merged = set()
+        failed = set()
+        for phone_normalized, group in groups.items():
+            if len(group) < 2:
+                continue
+            keep = next((row for row in group if row.telegram_id), group[0])
+            duplicate_ids = [row.id for row in group if row.id != keep.id]
+            telegram_ids = {row.telegram_id for row in group if row.telegram_id}
+            print(f"{phone_normalized}: клиент {keep.id}, дубликаты {duplicate_ids}")
+            if len(telegram_ids) > 1:
+                print(f"  Внимание: разные Telegram ID {sorted(telegram_ids)}, сохраняется {keep.telegram_id}")
+            if not dry_run:
+                if not await crud.merge_clients(session, keep.id, duplicate_ids):
+                    print(f"  Ошибка при объединении клиентов с телефоном {phone_normalized}")
+                    failed.add(phone_normalized)
+                    continue
+            merged.update(duplicate_ids)
+
+        # Заполнение phone_normalized у оставшихся клиентов
+        changes = []
+        for row in rows:
+            if row.id in merged:
+                continue
+            phone_normalized = normalize_phone(row.phone)
+            if phone_normalized in failed:
+                # Дубликаты не объединены: общий номер нарушил бы уникальный индекс
+                phone_normalized = None
+            if phone_normalized != row.phone_normalized:
+                changes.append({"id": row.id, "phone_normalized": phone_normalized})
+
+        print(f"Объединено дубликатов: {len(merged)}, телефонов к обновлению: {len(changes)}")
+        if failed:
+            print(f"Не объединены (телефон не нормализован, запустите скрипт повторно): {sorted(failed)}")
+        if dry_run:
+            return
+
+        for start in range(0, len(changes), BATCH_SIZE):
+            await session.execute(update(models.Client), changes[start:start + BATCH_SIZE])
+            await session.commit()
+
+        # Уникальный индекс создаётся, когда дубликатов не осталось
+        await crud.add_database_indexes(session)
+        print("Телефоны клиентов нормализованы.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Объединение клиентов с одинаковым телефоном")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать дубликаты")
+    args = parser.parse_args()
+    asyncio.run(dedupe_clients(args.dry_run))
@@ -43,7 +43,9 @@ async def init_admin():
                 print(f"Администратор создан успешно!")
             else:
                 print(f"Администратор с Telegram ID {admin_id} уже существует.")
-                # Обновление пароля
+                # Обновление пароля (токены, выданные со старым паролем, отзываются)
+                if not pwd_context.verify(ADMIN_PASSWORD, admin.password_hash):
+                    admin.token_version = models.Admin.token_version + 1
                 admin.password_hash = get_password_hash(ADMIN_PASSWORD)
                 await session.commit()
                 print(f"Пароль администратора обновлен.")
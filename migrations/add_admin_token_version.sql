@@ -0,0 +1,2 @@
+-- Версия токенов администратора: увеличение отзывает выданные токены
+ALTER TABLE admin ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
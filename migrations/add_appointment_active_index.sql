@@ -0,0 +1,3 @@
+-- Завершение прошедших записей: только активные, по времени окончания
+CREATE INDEX IF NOT EXISTS idx_appointment_active_end ON appointment (end_time)
+    WHERE status = 'active';
@@ -0,0 +1,3 @@
+-- Поиск записей по процедурам (procedures @> ARRAY[...] и procedures && ARRAY[...])
+-- Индекс на секционированной таблице создаётся во всех секциях
+CREATE INDEX IF NOT EXISTS idx_appointment_procedures ON appointment USING gin (procedures);
@@ -0,0 +1,5 @@
+-- Отметка об отправленном напоминании о записи
+ALTER TABLE appointment ADD COLUMN IF NOT EXISTS reminder_sent_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_appointment_reminder_pending ON appointment (start_time)
+    WHERE status = 'active' AND reminder_sent_at IS NULL;
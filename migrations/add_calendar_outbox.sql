@@ -0,0 +1,14 @@
+-- Очередь синхронизации записей с Google Calendar (transactional outbox)
+CREATE TABLE IF NOT EXISTS calendar_outbox (
+    id SERIAL PRIMARY KEY,
+    appointment_id INTEGER NOT NULL,
+    operation VARCHAR(20) NOT NULL,
+    google_event_id VARCHAR(100),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    available_at TIMESTAMP NOT NULL DEFAULT now(),
+    created_at TIMESTAMP DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_calendar_outbox_id ON calendar_outbox (id);
+CREATE INDEX IF NOT EXISTS ix_calendar_outbox_appointment_id ON calendar_outbox (appointment_id);
+CREATE INDEX IF NOT EXISTS ix_calendar_outbox_available_at ON calendar_outbox (available_at);
@@ -0,0 +1,2 @@
+-- Аренда строк очереди календаря: воркер фиксирует захват до запросов к Google
+ALTER TABLE calendar_outbox ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
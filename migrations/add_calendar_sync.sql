@@ -0,0 +1,8 @@
+-- Инкрементальная синхронизация с Google Calendar
+ALTER TABLE calendar_outbox ADD COLUMN IF NOT EXISTS changed_fields VARCHAR(50)[];
+
+CREATE TABLE IF NOT EXISTS calendar_sync_state (
+    calendar_id VARCHAR(255) PRIMARY KEY,
+    sync_token TEXT,
+    updated_at TIMESTAMP DEFAULT now()
+);
@@ -0,0 +1,8 @@
+-- Телефон клиента в формате E.164 (+380501234567)
+ALTER TABLE client ADD COLUMN IF NOT EXISTS phone_normalized VARCHAR(16);
+
+-- Индекс на пустом столбце создаётся сразу. Затем скрипт объединяет
+-- дубликаты и заполняет столбец:
+--     python dedupe_clients.py
+CREATE UNIQUE INDEX IF NOT EXISTS idx_client_phone_normalized ON client (phone_normalized)
+    WHERE phone_normalized IS NOT NULL;
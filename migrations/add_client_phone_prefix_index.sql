@@ -0,0 +1,3 @@
+-- Поиск клиента по началу номера телефона (только цифры)
+CREATE INDEX IF NOT EXISTS idx_client_phone_digits_prefix ON client
+    ((regexp_replace(phone, '\D', '', 'g')) text_pattern_ops);
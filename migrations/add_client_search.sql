@@ -0,0 +1,9 @@
+-- Поиск клиентов по имени, цифрам телефона и telegram_id
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_client_name_trgm ON client USING gin (name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_client_phone_digits_trgm ON client
+    USING gin ((regexp_replace(phone, '\D', '', 'g')) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_client_telegram_id ON client (telegram_id);
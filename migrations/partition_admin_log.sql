@@ -0,0 +1,48 @@
+-- Секционирование admin_log по месяцам (timestamp).
+-- Следующие секции создаёт и секции старше ADMIN_LOG_RETENTION_MONTHS
+-- удаляет API (src/database/partitions.py).
+BEGIN;
+
+ALTER TABLE admin_log RENAME TO admin_log_old;
+ALTER TABLE admin_log_old RENAME CONSTRAINT admin_log_pkey TO admin_log_old_pkey;
+DROP INDEX IF EXISTS ix_admin_log_id;
+
+-- Ключ секционирования входит в первичный ключ
+CREATE TABLE admin_log (
+    id INTEGER NOT NULL DEFAULT nextval('admin_log_id_seq'),
+    admin_id INTEGER REFERENCES admin (id) ON DELETE CASCADE,
+    action VARCHAR(255) NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT now(),
+    details TEXT,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE admin_log_id_seq OWNED BY admin_log.id;
+
+CREATE TABLE admin_log_default PARTITION OF admin_log DEFAULT;
+
+-- Секции для существующих записей и трёх месяцев вперёд
+DO $$
+DECLARE
+    month TIMESTAMP;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT min(timestamp) FROM admin_log_old), now()::timestamp)),
+            date_trunc('month', now()::timestamp) + interval '3 months',
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF admin_log FOR VALUES FROM (%L) TO (%L)',
+            'admin_log_p' || to_char(month, 'YYYYMM'), month, month + interval '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO admin_log (id, admin_id, action, timestamp, details)
+SELECT id, admin_id, action, COALESCE(timestamp, now()), details FROM admin_log_old;
+
+DROP TABLE admin_log_old;
+
+COMMIT;
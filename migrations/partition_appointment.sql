@@ -0,0 +1,66 @@
+-- Секционирование appointment по месяцам (start_time).
+-- Следующие секции создаёт API (src/database/partitions.py); секции старше
+-- APPOINTMENT_ARCHIVE_MONTHS без активных записей переносятся в схему archive.
+BEGIN;
+
+ALTER TABLE appointment RENAME TO appointment_old;
+ALTER TABLE appointment_old RENAME CONSTRAINT appointment_pkey TO appointment_old_pkey;
+ALTER INDEX IF EXISTS ix_appointment_id RENAME TO ix_appointment_old_id;
+
+-- Ключ секционирования входит в первичный ключ
+CREATE TABLE appointment (
+    id INTEGER NOT NULL DEFAULT nextval('appointment_id_seq'),
+    client_id INTEGER REFERENCES client (id) ON DELETE CASCADE,
+    master_id INTEGER REFERENCES master (id) ON DELETE CASCADE,
+    workplace_id INTEGER REFERENCES workplace (id) ON DELETE CASCADE,
+    procedures INTEGER[] NOT NULL,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    status appointmentstatus,
+    google_event_id VARCHAR(100),
+    reminder_sent_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (id, start_time)
+) PARTITION BY RANGE (start_time);
+
+ALTER SEQUENCE appointment_id_seq OWNED BY appointment.id;
+
+CREATE TABLE appointment_default PARTITION OF appointment DEFAULT;
+
+-- Секции для всех существующих записей и трёх месяцев вперёд
+DO $$
+DECLARE
+    month TIMESTAMP;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE((SELECT min(start_time) FROM appointment_old), now()::timestamp), now()::timestamp)),
+            date_trunc('month', GREATEST(COALESCE((SELECT max(start_time) FROM appointment_old), now()::timestamp),
+                                         now()::timestamp + interval '3 months')),
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF appointment FOR VALUES FROM (%L) TO (%L)',
+            'appointment_p' || to_char(month, 'YYYYMM'), month, month + interval '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO appointment (
+    id, client_id, master_id, workplace_id, procedures, start_time, end_time, status,
+    google_event_id, reminder_sent_at, created_at, updated_at
+)
+SELECT
+    id, client_id, master_id, workplace_id, procedures, start_time, end_time, status,
+    google_event_id, reminder_sent_at, created_at, updated_at
+FROM appointment_old;
+
+DROP TABLE appointment_old;
+
+CREATE INDEX ix_appointment_id ON appointment (id);
+
+COMMIT;
+
+-- Индексы idx_appointment_* создаются заново при запуске API (crud.add_database_indexes)
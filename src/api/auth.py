@@ -0,0 +1,77 @@
+"""
+Admin authentication helpers.
+
+The access token carries the admin's telegram_id ("sub") and token_version
+("ver"). get_current_admin runs on every admin API request, so the admin
+row is loaded once per (sub, ver) and kept as an immutable AdminPrincipal
+for ADMIN_CACHE_TTL seconds. Incrementing admin.token_version (init_admin.py,
+a separate process) revokes all tokens issued before it; the API notices
+within the TTL.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from src.database.models import Admin
+
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "30"))
+ADMIN_CACHE_SIZE = int(os.getenv("ADMIN_CACHE_SIZE", "1000"))
+
+
+@dataclass(frozen=True)
+class AdminPrincipal:
+    """Authenticated admin detached from the database session"""
+    id: int
+    telegram_id: int
+    username: str
+    is_superadmin: bool
+    token_version: int
+
+    @classmethod
+    def from_admin(cls, admin: Admin) -> "AdminPrincipal":
+        return cls(
+            id=admin.id,
+            telegram_id=admin.telegram_id,
+            username=admin.username,
+            is_superadmin=bool(admin.is_superadmin),
+            token_version=admin.token_version or 0
+        )
+
+
+class AdminPrincipalCache:
+    """Short-lived cache of admins by token subject and version"""
+
+    def __init__(self, ttl: float = ADMIN_CACHE_TTL, max_entries: int = ADMIN_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[float, AdminPrincipal]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int, token_version: int) -> Optional[AdminPrincipal]:
+        key = (telegram_id, token_version)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, principal: AdminPrincipal) -> AdminPrincipal:
+        key = (principal.telegram_id, principal.token_version)
+        self._entries[key] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return principal
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+admin_principal_cache = AdminPrincipalCache()
+
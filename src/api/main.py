@@ -2,27 +2,37 @@
 Оптимизированные эндпоинты API для работы с Beauty Salon Bot
 """
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete, and_, or_, desc, asc, func
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
 import json
+import asyncio
 import logging
 from dotenv import load_dotenv
 
-from src.database.base import get_db
+from src.database.base import get_db, AsyncSessionLocal
 from src.database import crud
+from src.database.audit import audit_log
+from src.database.partitions import run_partition_maintenance
+from src.database.reports import create_report_views, get_report, run_report_refresh
 from src.api import schemas
 from src.api.response_models import APIResponse, SectionResponseModel, ProcedureResponseModel
+from src.api.auth import AdminPrincipal, admin_principal_cache
 from src.database.models import Master, Workplace, WorkSlot, Appointment, AppointmentStatus
+from src.utils.analytics import HEATMAP_BUCKET_MINUTES, get_occupancy_heatmaps
+from src.utils.appointment_jobs import run_appointment_completion_worker
+from src.utils.calendar_outbox import CALENDAR_SYNC_ENABLED, run_calendar_outbox_worker
+from src.utils.ics import ICS_ENABLED, ics_feed_cache, feed_token, verify_feed_token
 
 # Настройка логирования
 logging.basicConfig(
@@ -42,6 +52,12 @@ SECRET_KEY = os.getenv("API_SECRET_KEY", "your_secret_key_for_jwt")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Размер страницы списка клиентов
+CLIENTS_PAGE_SIZE = int(os.getenv("CLIENTS_PAGE_SIZE", "50"))
+
+# Максимальный период тепловой карты загрузки (дней)
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "366"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -60,6 +76,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Фоновые задачи, запущенные при старте приложения
+background_tasks: List[asyncio.Task] = []
+
 # Статические файлы и шаблоны
 app.mount("/static", StaticFiles(directory="src/api/static"), name="static")
 templates = Jinja2Templates(directory="src/api/templates")
@@ -110,7 +129,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> AdminPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -122,16 +141,27 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), db: AsyncSessio
         if telegram_id is None:
             raise credentials_exception
         token_data = schemas.TokenData(username=telegram_id)
-    except JWTError:
+        admin_telegram_id = int(token_data.username)
+        # Токены, выданные до появления версии, считаются версией 0
+        token_version = int(payload.get("ver", 0))
+    except (JWTError, ValueError):
         raise credentials_exception
-    admin = await crud.get_admin_by_telegram_id(db, int(token_data.username))
-    if admin is None:
+    
+    principal = admin_principal_cache.get(admin_telegram_id, token_version)
+    if principal is not None:
+        return principal
+    
+    admin = await crud.get_admin_by_telegram_id(db, admin_telegram_id)
+    if admin is None or (admin.token_version or 0) != token_version:
         raise credentials_exception
-    return admin
+    return admin_principal_cache.put(AdminPrincipal.from_admin(admin))
 
 # Authentication endpoints
 @app.post("/token", response_model=APIResponse[schemas.Token])
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Получение токена доступа
     """
@@ -150,7 +180,8 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         else:
             logger.error(f"Admin not found for: {form_data.username}")
         
-        if not admin or not verify_password(form_data.password, admin.password_hash):
+        # bcrypt занимает ~100 мс, выполняем его вне цикла событий
+        if not admin or not await run_in_threadpool(verify_password, form_data.password, admin.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -159,10 +190,11 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
-            data={"sub": str(admin.telegram_id)}, expires_delta=access_token_expires
+            data={"sub": str(admin.telegram_id), "ver": admin.token_version or 0},
+            expires_delta=access_token_expires
         )
         
-        await crud.log_admin_action(db, admin.id, "login", "Admin logged in via API")
+        audit_log.log(admin.id, "login", "Admin logged in via API")
         
         token_data = {"access_token": access_token, "token_type": "bearer"}
         return APIResponse.success_response(
@@ -474,6 +506,16 @@ async def delete_procedure(
     Удаление процедуры
     """
     try:
+        # Нельзя удалить процедуру, на которую есть предстоящие записи
+        upcoming = await crud.count_upcoming_appointments_with_procedure(db, procedure_id)
+        if upcoming is None:
+            raise HTTPException(status_code=500, detail="Failed to check appointments for the procedure")
+        if upcoming:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Procedure with ID {procedure_id} is used in {upcoming} upcoming appointments"
+            )
+        
         success = await crud.delete_procedure(db, procedure_id)
         
         if not success:
@@ -526,13 +568,15 @@ async def admin_clients(request: Request, db: AsyncSession = Depends(get_db)):
     Страница управления клиентами
     """
     try:
-        # Получаем список клиентов
-        clients = await crud.get_clients(db)
+        # Первая страница клиентов, остальные подгружаются через /api/clients
+        page = await crud.get_clients_page(db, limit=CLIENTS_PAGE_SIZE)
         
         return templates.TemplateResponse("clients.html", {
             "request": request,
             "active_page": "clients",
-            "clients": clients
+            "clients": page["items"],
+            "next_cursor": page["next_cursor"],
+            "page_size": CLIENTS_PAGE_SIZE
         })
     except Exception as e:
         logger.error(f"Error in admin_clients: {e}")
@@ -599,6 +643,21 @@ async def admin_settings(request: Request, db: AsyncSession = Depends(get_db)):
         logger.error(f"Error in admin_settings: {e}")
         raise
 
+@app.get("/admin/analytics", response_class=HTMLResponse)
+async def admin_analytics(request: Request):
+    """
+    Страница загрузки мастеров и рабочих мест
+    """
+    try:
+        return templates.TemplateResponse("analytics.html", {
+            "request": request,
+            "active_page": "analytics",
+            "bucket_minutes": HEATMAP_BUCKET_MINUTES
+        })
+    except Exception as e:
+        logger.error(f"Error in admin_analytics: {e}")
+        raise
+
 @app.get("/admin/work_slots", response_class=HTMLResponse)
 async def admin_work_slots(request: Request, db: AsyncSession = Depends(get_db)):
     """
@@ -899,7 +958,7 @@ async def create_workplace(
         if new_workplace is None:
             raise HTTPException(status_code=500, detail="Failed to create workplace")
         
-        await crud.log_admin_action(db, current_admin.id, "create_workplace", f"Created workplace: {new_workplace['name']}")
+        audit_log.log(current_admin.id, "create_workplace", f"Created workplace: {new_workplace['name']}")
         
         return APIResponse.success_response(
             data=new_workplace,
@@ -928,7 +987,7 @@ async def update_workplace(
         if updated_workplace is None:
             raise HTTPException(status_code=404, detail=f"Workplace with ID {workplace_id} not found")
         
-        await crud.log_admin_action(db, current_admin.id, "update_workplace", f"Updated workplace: {updated_workplace['name']}")
+        audit_log.log(current_admin.id, "update_workplace", f"Updated workplace: {updated_workplace['name']}")
         
         return APIResponse.success_response(
             data=updated_workplace,
@@ -960,7 +1019,7 @@ async def delete_workplace(
         if not success:
             raise HTTPException(status_code=500, detail="Failed to delete workplace")
         
-        await crud.log_admin_action(db, current_admin.id, "delete_workplace", f"Deleted workplace: {workplace['name']}")
+        audit_log.log(current_admin.id, "delete_workplace", f"Deleted workplace: {workplace['name']}")
         
         return APIResponse.success_response(
             data={"id": workplace_id},
@@ -1191,6 +1250,40 @@ async def read_master(master_id: int, db: AsyncSession = Depends(get_db)):
             errors=[{"code": 500, "detail": str(e)}]
         )
 
+@app.get("/api/v2/masters/{master_id}/calendar.ics")
+async def read_master_calendar(
+    master_id: int,
+    request: Request,
+    token: str = Query(..., description="Токен доступа к календарю мастера"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    ICS-календарь записей мастера (подписка из Google/Apple Calendar).
+    Поддерживает условные запросы: If-None-Match / If-Modified-Since -> 304
+    """
+    if not ICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calendar feed is disabled")
+    if not verify_feed_token(master_id, token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid calendar token")
+    
+    try:
+        feed = await ics_feed_cache.get_feed(db, master_id)
+    except Exception as e:
+        logger.error(f"Error in read_master_calendar: {e}")
+        raise
+    
+    if feed is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Master not found")
+    
+    headers = {"ETag": feed.etag, "Cache-Control": "private, max-age=60"}
+    if feed.last_modified:
+        headers["Last-Modified"] = feed.last_modified
+    
+    if feed.not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return Response(content=feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
+
 @app.get("/api/masters/{master_id}", response_model=APIResponse[Dict[str, Any]])
 async def read_master_v1(master_id: int, db: AsyncSession = Depends(get_db), current_admin = Depends(get_current_admin)):
     """
@@ -1204,6 +1297,10 @@ async def read_master_v1(master_id: int, db: AsyncSession = Depends(get_db), cur
                 errors=[{"code": 404, "detail": "Master not found"}]
             )
         
+        # Ссылка на ICS-календарь доступна только администратору (и только с настроенным секретом)
+        if ICS_ENABLED:
+            master["calendar_url"] = f"/api/v2/masters/{master_id}/calendar.ics?token={feed_token(master_id)}"
+        
         return APIResponse.success_response(
             data=master,
             message=f"Master with ID {master_id} retrieved successfully"
@@ -1335,16 +1432,21 @@ async def delete_master(master_id: int, db: AsyncSession = Depends(get_db), curr
 
 # Эндпоинты для клиентов
 @app.get("/api/clients", response_model=APIResponse)
-async def read_clients(db: AsyncSession = Depends(get_db)):
+async def read_clients(
+    cursor: Optional[int] = Query(None, description="ID последнего клиента предыдущей страницы"),
+    limit: int = Query(CLIENTS_PAGE_SIZE, ge=1, le=200, description="Размер страницы"),
+    search: Optional[str] = Query(None, description="Поиск по имени, телефону или Telegram ID"),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Получение всех клиентов
+    Получение страницы клиентов
     """
     try:
-        clients = await crud.get_clients(db)
+        page = await crud.get_clients_page(db, after_id=cursor, limit=limit, search=search)
         return APIResponse(
             status="success",
             message="Список клиентов получен успешно",
-            data=clients
+            data=page
         )
     except Exception as e:
         logger.error(f"Error in read_clients: {e}")
@@ -1678,6 +1780,37 @@ async def update_appointment(appointment_id: int, appointment_data: Dict[str, An
             detail="Ошибка при обновлении записи"
         )
 
+@app.post("/api/appointments/{appointment_id}/cancel", response_model=APIResponse)
+async def cancel_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Отмена активной записи
+    """
+    try:
+        # Только смена статуса, без загрузки записи со связанными данными
+        canceled = await crud.update_appointment_status(
+            db, appointment_id, AppointmentStatus.canceled, expected_status=AppointmentStatus.active
+        )
+        
+        if not canceled:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Активная запись с ID {appointment_id} не найдена"
+            )
+        
+        return APIResponse(
+            status="success",
+            message="Запись успешно отменена",
+            data=canceled
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in cancel_appointment: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при отмене записи"
+        )
+
 @app.delete("/api/v2/appointments/{appointment_id}", response_model=APIResponse)
 async def delete_appointment_v2(appointment_id: int, db: AsyncSession = Depends(get_db)):
     """
@@ -1769,6 +1902,69 @@ async def delete_appointment(appointment_id: int, db: AsyncSession = Depends(get
             detail="Ошибка при удалении записи"
         )
 
+@app.get("/api/v2/reports", response_model=APIResponse[Dict[str, Any]])
+async def read_reports(
+    date_from: Optional[date] = Query(None, description="Начало периода (по умолчанию 30 дней назад)"),
+    date_to: Optional[date] = Query(None, description="Конец периода включительно (по умолчанию сегодня)"),
+    master_id: Optional[int] = Query(None, description="ID мастера для фильтрации"),
+    lang: schemas.LanguageEnum = Query(schemas.LanguageEnum.UKR, description="Язык названий процедур"),
+    db: AsyncSession = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """
+    Отчёт по выручке, загрузке мастеров и отменам за период
+    """
+    date_to = date_to or datetime.now().date()
+    date_from = date_from or date_to - timedelta(days=30)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    
+    report = await get_report(db, date_from, date_to, master_id, lang.value)
+    if report is None:
+        raise HTTPException(status_code=500, detail="Failed to build report")
+    
+    return APIResponse.success_response(
+        data=report,
+        message="Report retrieved successfully"
+    )
+
+@app.get("/api/v2/analytics/heatmap", response_model=APIResponse[Dict[str, Any]])
+async def read_occupancy_heatmap(
+    date_from: Optional[date] = Query(None, description="Начало периода (по умолчанию 90 дней назад)"),
+    date_to: Optional[date] = Query(None, description="Конец периода включительно (по умолчанию сегодня)"),
+    group_by: str = Query("master", pattern="^(master|workplace)$", description="Группировка: master или workplace"),
+    db: AsyncSession = Depends(get_db),
+    current_admin = Depends(get_current_admin)
+):
+    """
+    Загрузка по дням недели и времени суток (корзины по 15 минут)
+    """
+    date_to = date_to or datetime.now().date()
+    date_from = date_from or date_to - timedelta(days=90)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    if (date_to - date_from).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Period must not exceed {ANALYTICS_MAX_DAYS} days")
+    
+    heatmaps = await get_occupancy_heatmaps(db, date_from, date_to, group_by)
+    if heatmaps is None:
+        raise HTTPException(status_code=500, detail="Failed to build heatmap")
+    
+    return APIResponse.success_response(
+        data=heatmaps,
+        message="Heatmap retrieved successfully"
+    )
+
+@app.get("/api/v2/audit/stats", response_model=APIResponse[Dict[str, Any]])
+async def read_audit_stats(current_admin = Depends(get_current_admin)):
+    """
+    Состояние очереди журнала действий администраторов
+    """
+    return APIResponse.success_response(
+        data=audit_log.stats(),
+        message="Audit log stats retrieved successfully"
+    )
+
 # Инициализация индексов при запуске приложения
 @app.on_event("startup")
 async def startup_event():
@@ -1776,12 +1972,42 @@ async def startup_event():
     Действия при запуске приложения
     """
     try:
-        async with AsyncSession() as session:
+        async with AsyncSessionLocal() as session:
             await crud.add_database_indexes(session)
+        
+        # Пакетная запись журнала действий администраторов и обслуживание секций
+        audit_log.start()
+        background_tasks.append(asyncio.create_task(run_partition_maintenance()))
+        
+        # Завершение прошедших записей
+        background_tasks.append(asyncio.create_task(run_appointment_completion_worker()))
+        
+        # Отчёты: материализованные представления обновляются в фоне
+        async with AsyncSessionLocal() as session:
+            await create_report_views(session)
+        background_tasks.append(asyncio.create_task(run_report_refresh()))
+        
+        # Фоновая синхронизация записей с Google Calendar
+        if CALENDAR_SYNC_ENABLED:
+            background_tasks.append(asyncio.create_task(run_calendar_outbox_worker()))
+        
         logger.info("Application started successfully")
     except Exception as e:
         logger.error(f"Error during startup: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Действия при остановке приложения
+    """
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    
+    # Записываем накопленные действия администраторов
+    await audit_log.stop()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
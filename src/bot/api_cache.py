@@ -0,0 +1,197 @@
+"""
+In-memory response cache for the API client.
+
+Entries are fresh for ``ttl`` seconds and may be served stale for another
+``stale_ttl`` seconds while a single background request refreshes them
+(stale-while-revalidate). Concurrent misses for the same key share one
+in-flight request (single-flight).
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    stored_at: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    coalesced: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    errors: int = 0
+    fallbacks: int = 0
+
+    @property
+    def requests(self) -> int:
+        return self.hits + self.stale_hits + self.coalesced + self.misses
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of calls answered without an own request to the API"""
+        if not self.requests:
+            return 0.0
+        return (self.requests - self.misses) / self.requests
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "fallbacks": self.fallbacks,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+
+
+@dataclass
+class CachePolicy:
+    ttl: float
+    stale_ttl: float = 0
+
+
+class TTLCache:
+    """TTL cache with stale-while-revalidate and request coalescing.
+
+    Cached values are shared between callers and must not be mutated.
+    When a request fails and ``fallback_on(error)`` is true, the last known
+    value is returned no matter how old it is.
+    """
+
+    def __init__(
+        self,
+        policies: Dict[str, CachePolicy],
+        max_entries: int = 1000,
+        fallback_on: Optional[Callable[[Exception], bool]] = None,
+        on_store: Optional[Callable[[str, Any], None]] = None
+    ):
+        self.policies = policies
+        self.max_entries = max_entries
+        self.fallback_on = fallback_on
+        # Вызывается с namespace и значением, когда сохранённое значение изменилось
+        self.on_store = on_store
+        self._entries: "OrderedDict[Tuple[str, Hashable], CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._stats: Dict[str, CacheStats] = {name: CacheStats() for name in policies}
+
+    def _stats_for(self, namespace: str) -> CacheStats:
+        return self._stats.setdefault(namespace, CacheStats())
+
+    async def get_or_fetch(self, namespace: str, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return cached value or load it with ``fetch``.
+
+        Args:
+            namespace: Endpoint name, selects the cache policy
+            key: Request parameters
+            fetch: Coroutine factory that performs the request
+
+        Returns:
+            Response value
+        """
+        policy = self.policies[namespace]
+        stats = self._stats_for(namespace)
+        cache_key = (namespace, key)
+        entry = self._entries.get(cache_key)
+
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            if age < policy.ttl:
+                stats.hits += 1
+                self._entries.move_to_end(cache_key)
+                return entry.value
+            if age < policy.ttl + policy.stale_ttl:
+                stats.stale_hits += 1
+                self._entries.move_to_end(cache_key)
+                if cache_key not in self._inflight:
+                    stats.refreshes += 1
+                    self._start_fetch(cache_key, fetch, background=True)
+                return entry.value
+
+        task = self._inflight.get(cache_key)
+        if task is not None:
+            stats.coalesced += 1
+        else:
+            stats.misses += 1
+            task = self._start_fetch(cache_key, fetch)
+
+        try:
+            # shield: отмена одного ожидающего не должна отменять общий запрос
+            return await asyncio.shield(task)
+        except Exception as e:
+            if entry is not None and self.fallback_on is not None and self.fallback_on(e):
+                stats.fallbacks += 1
+                logger.warning("Serving expired %s from cache: %s", cache_key, e)
+                return entry.value
+            raise
+
+    def _start_fetch(self, cache_key: Tuple[str, Hashable], fetch: Callable[[], Awaitable[Any]], background: bool = False) -> asyncio.Task:
+        task = asyncio.create_task(self._fetch(cache_key, fetch))
+        if background:
+            task.add_done_callback(lambda done: self._log_refresh_error(cache_key, done))
+        self._inflight[cache_key] = task
+        return task
+
+    @staticmethod
+    def _log_refresh_error(cache_key: Tuple[str, Hashable], task: asyncio.Task) -> None:
+        # Ошибка фонового обновления: продолжаем отдавать устаревшее значение.
+        # Присоединившиеся к этому запросу получают ту же ошибку (или запасное значение)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background refresh of %s failed: %s", cache_key, task.exception())
+
+    async def _fetch(self, cache_key: Tuple[str, Hashable], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception:
+            self._stats_for(cache_key[0]).errors += 1
+            raise
+        else:
+            self.set(cache_key[0], cache_key[1], value)
+            return value
+        finally:
+            self._inflight.pop(cache_key, None)
+
+    def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        """Store value in the cache.
+
+        If the value equals the cached one, the cached object is kept (only
+        its age is reset), so values stay identical across refreshes.
+        """
+        cache_key = (namespace, key)
+        previous = self._entries.get(cache_key)
+        changed = previous is None or previous.value != value
+        if not changed:
+            value = previous.value
+        self._entries[cache_key] = CacheEntry(value=value, stored_at=time.monotonic())
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if changed and self.on_store is not None:
+            self.on_store(namespace, value)
+
+    def peek(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        """Get entry regardless of its age (None if absent)"""
+        return self._entries.get((namespace, key))
+
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """Drop all entries or entries of one namespace"""
+        if namespace is None:
+            self._entries.clear()
+            return
+        for cache_key in [k for k in self._entries if k[0] == namespace]:
+            del self._entries[cache_key]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counters per namespace"""
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
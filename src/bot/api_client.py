@@ -3,14 +3,42 @@ API Client for interacting with the Beauty Salon API.
 Handles all HTTP requests, error handling, and response parsing.
 """
 import aiohttp
+import asyncio
 import logging
 import json
+import re
+import time
 from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
 import os
 
+from src.bot.api_cache import CachePolicy, TTLCache
+from src.bot.keyboards import keyboard_cache
+from src.bot.resilience import CircuitBreaker, LatencyHistogram, backoff_delay
+from src.utils.translations import merge_catalog_names
+
 logger = logging.getLogger(__name__)
 
+# Cache policies for catalog endpoints: (fresh seconds, extra seconds served stale)
+CACHE_POLICIES = {
+    "sections": CachePolicy(ttl=int(os.getenv("API_CACHE_TTL_SECTIONS", "300")), stale_ttl=600),
+    "procedures": CachePolicy(ttl=int(os.getenv("API_CACHE_TTL_PROCEDURES", "300")), stale_ttl=600),
+    "masters": CachePolicy(ttl=int(os.getenv("API_CACHE_TTL_MASTERS", "120")), stale_ttl=600),
+    "master": CachePolicy(ttl=int(os.getenv("API_CACHE_TTL_MASTERS", "120")), stale_ttl=600),
+}
+
+# Cache namespaces whose data is rendered into keyboards
+KEYBOARD_NAMESPACES = {"sections", "procedures", "masters"}
+# Cache namespaces whose names are merged into the translation tables
+CATALOG_NAME_KINDS = {"sections": "section", "procedures": "procedure"}
+
+# Default time budget of one API call including retries, seconds
+API_DEADLINE = float(os.getenv("API_DEADLINE", "5"))
+# Budget of non-idempotent calls (POST/PUT/DELETE): they are not retried, and
+# giving up early would report a failure for a write the API may have committed
+API_WRITE_DEADLINE = float(os.getenv("API_WRITE_DEADLINE", "30"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+
 class ApiError(Exception):
     """Custom exception for API errors"""
     def __init__(self, status: int, message: str, details: Optional[Dict] = None):
@@ -19,33 +47,123 @@ class ApiError(Exception):
         self.details = details or {}
         super().__init__(f"API Error {status}: {message}")
 
+    @property
+    def is_unavailable(self) -> bool:
+        """True for timeouts, network failures and server errors"""
+        return self.status >= 500
+
+class ApiTransportError(ApiError):
+    """The API did not answer: timeout or connection failure"""
+
+def _on_catalog_store(namespace: str, value: Any) -> None:
+    """Refresh catalog names and keyboards after changed catalog data was cached"""
+    kind = CATALOG_NAME_KINDS.get(namespace)
+    if kind is not None:
+        items = value.get("data") if isinstance(value, dict) else value
+        if not isinstance(items, list):
+            items = []
+        merge_catalog_names(
+            (kind, item["id"], translation.get("lang"), translation.get("name"))
+            for item in items
+            if isinstance(item, dict) and item.get("id") is not None
+            for translation in item.get("translations") or []
+        )
+    if namespace in KEYBOARD_NAMESPACES:
+        keyboard_cache.bump()
+
 class BeautySalonApiClient:
     """Client for interacting with the Beauty Salon API"""
     
-    def __init__(self, base_url: str = None, api_key: str = None, timeout: int = 30):
+    def __init__(
+        self,
+        base_url: str = None,
+        api_key: str = None,
+        timeout: int = 30,
+        pool_size: int = None,
+        keepalive_timeout: int = 30,
+        deadline: float = API_DEADLINE,
+        write_deadline: float = API_WRITE_DEADLINE,
+        max_retries: int = API_MAX_RETRIES
+    ):
         """Initialize the API client.
         
+        The HTTP session is created once and reused for the whole process
+        lifetime, so TCP connections to the API are kept alive between calls.
+        
         Args:
             base_url: Base URL of the API (defaults to API_BASE_URL env var or http://localhost:8000)
             api_key: API key for authentication (defaults to API_KEY env var)
-            timeout: Request timeout in seconds
+            timeout: Upper bound for any request in seconds
+            pool_size: Max number of open connections (defaults to API_POOL_SIZE env var or 100)
+            keepalive_timeout: Seconds to keep an idle connection open
+            deadline: Default time budget of one GET call including retries, seconds
+            write_deadline: Default time budget of one POST/PUT/DELETE call, seconds
+            max_retries: Number of retries for idempotent (GET) requests
         """
         # When running in Docker, use the service name 'api' instead of 'localhost'
         default_url = "http://api:8000" if os.getenv("DOCKER", "false").lower() == "true" else "http://localhost:8000"
         self.base_url = base_url or os.getenv("API_BASE_URL", default_url)
         self.api_key = api_key or os.getenv("API_KEY")
         self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.pool_size = pool_size or int(os.getenv("API_POOL_SIZE", "100"))
+        self.keepalive_timeout = keepalive_timeout
         self.session = None
+        self._session_lock = asyncio.Lock()
+        self.deadline = deadline
+        self.write_deadline = write_deadline
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("API_BREAKER_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("API_BREAKER_RECOVERY", "15"))
+        )
+        self.latency = LatencyHistogram()
+        # При недоступности API отдаём последние известные данные каталога
+        self.cache = TTLCache(
+            CACHE_POLICIES,
+            fallback_on=lambda e: isinstance(e, ApiError) and e.is_unavailable,
+            # Изменившиеся данные каталога обновляют названия и делают клавиатуры устаревшими
+            on_store=_on_catalog_store
+        )
+    
+    async def start(self):
+        """Create the shared HTTP session (called on bot startup)"""
+        async with self._session_lock:
+            if self.session is None or self.session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    limit_per_host=self.pool_size,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=300
+                )
+                self.session = aiohttp.ClientSession(timeout=self.timeout, connector=connector)
+        return self.session
+    
+    async def close(self):
+        """Close the shared HTTP session (called on bot shutdown)"""
+        async with self._session_lock:
+            if self.session is not None and not self.session.closed:
+                await self.session.close()
+            self.session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it on first use"""
+        session = self.session
+        if session is None or session.closed:
+            session = await self.start()
+        return session
     
     async def __aenter__(self):
         """Async context manager entry"""
-        self.session = aiohttp.ClientSession(timeout=self.timeout)
+        await self._get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Async context manager exit"""
-        if self.session:
-            await self.session.close()
+        """Async context manager exit.
+        
+        The session is shared between concurrent handlers and is closed
+        only by close() on shutdown.
+        """
+        return False
     
     def _get_headers(self, headers: Optional[Dict] = None) -> Dict:
         """Get default headers with optional overrides"""
@@ -62,42 +180,112 @@ class BeautySalonApiClient:
             
         return default_headers
     
+    @staticmethod
+    def _metric_name(method: str, endpoint: str) -> str:
+        """Endpoint name for metrics: without query string and with IDs collapsed"""
+        path = re.sub(r"/\d+", "/{id}", endpoint.split("?", 1)[0])
+        return f"{method.upper()} {path}"
+    
     async def _make_request(
         self,
         method: str,
         endpoint: str,
         params: Optional[Dict] = None,
         json_data: Optional[Union[Dict, List]] = None,
-        headers: Optional[Dict] = None
+        headers: Optional[Dict] = None,
+        deadline: Optional[float] = None
     ) -> Any:
         """Make an HTTP request to the API
         
+        GET requests are retried with jittered backoff on timeouts, network
+        errors and 5xx responses as long as the deadline allows; other methods
+        are sent once with the longer write deadline. Only timeouts and
+        connection failures count towards opening the circuit breaker; while
+        it is open, requests fail immediately.
+        
         Args:
             method: HTTP method (GET, POST, PUT, DELETE)
             endpoint: API endpoint (e.g., '/api/sections')
             params: Query parameters
             json_data: JSON data for POST/PUT requests
             headers: Additional headers
+            deadline: Time budget of the call including retries, seconds
+                (defaults to deadline for GET and write_deadline otherwise)
             
         Returns:
             Parsed JSON response
             
         Raises:
-            ApiError: If the API returns an error status code
+            ApiError: If the API returns an error status code (504 on timeout,
+                503 if the API is unreachable or the circuit is open)
         """
-        if not self.session:
-            raise RuntimeError("Session not initialized. Use 'async with' context manager.")
+        session = await self._get_session()
             
         url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
         headers = self._get_headers(headers)
+        metric_name = self._metric_name(method, endpoint)
+        idempotent = method.upper() == "GET"
+        retries = self.max_retries if idempotent else 0
+        loop = asyncio.get_running_loop()
+        expires_at = loop.time() + (deadline or (self.deadline if idempotent else self.write_deadline))
+        attempt = 0
+        
+        while True:
+            if not self.breaker.allow_request():
+                raise ApiError(
+                    503,
+                    "API is temporarily unavailable",
+                    {"retry_after": round(self.breaker.retry_after(), 1)}
+                )
+            
+            remaining = expires_at - loop.time()
+            started = time.monotonic()
+            try:
+                result = await self._send(session, method, url, params, json_data, headers, remaining)
+            except ApiError as e:
+                self.latency.observe(metric_name, time.monotonic() - started)
+                if isinstance(e, ApiTransportError):
+                    self.breaker.record_failure()
+                else:
+                    # API ответил (в том числе 5xx), значит он доступен
+                    self.breaker.record_success()
+                if not e.is_unavailable:
+                    raise
+                
+                delay = backoff_delay(attempt)
+                if attempt >= retries or loop.time() + delay >= expires_at:
+                    raise
+                attempt += 1
+                logger.warning("Retrying %s (attempt %s) after error: %s", metric_name, attempt, e)
+                await asyncio.sleep(delay)
+                continue
+            
+            self.latency.observe(metric_name, time.monotonic() - started)
+            self.breaker.record_success()
+            return result
+    
+    async def _send(
+        self,
+        session: aiohttp.ClientSession,
+        method: str,
+        url: str,
+        params: Optional[Dict],
+        json_data: Optional[Union[Dict, List]],
+        headers: Dict,
+        timeout: float
+    ) -> Any:
+        """Send one HTTP request and parse the response"""
+        if timeout <= 0:
+            raise ApiTransportError(504, "API request deadline exceeded")
         
         try:
-            async with self.session.request(
+            async with session.request(
                 method=method,
                 url=url,
                 params=params,
                 json=json_data,
-                headers=headers
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=min(timeout, self.timeout.total))
             ) as response:
                 response_data = await response.text()
                 
@@ -121,16 +309,33 @@ class BeautySalonApiClient:
                 
                 return response_json
                 
+        except asyncio.TimeoutError:
+            logger.error("API request timed out: %s %s", method, url)
+            raise ApiTransportError(504, "API request timed out")
+        except aiohttp.ClientConnectionError as e:
+            logger.error("API connection failed: %s %s - %s", method, url, e)
+            raise ApiTransportError(503, f"API is unreachable: {str(e)}")
         except aiohttp.ClientError as e:
             logger.exception("API request failed")
-            raise ApiError(500, f"Network error: {str(e)}")
+            raise ApiError(502, f"Network error: {str(e)}")
+    
+    def latency_stats(self) -> Dict[str, Dict]:
+        """Get latency histograms per endpoint"""
+        return self.latency.snapshot()
+    
+    def cache_stats(self) -> Dict[str, Dict]:
+        """Get cache hit/miss counters per endpoint"""
+        return self.cache.stats()
     
     # API Endpoint Methods
     
     # Sections
     async def get_sections(self, lang: str = "ru") -> List[Dict]:
         """Get all sections"""
-        return await self._make_request("GET", f"/api/v2/sections?lang={lang}")
+        return await self.cache.get_or_fetch(
+            "sections", lang,
+            lambda: self._make_request("GET", f"/api/v2/sections?lang={lang}")
+        )
     
     async def get_section(self, section_id: int, lang: str = "ru") -> Dict:
         """Get a section by ID"""
@@ -142,7 +347,10 @@ class BeautySalonApiClient:
         endpoint = f"/api/v2/procedures?lang={lang}"
         if section_id is not None:
             endpoint += f"&section_id={section_id}"
-        return await self._make_request("GET", endpoint)
+        return await self.cache.get_or_fetch(
+            "procedures", (section_id, lang),
+            lambda: self._make_request("GET", endpoint)
+        )
     
     async def get_procedure(self, procedure_id: int, lang: str = "ru") -> Dict:
         """Get a procedure by ID"""
@@ -187,13 +395,16 @@ class BeautySalonApiClient:
     # Masters
     async def get_masters(self, lang: str = "ru") -> List[Dict]:
         """Get all masters"""
-        return await self._make_request("GET", f"/api/v2/masters?lang={lang}")
+        return await self.cache.get_or_fetch(
+            "masters", lang,
+            lambda: self._make_request("GET", f"/api/v2/masters?lang={lang}")
+        )
     
     async def get_masters_for_procedures(self, procedure_ids: List[int], lang: str = "ru") -> List[Dict]:
         """Get masters who can perform the specified procedures"""
         try:
             # Сначала получаем всех мастеров
-            response = await self._make_request("GET", f"/api/v2/masters?lang={lang}")
+            response = await self.get_masters(lang=lang)
             
             # Проверяем формат данных
             if isinstance(response, dict) and 'data' in response:
@@ -221,7 +432,10 @@ class BeautySalonApiClient:
     
     async def get_master(self, master_id: int, lang: str = "ru") -> Dict:
         """Get a master by ID"""
-        return await self._make_request("GET", f"/api/v2/masters/{master_id}?lang={lang}")
+        return await self.cache.get_or_fetch(
+            "master", (master_id, lang),
+            lambda: self._make_request("GET", f"/api/v2/masters/{master_id}?lang={lang}")
+        )
     
     # Work Slots
     async def get_available_slots(
@@ -0,0 +1,83 @@
+"""
+Per-tap render cost of the client keyboards, uncached vs memoized.
+
+Simulates a client toggling procedures one by one in a section with
+``--procedures`` items (every tap renders the keyboard with the new
+selection) and paging through days.
+
+Usage:
+    python -m src.bot.bench_keyboards --procedures 500 --taps 200
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from src.bot import keyboards
+
+
+def _catalog(size: int) -> List[Dict[str, Any]]:
+    return [
+        {"id": procedure_id, "name_UKR": f"Процедура {procedure_id}", "base_price": 100 + procedure_id}
+        for procedure_id in range(1, size + 1)
+    ]
+
+
+def _taps(size: int, taps: int, max_selected: int) -> List[List[int]]:
+    """Selection state after every tap"""
+    rng = random.Random(42)
+    selected: List[int] = []
+    states = []
+    for _ in range(taps):
+        procedure_id = rng.randint(1, min(size, max_selected * 3))
+        if procedure_id in selected:
+            selected.remove(procedure_id)
+        elif len(selected) < max_selected:
+            selected.append(procedure_id)
+        states.append(list(selected))
+    return states
+
+
+def _measure(render: Callable[[List[int]], Any], states: List[List[int]]) -> float:
+    """Average microseconds per render"""
+    started_at = time.perf_counter()
+    for selected in states:
+        render(selected)
+    return (time.perf_counter() - started_at) / len(states) * 1e6
+
+
+def main(args: argparse.Namespace) -> None:
+    catalog = _catalog(args.procedures)
+    states = _taps(args.procedures, args.taps, args.max_selected)
+    lang = "UKR"
+
+    before = _measure(lambda selected: keyboards._build_procedure_keyboard(catalog, selected, lang), states)
+    keyboards.keyboard_cache.bump()
+    after = _measure(lambda selected: keyboards.procedure_keyboard(catalog, selected, lang), states)
+    print(f"procedure_keyboard, {args.procedures} procedures, {args.taps} taps")
+    print(f"  uncached: {before:10.1f} us/tap")
+    print(f"  memoized: {after:10.1f} us/tap  ({before / after:.1f}x)")
+
+    # Эквивалентность: кэшированная клавиатура совпадает с построенной заново
+    for selected in states[-10:]:
+        assert keyboards.procedure_keyboard(catalog, selected, lang) == \
+            keyboards._build_procedure_keyboard(catalog, selected, lang)
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = [today + timedelta(days=offset) for offset in range(30)]
+    pages = [(page % 6) for page in range(args.taps)]
+    before = _measure(lambda page: keyboards._build_day_selection_keyboard(days[page * 5:page * 5 + 5], page, lang, page < 5), pages)
+    after = _measure(lambda page: keyboards.day_selection_keyboard(days[page * 5:page * 5 + 5], page, lang, page < 5), pages)
+    print("day_selection_keyboard, 30 days")
+    print(f"  uncached: {before:10.1f} us/tap")
+    print(f"  memoized: {after:10.1f} us/tap  ({before / after:.1f}x)")
+    print(f"cache: {keyboards.keyboard_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark keyboard rendering")
+    parser.add_argument("--procedures", type=int, default=500)
+    parser.add_argument("--taps", type=int, default=200)
+    parser.add_argument("--max-selected", type=int, default=5)
+    main(parser.parse_args())
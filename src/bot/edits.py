@@ -0,0 +1,149 @@
+"""
+Message edit layer for inline keyboards.
+
+Compares a fingerprint of the new text and markup with what the message
+shows right now - the callback's message, or the edit still pending for it -
+and drops edits that would not change anything (Telegram answers them with
+"message is not modified"). The state is always taken from the message
+itself, so edits made directly with ``message.edit_text`` elsewhere never
+make the comparison stale. Edits made with ``debounce=True``
+are held for EDIT_DEBOUNCE seconds; further edits of the same message in
+that window replace the pending one, so a burst of taps on a multi-select
+keyboard ends in a single edit with the final state.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+logger = logging.getLogger(__name__)
+
+EDIT_DEBOUNCE = float(os.getenv("EDIT_DEBOUNCE", "0.4"))
+
+MessageKey = Tuple[int, int]
+
+
+def fingerprint(text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> str:
+    """Hash of what the message shows"""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+    if reply_markup is not None:
+        digest.update(reply_markup.model_dump_json(exclude_none=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass
+class PendingEdit:
+    message: Message
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup]
+    kwargs: Dict[str, Any]
+    fingerprint: str
+    task: Optional[asyncio.Task] = None
+
+
+class MessageEditor:
+    """Skips no-op edits and coalesces bursts of edits per message"""
+
+    def __init__(self, debounce: float = EDIT_DEBOUNCE):
+        self.debounce = debounce
+        self._pending: Dict[MessageKey, PendingEdit] = {}
+        self.sent = 0
+        self.skipped = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _key(message: Message) -> MessageKey:
+        return message.chat.id, message.message_id
+
+    @staticmethod
+    def _current(message: Message) -> str:
+        """Fingerprint of what the message shows"""
+        # Сообщение из callback содержит текущий текст и клавиатуру
+        return fingerprint(message.html_text or "", message.reply_markup)
+
+    async def edit(
+        self,
+        message: Message,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        debounce: bool = False,
+        **kwargs: Any
+    ) -> bool:
+        """Edit message text and keyboard unless nothing changes.
+
+        Args:
+            message: Message to edit
+            text: New text
+            reply_markup: New inline keyboard
+            debounce: Hold the edit for a short window and send only the latest one
+            **kwargs: Other ``edit_text`` arguments
+
+        Returns:
+            False if the edit was dropped as a no-op
+        """
+        key = self._key(message)
+        new_fingerprint = fingerprint(text, reply_markup)
+        pending = self._pending.get(key)
+
+        if pending is not None:
+            if pending.fingerprint == new_fingerprint:
+                self.skipped += 1
+                return False
+            # Новое изменение заменяет отложенное
+            self.coalesced += 1
+            pending.task.cancel()
+            del self._pending[key]
+        if self._current(message) == new_fingerprint:
+            # В том числе повторное нажатие, вернувшее исходное состояние
+            self.skipped += 1
+            return False
+
+        edit = PendingEdit(message, text, reply_markup, kwargs, new_fingerprint)
+        if not debounce:
+            await self._send(edit)
+            return True
+
+        edit.task = asyncio.create_task(self._flush_later(key, edit))
+        self._pending[key] = edit
+        return True
+
+    async def _flush_later(self, key: MessageKey, edit: PendingEdit) -> None:
+        await asyncio.sleep(self.debounce)
+        if self._pending.get(key) is edit:
+            del self._pending[key]
+        try:
+            await self._send(edit)
+        except Exception as e:
+            logger.error(f"Error in delayed message edit: {e}")
+
+    async def _send(self, edit: PendingEdit) -> None:
+        try:
+            await edit.message.edit_text(edit.text, reply_markup=edit.reply_markup, **edit.kwargs)
+            self.sent += 1
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+            self.skipped += 1
+
+    def forget(self, message: Message) -> None:
+        """Drop state of a message (e.g. after it was deleted)"""
+        pending = self._pending.pop(self._key(message), None)
+        if pending is not None and pending.task is not None:
+            pending.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "coalesced": self.coalesced,
+            "pending": len(self._pending),
+        }
+
+
+message_editor = MessageEditor()
+edit_message = message_editor.edit
@@ -0,0 +1,157 @@
+"""
+Load generator for the webhook mode.
+
+Posts synthetic Telegram updates to the webhook endpoint and, optionally,
+serves a fake Bot API so that workers can answer without reaching Telegram.
+
+Usage:
+    # fake Bot API on :8081, bot started with TELEGRAM_API_URL=http://localhost:8081
+    python -m src.bot.fake_updates --serve-api 8081 --updates 0
+
+    # 5000 updates from 200 chats, 50 requests in flight
+    python -m src.bot.fake_updates --webhook-url http://localhost:8080/webhook \\
+        --chats 200 --updates 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import ClientSession, web
+
+_BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+_message_ids = itertools.count(1)
+
+
+def _user(chat_id: int) -> Dict[str, Any]:
+    return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "language_code": "uk"}
+
+
+def _message(chat_id: int, text: str, from_user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": from_user or _user(chat_id),
+        "text": text,
+    }
+
+
+def make_command_update(update_id: int, chat_id: int, command: str = "/start") -> Dict[str, Any]:
+    """Create a text message update with a bot command"""
+    message = _message(chat_id, command)
+    message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_callback_update(update_id: int, chat_id: int, data: str) -> Dict[str, Any]:
+    """Create a callback query update for an inline button press"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": _message(chat_id, "...", from_user=_BOT_USER),
+        },
+    }
+
+
+def generate_updates(chats: int, total: int, first_chat_id: int = 100000):
+    """Yield a realistic mix of updates: /start followed by button presses"""
+    chat_ids = [first_chat_id + i for i in range(chats)]
+    started = set()
+    callbacks = ["lang:UKR", "lang:ENG", "section:1", "procedure:1", "procedure:2", "next"]
+
+    for update_id in range(1, total + 1):
+        chat_id = random.choice(chat_ids)
+        if chat_id not in started:
+            started.add(chat_id)
+            yield make_command_update(update_id, chat_id)
+        else:
+            yield make_callback_update(update_id, chat_id, random.choice(callbacks))
+
+
+def create_fake_api_app() -> web.Application:
+    """Create a minimal Bot API that accepts any method"""
+    calls: Counter = Counter()
+
+    async def handle_method(request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        calls[method] += 1
+        params = await request.post()
+
+        if method == "getme":
+            result: Any = _BOT_USER
+        elif method in ("sendmessage", "editmessagetext", "editmessagereplymarkup"):
+            chat_id = int(params.get("chat_id") or 0)
+            result = _message(chat_id, params.get("text", ""), from_user=_BOT_USER)
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(calls))
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle_method)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+async def send_updates(webhook_url: str, chats: int, total: int, concurrency: int, secret: Optional[str] = None) -> None:
+    """Post generated updates to the webhook and print throughput"""
+    statuses: Counter = Counter()
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with ClientSession(headers=headers) as session:
+        async def post(update: Dict[str, Any]) -> None:
+            async with semaphore:
+                try:
+                    async with session.post(webhook_url, json=update) as response:
+                        statuses[response.status] += 1
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in generate_updates(chats, total)))
+        elapsed = time.perf_counter() - started
+
+    print(f"Sent {total} updates from {chats} chats in {elapsed:.2f}s ({total / elapsed:.0f} updates/s)")
+    for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+        print(f"  {status}: {count}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    runner = None
+    if args.serve_api:
+        runner = web.AppRunner(create_fake_api_app())
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", args.serve_api).start()
+        print(f"Fake Bot API listening on port {args.serve_api}")
+
+    try:
+        if args.updates:
+            await send_updates(args.webhook_url, args.chats, args.updates, args.concurrency, args.secret)
+        if runner and not args.updates:
+            await asyncio.Event().wait()
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send fake Telegram updates to the bot webhook")
+    parser.add_argument("--webhook-url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", default=None, help="Value of WEBHOOK_SECRET")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--serve-api", type=int, default=0, help="Port for the fake Bot API (0 - disabled)")
+    asyncio.run(main(parser.parse_args()))
@@ -532,7 +532,7 @@ async def appointment_management(callback: CallbackQuery, state: FSMContext, ses
     await state.update_data(appointment_id=appointment_id)
     
     # Get appointment details
-    appointment = await session.get(Appointment, appointment_id)
+    appointment = await crud.get_appointment_model(session, appointment_id)
     client = await session.get(Client, appointment.client_id)
     master = await session.get(Master, appointment.master_id)
     
@@ -12,6 +12,7 @@ from typing import List, Dict, Any, Optional
 
 # Local imports
 from src.bot.api_client import api_client, ApiError
+from src.bot.edits import edit_message
 
 # Настройка логгера
 logger = logging.getLogger(__name__)
@@ -25,8 +26,9 @@ from src.bot.keyboards import (
     cancel_confirmation_keyboard
 )
 from src.database import crud
-from src.database.models import Procedure
-from src.utils.translations import get_text, format_appointment_details
+from src.database.models import Appointment, Procedure
+from src.utils.translations import get_text, format_appointment_details, details_cache
+from src.utils.phone import normalize_phone
 
 
 # Start command handler
@@ -235,6 +237,11 @@ async def registration_phone(message: Message, state: FSMContext, session: Async
         lang = data.get("lang", "ru")
         name = data.get("name", "")
         
+        # Телефон сравнивается в формате E.164, поэтому сначала проверяем, что он распознаётся
+        if normalize_phone(message.text) is None:
+            await message.answer(get_text("invalid_phone", lang))
+            return
+        
         # Create client
         client_data = {
             "telegram_id": str(message.from_user.id),  # Преобразуем telegram_id в строку
@@ -245,16 +252,13 @@ async def registration_phone(message: Message, state: FSMContext, session: Async
             "is_first_visit": True
         }
         
-        # Create client in the database
-        try:
-            client = await crud.create_client(session, client_data)
-            # Важно: выполняем коммит транзакции, чтобы сохранить данные в БД
-            await session.commit()
-            logger.info(f"Successfully created client with telegram_id: {message.from_user.id}")
-        except Exception as e:
-            logger.error(f"Error creating client in database: {str(e)}")
-            await session.rollback()
-            raise
+        # Регистрация одним запросом: новый клиент или привязка к клиенту с этим телефоном.
+        # None - телефон занят; ошибка базы данных уходит в общий обработчик ниже
+        client = await crud.register_client(session, client_data)
+        if client is None:
+            await message.answer(get_text("phone_already_registered", lang))
+            return
+        logger.info(f"Successfully registered client with telegram_id: {message.from_user.id}")
         
         # Show registration completed message
         await message.answer(
@@ -413,7 +417,8 @@ async def procedure_selection(callback: CallbackQuery, state: FSMContext, sessio
                 
                 # Show section selection
                 if hasattr(callback, 'message') and callback.message:
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("select_section", lang),
                         reply_markup=section_keyboard(sections, lang)
                     )
@@ -431,7 +436,8 @@ async def procedure_selection(callback: CallbackQuery, state: FSMContext, sessio
                 
             # Переходим к выбору мастера или времени
             if hasattr(callback, 'message') and callback.message:
-                await callback.message.edit_text(
+                await edit_message(
+                    callback.message,
                     get_text("select_master_or_time", lang),
                     reply_markup=master_or_time_keyboard(lang)
                 )
@@ -478,9 +484,11 @@ async def procedure_selection(callback: CallbackQuery, state: FSMContext, sessio
                 section = await client_api.get_section(section_id, lang=lang)
                 section_name = section.get(f"name_{lang}", section.get("name_ru", f"Section {section_id}"))
                 
-                await callback.message.edit_text(
+                await edit_message(
+                    callback.message,
                     get_text("select_procedure", lang).format(section_name=section_name),
-                    reply_markup=procedure_keyboard(procedures, selected_procedures, lang)
+                    reply_markup=procedure_keyboard(procedures, selected_procedures, lang),
+                    debounce=True
                 )
     
     except (ValueError, ApiError) as e:
@@ -493,7 +501,8 @@ async def procedure_selection(callback: CallbackQuery, state: FSMContext, sessio
             async with api_client as client_api:
                 sections = await client_api.get_sections(lang=lang or 'ru')
                 if hasattr(callback, 'message') and callback.message:
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("select_section", lang or 'ru'),
                         reply_markup=section_keyboard(sections, lang or 'ru')
                     )
@@ -841,7 +850,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
         if callback.data == "back:master":
             # Show master or time selection
             try:
-                await callback.message.edit_text(
+                await edit_message(
+                    callback.message,
                     get_text("select_master_or_time", lang),
                     reply_markup=master_or_time_keyboard(lang)
                 )
@@ -870,7 +880,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
             
             # Show next page of days
             try:
-                await callback.message.edit_text(
+                await edit_message(
+                    callback.message,
                     get_text("select_day", lang),
                     reply_markup=day_selection_keyboard(days_to_show, next_page, lang, has_more)
                 )
@@ -953,7 +964,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                 if slots:
                     # Show time selection
                     try:
-                        await callback.message.edit_text(
+                        await edit_message(
+                            callback.message,
                             get_text("select_time", lang),
                             reply_markup=time_selection_keyboard(slots, 0, 5, lang)
                         )
@@ -971,7 +983,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                 else:
                     # If no slots available, show message
                     try:
-                        await callback.message.edit_text(
+                        await edit_message(
+                            callback.message,
                             get_text("no_slots_available", lang),
                             reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                         )
@@ -983,7 +996,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
             else:
                 # If no masters available, show message
                 try:
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("no_masters_available", lang),
                         reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                     )
@@ -1037,7 +1051,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                 if slots:
                     # Show time selection
                     try:
-                        await callback.message.edit_text(
+                        await edit_message(
+                            callback.message,
                             get_text("select_time", lang),
                             reply_markup=time_selection_keyboard(slots, 0, 5, lang)
                         )
@@ -1055,7 +1070,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                 else:
                     # If no slots available, show message
                     try:
-                        await callback.message.edit_text(
+                        await edit_message(
+                            callback.message,
                             get_text("no_slots_available", lang),
                             reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                         )
@@ -1067,7 +1083,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
             else:
                 # If no selected master, show error message
                 try:
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("error_occurred", lang),
                         reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                     )
@@ -1128,25 +1145,13 @@ async def time_selection(callback: CallbackQuery, state: FSMContext, session: As
         # Save selected time to state
         await state.update_data(selected_time=selected_time)
         
-        # Get procedures details
-        procedures = []
-        total_price = 0
-        
-        for procedure_id in selected_procedures:
-            # Получаем информацию о процедуре из базы данных
-            procedure_data = await crud.get_procedure_by_id(session, procedure_id)
-            if procedure_data:
-                # Используем данные из функции get_procedure_by_id
-                procedures.append({
-                    "id": procedure_data["id"],
-                    "name": procedure_data["name"],
-                    "base_price": procedure_data["base_price"],
-                    "discount": procedure_data["discount"]
-                })
-                total_price += procedure_data["base_price"] * (1 - procedure_data["discount"] / 100)
-        
-        # Get master details
-        master_data = await crud.get_master_by_id(session, master_id)
+        # Процедуры и мастер одним запросом
+        procedures, master_data = await crud.get_appointment_render_data(
+            session, selected_procedures, master_id, lang
+        )
+        total_price = sum(
+            procedure["base_price"] * (1 - procedure["discount"] / 100) for procedure in procedures
+        )
         
         # Format appointment details
         details = format_appointment_details(
@@ -1329,6 +1334,24 @@ async def cmd_my_appointments(message: Message, state: FSMContext, session: Asyn
     await state.set_state(ClientStates.my_appointments)
 
 
+async def appointment_details_text(session: AsyncSession, appointment: Appointment, lang: str) -> str:
+    """Rendered details of a saved appointment, cached by (id, updated_at)"""
+    details = details_cache.get(appointment.id, appointment.updated_at, lang)
+    if details is not None:
+        return details
+    
+    procedures, master = await crud.get_appointment_render_data(
+        session, appointment.procedures or [], appointment.master_id, lang
+    )
+    details = format_appointment_details(
+        {"start_time": appointment.start_time},
+        procedures,
+        {"name": master["name"] if master else ""},
+        lang
+    )
+    return details_cache.set(appointment.id, appointment.updated_at, lang, details)
+
+
 # Appointment details handler
 async def appointment_details(callback: CallbackQuery, state: FSMContext, session: AsyncSession, client: Optional[Any] = None):
     """Handle appointment details"""
@@ -1339,36 +1362,14 @@ async def appointment_details(callback: CallbackQuery, state: FSMContext, sessio
     appointment_id = int(callback.data.split(":")[1])
     
     # Get appointment details
-    appointment = await session.get(Appointment, appointment_id)
+    appointment = await crud.get_appointment_model(session, appointment_id)
     
     if not appointment or appointment.client_id != client.id:
         await callback.answer(get_text("error_occurred", lang), show_alert=True)
         return
     
-    # Get procedures details
-    procedures = []
-    
-    for procedure_id in appointment.procedures:
-        # In a real app, you'd get this from the database
-        # This is a simplified version
-        procedure = await session.get(Procedure, procedure_id)
-        procedures.append({
-            "id": procedure.id,
-            "name": procedure.name,
-            "base_price": procedure.base_price,
-            "discount": procedure.discount
-        })
-    
-    # Get master details
-    master = await session.get(Master, appointment.master_id)
-    
     # Format appointment details
-    details = format_appointment_details(
-        {"start_time": appointment.start_time},
-        procedures,
-        {"name": master.name},
-        lang
-    )
+    details = await appointment_details_text(session, appointment, lang)
     
     # Show appointment details
     await callback.message.edit_text(
@@ -1412,36 +1413,14 @@ async def cancel_appointment_confirmation(callback: CallbackQuery, state: FSMCon
     
     if confirmation == "no":
         # Get appointment details
-        appointment = await session.get(Appointment, appointment_id)
+        appointment = await crud.get_appointment_model(session, appointment_id)
         
         if not appointment or appointment.client_id != client.id:
             await callback.answer(get_text("error_occurred", lang), show_alert=True)
             return
         
-        # Get procedures details
-        procedures = []
-        
-        for procedure_id in appointment.procedures:
-            # In a real app, you'd get this from the database
-            # This is a simplified version
-            procedure = await session.get(Procedure, procedure_id)
-            procedures.append({
-                "id": procedure.id,
-                "name": procedure.name,
-                "base_price": procedure.base_price,
-                "discount": procedure.discount
-            })
-        
-        # Get master details
-        master = await session.get(Master, appointment.master_id)
-        
         # Format appointment details
-        details = format_appointment_details(
-            {"start_time": appointment.start_time},
-            procedures,
-            {"name": master.name},
-            lang
-        )
+        details = await appointment_details_text(session, appointment, lang)
         
         # Show appointment details
         await callback.message.edit_text(
@@ -1579,7 +1558,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
         # Check if back button was pressed
         if callback.data == "back:master":
             # Show master or time selection
-            await callback.message.edit_text(
+            await edit_message(
+                callback.message,
                 get_text("select_master_or_time", lang),
                 reply_markup=master_or_time_keyboard(lang)
             )
@@ -1602,7 +1582,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
             has_more = end_idx < len(available_days)
             
             # Show next page of days
-            await callback.message.edit_text(
+            await edit_message(
+                callback.message,
                 get_text("select_day", lang),
                 reply_markup=day_selection_keyboard(days_to_show, next_page, lang, has_more)
             )
@@ -1679,7 +1660,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                 
                 if slots:
                     # Show time selection
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("select_time", lang),
                         reply_markup=time_selection_keyboard(slots, 0, 5, lang)
                     )
@@ -1691,13 +1673,15 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                     await state.set_state(ClientStates.time_selection)
                 else:
                     # If no slots available, show message
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("no_slots_available", lang),
                         reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                     )
             else:
                 # If no masters available, show message
-                await callback.message.edit_text(
+                await edit_message(
+                    callback.message,
                     get_text("no_masters_available", lang),
                     reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                 )
@@ -1745,7 +1729,8 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                 
                 if slots:
                     # Show time selection
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("select_time", lang),
                         reply_markup=time_selection_keyboard(slots, 0, 5, lang)
                     )
@@ -1757,13 +1742,15 @@ async def day_selection(callback: CallbackQuery, state: FSMContext, session: Asy
                     await state.set_state(ClientStates.time_selection)
                 else:
                     # If no slots available, show message
-                    await callback.message.edit_text(
+                    await edit_message(
+                        callback.message,
                         get_text("no_slots_available", lang),
                         reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                     )
             else:
                 # If no selected master, show error message
-                await callback.message.edit_text(
+                await edit_message(
+                    callback.message,
                     get_text("error_occurred", lang),
                     reply_markup=day_selection_keyboard(available_days[:5], 0, lang, len(available_days) > 5)
                 )
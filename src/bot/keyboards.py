@@ -1,7 +1,59 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
-from aiogram.types import InlineKeyboardButton, KeyboardButton
-from typing import List, Dict, Any
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton
+from collections import OrderedDict
+from typing import List, Dict, Any, Hashable, Optional, Tuple
 from datetime import datetime, timedelta
+import os
+
+from src.utils.translations import get_name
+
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", "2048"))
+
+
+class KeyboardCache:
+    """LRU cache of rendered keyboards.
+    
+    Keys include the catalog version, which is bumped whenever the API client
+    receives changed sections, procedures or masters, and the identity of the
+    source list:
+    catalog lists come from the API cache and are never mutated, so the same
+    object always renders to the same keyboard. The cache keeps a reference
+    to the source, so its id cannot be reused while the entry is alive.
+    """
+    
+    def __init__(self, max_entries: int = KEYBOARD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Any]]" = OrderedDict()
+    
+    def get(self, key: Hashable, source: Any = None) -> Optional[Any]:
+        entry = self._entries.get((self.version, key))
+        if entry is None or entry[0] is not source:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end((self.version, key))
+        return entry[1]
+    
+    def set(self, key: Hashable, value: Any, source: Any = None) -> Any:
+        self._entries[(self.version, key)] = (source, value)
+        self._entries.move_to_end((self.version, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+    
+    def bump(self) -> None:
+        """Catalog changed: forget all catalog keyboards"""
+        self.version += 1
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        return {"version": self.version, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+keyboard_cache = KeyboardCache()
 
 
 def language_keyboard():
@@ -17,7 +69,7 @@ def language_keyboard():
     return builder.as_markup()
 
 
-def section_keyboard(sections_data, lang):
+def _build_section_keyboard(sections_data, lang):
     """Create keyboard for section selection"""
     builder = InlineKeyboardBuilder()
     
@@ -48,8 +100,11 @@ def section_keyboard(sections_data, lang):
         # Получаем имя секции в зависимости от формата данных
         if isinstance(section, dict):
             # Если есть поле name_{lang}, используем его
-            section_name = section.get(f"name_{lang}") or section.get("name") or section.get("name_ru", f"Раздел {section.get('id', '?')}")
             section_id = section.get('id')
+            section_name = get_name(
+                "section", section_id, lang,
+                default=section.get(f"name_{lang}") or section.get("name") or section.get("name_ru", f"Раздел {section_id or '?'}")
+            )
         else:
             # Если section не словарь, пропускаем его
             continue
@@ -77,7 +132,7 @@ def section_keyboard(sections_data, lang):
     return builder.as_markup()
 
 
-def procedure_keyboard(procedures_data, selected_procedures: List[int], lang: str):
+def _build_procedure_keyboard(procedures_data, selected_procedures: List[int], lang: str):
     """Create keyboard for procedure selection with checkboxes"""
     builder = InlineKeyboardBuilder()
     
@@ -103,7 +158,10 @@ def procedure_keyboard(procedures_data, selected_procedures: List[int], lang: st
                 continue
                 
             # Получаем имя процедуры в зависимости от языка
-            procedure_name = procedure.get(f"name_{lang}") or procedure.get("name") or procedure.get("name_ru", f"Процедура {procedure_id}")
+            procedure_name = get_name(
+                "procedure", procedure_id, lang,
+                default=procedure.get(f"name_{lang}") or procedure.get("name") or procedure.get("name_ru", f"Процедура {procedure_id}")
+            )
             
             # Получаем цену процедуры
             base_price = procedure.get('base_price', 0)
@@ -175,7 +233,7 @@ def master_or_time_keyboard(lang: str):
     return builder.as_markup()
 
 
-def master_selection_keyboard(masters_data, lang: str):
+def _build_master_selection_keyboard(masters_data, lang: str):
     """Create keyboard for master selection"""
     builder = InlineKeyboardBuilder()
     
@@ -293,7 +351,7 @@ def time_selection_keyboard(slots: List[datetime], page: int, items_per_page: in
     builder.adjust(1)
     return builder.as_markup()
 
-def day_selection_keyboard(days: List[datetime], page: int, lang: str, has_more: bool = False):
+def _build_day_selection_keyboard(days: List[datetime], page: int, lang: str, has_more: bool = False):
     """Create keyboard for day selection"""
     builder = InlineKeyboardBuilder()
     
@@ -360,6 +418,101 @@ def day_selection_keyboard(days: List[datetime], page: int, lang: str, has_more:
     builder.adjust(1)
     return builder.as_markup()
 
+def section_keyboard(sections_data, lang):
+    """Create keyboard for section selection (memoized)"""
+    key = ("section", lang, id(sections_data))
+    markup = keyboard_cache.get(key, sections_data)
+    if markup is None:
+        markup = keyboard_cache.set(key, _build_section_keyboard(sections_data, lang), sections_data)
+    return markup
+
+
+def _procedure_rows(procedures_data, lang: str) -> Tuple[List[Tuple[Any, InlineKeyboardButton, InlineKeyboardButton]], List[List[InlineKeyboardButton]]]:
+    """Buttons of every procedure in both states plus the navigation rows"""
+    key = ("procedure_rows", lang, id(procedures_data))
+    rows = keyboard_cache.get(key, procedures_data)
+    if rows is not None:
+        return rows
+    
+    if isinstance(procedures_data, dict) and 'data' in procedures_data:
+        procedures = procedures_data['data']
+    else:
+        procedures = procedures_data
+    
+    procedure_rows = []
+    for procedure in procedures if isinstance(procedures, list) else []:
+        if not isinstance(procedure, dict) or procedure.get('id') is None:
+            continue
+        procedure_id = procedure['id']
+        procedure_name = get_name(
+            "procedure", procedure_id, lang,
+            default=procedure.get(f"name_{lang}") or procedure.get("name") or procedure.get("name_ru", f"Процедура {procedure_id}")
+        )
+        label = f"{procedure_name} ({procedure.get('base_price', 0)}₴)"
+        callback_data = f"procedure:{procedure_id}"
+        procedure_rows.append((
+            procedure_id,
+            InlineKeyboardButton(text=label, callback_data=callback_data),
+            InlineKeyboardButton(text=f"✅ {label}", callback_data=callback_data)
+        ))
+    
+    # Навигация такая же, как у клавиатуры без процедур
+    navigation = _build_procedure_keyboard([], [], lang).inline_keyboard
+    return keyboard_cache.set(key, (procedure_rows, navigation), procedures_data)
+
+
+def procedure_keyboard(procedures_data, selected_procedures: List[int], lang: str):
+    """Create keyboard for procedure selection with checkboxes.
+    
+    Rows are rendered once per catalog version and language; a tap only
+    picks the checked or plain button of every row.
+    """
+    selection = tuple(sorted(set(selected_procedures or [])))
+    key = ("procedure", lang, id(procedures_data), selection)
+    markup = keyboard_cache.get(key, procedures_data)
+    if markup is not None:
+        return markup
+    
+    procedure_rows, navigation = _procedure_rows(procedures_data, lang)
+    selected = set(selection)
+    inline_keyboard = [
+        [checked if procedure_id in selected else plain]
+        for procedure_id, plain, checked in procedure_rows
+    ]
+    inline_keyboard.extend(navigation)
+    # Кнопки уже провалидированы, повторная проверка pydantic не нужна
+    markup = InlineKeyboardMarkup.model_construct(inline_keyboard=inline_keyboard)
+    return keyboard_cache.set(key, markup, procedures_data)
+
+
+def master_selection_keyboard(masters_data, lang: str):
+    """Create keyboard for master selection (memoized).
+    
+    The list is filtered by the selected procedures and is a new object on
+    every call, so the key is built from the buttons' content.
+    """
+    masters = masters_data['data'] if isinstance(masters_data, dict) and 'data' in masters_data else masters_data
+    content = tuple(
+        (master.get('id'), master.get(f"name_{lang}") or master.get("name") or master.get("name_ru"))
+        for master in (masters if isinstance(masters, list) else [])
+        if isinstance(master, dict)
+    )
+    key = ("master", lang, content)
+    markup = keyboard_cache.get(key)
+    if markup is None:
+        markup = keyboard_cache.set(key, _build_master_selection_keyboard(masters_data, lang))
+    return markup
+
+
+def day_selection_keyboard(days: List[datetime], page: int, lang: str, has_more: bool = False):
+    """Create keyboard for day selection (memoized by its arguments)"""
+    key = ("day", lang, tuple(days), page, has_more)
+    markup = keyboard_cache.get(key)
+    if markup is None:
+        markup = keyboard_cache.set(key, _build_day_selection_keyboard(days, page, lang, has_more))
+    return markup
+
+
 def confirmation_keyboard(lang: str):
     """Create keyboard for appointment confirmation"""
     builder = InlineKeyboardBuilder()
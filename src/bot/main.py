@@ -2,17 +2,27 @@ import asyncio
 import logging
 import os
 from datetime import datetime, timedelta
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from dotenv import load_dotenv
 
+from src.bot.api_client import api_client
+from src.bot.edits import message_editor
 from src.bot.handlers import register_all_handlers
-from src.bot.middlewares import register_all_middlewares
-from src.database.base import engine, Base
+from src.bot.middlewares import register_all_middlewares, update_scheduler
+from src.bot.reminders import ReminderScheduler
+from src.bot.sender import message_sender
+from src.database import crud
+from src.database.base import AsyncSessionLocal, engine, Base
+from src.database.partitions import maintain_partitions
+from src.utils.translations import merge_catalog_names
 
 load_dotenv()
 
@@ -28,29 +38,98 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("No BOT_TOKEN provided in environment variables")
 
+# "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Custom Bot API server (e.g. local server or fake server for load tests)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
 
 async def create_tables():
     """Create database tables if they don't exist"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Секционированным таблицам нужны секции до первой вставки
+    async with AsyncSessionLocal() as db:
+        await maintain_partitions(db)
 
 
-async def main():
-    """Main function to start the bot"""
-    # Create tables
-    await create_tables()
-    
-    # Initialize bot and dispatcher
-    bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML)
+def create_bot() -> Bot:
+    """Create bot instance"""
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML, session=session)
+
+
+# Appointment reminders (sent by the first worker only in webhook mode)
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "true").lower() == "true"
+
+reminder_scheduler: Optional[ReminderScheduler] = None
+
+
+async def on_startup(bot: Bot, worker_index: int = 0):
+    """Open long-lived connections and start background jobs"""
+    global reminder_scheduler
+    await api_client.start()
+    message_sender.start(bot)
+    async with AsyncSessionLocal() as db:
+        merge_catalog_names(await crud.get_catalog_names(db))
+    if REMINDERS_ENABLED and worker_index == 0:
+        reminder_scheduler = ReminderScheduler()
+        reminder_scheduler.start()
+
+
+async def on_shutdown():
+    """Stop background jobs and close long-lived connections"""
+    global reminder_scheduler
+    if reminder_scheduler is not None:
+        await reminder_scheduler.stop()
+        reminder_scheduler = None
+    await message_sender.stop()
+    logger.info("Update scheduler: %s", update_scheduler.stats())
+    logger.info("Message edits: %s", message_editor.stats())
+    logger.info("API cache stats: %s", api_client.cache_stats())
+    logger.info("API latency: %s", api_client.latency_stats())
+    await api_client.close()
+
+
+def create_dispatcher() -> Dispatcher:
+    """Create dispatcher with registered middlewares and handlers"""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
+    # Startup/shutdown hooks
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    
     # Register middlewares
     register_all_middlewares(dp)
     
     # Register handlers
     register_all_handlers(dp)
     
+    return dp
+
+
+async def main():
+    """Main function to start the bot"""
+    # Create tables
+    await create_tables()
+    
+    # Initialize bot
+    bot = create_bot()
+    
+    if BOT_MODE == "webhook":
+        # Апдейты обрабатываются в воркер-процессах, здесь только приём
+        from src.bot.webhook import run_webhook
+        
+        logger.info("Starting bot in webhook mode...")
+        await run_webhook(bot)
+        return
+    
+    dp = create_dispatcher()
+    
     # Start polling
     logger.info("Starting bot...")
     await bot.delete_webhook(drop_pending_updates=True)
@@ -1,11 +1,140 @@
+import asyncio
+import logging
+import os
+import time
 from aiogram import Dispatcher, BaseMiddleware
-from aiogram.types import TelegramObject
-from typing import Any, Awaitable, Callable, Dict
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+from typing import Any, Awaitable, Callable, Dict, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.base import AsyncSessionLocal
+from src.bot.resilience import LatencyHistogram
+from src.database.base import AsyncSessionLocal, DB_POOL_SIZE, DB_MAX_OVERFLOW
 from src.database import crud
 
+logger = logging.getLogger(__name__)
+
+# Handlers running at the same time; by default every one can get a DB connection
+BOT_MAX_CONCURRENCY = int(os.getenv("BOT_MAX_CONCURRENCY", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+# Updates waiting per chat; beyond that new updates of the chat are dropped
+BOT_CHAT_QUEUE_LIMIT = int(os.getenv("BOT_CHAT_QUEUE_LIMIT", "10"))
+
+
+class _ChatQueue:
+    """Sequential queue of one chat"""
+    
+    __slots__ = ("lock", "depth")
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class SchedulingMiddleware(BaseMiddleware):
+    """Outer middleware that orders and bounds update processing.
+    
+    Updates of one chat are handled one after another (asyncio.Lock is FIFO),
+    so double taps on inline keyboards do not race on the same FSM state.
+    At most ``max_concurrency`` handlers run at once; the rest wait in memory
+    instead of timing out on the database pool.
+    """
+    
+    def __init__(self, max_concurrency: int = BOT_MAX_CONCURRENCY, chat_queue_limit: int = BOT_CHAT_QUEUE_LIMIT):
+        self.max_concurrency = max_concurrency
+        self.chat_queue_limit = chat_queue_limit
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._chats: Dict[int, _ChatQueue] = {}
+        self.waiting = 0
+        self.running = 0
+        self.max_waiting = 0
+        self.processed = 0
+        self.dropped = 0
+        self._latency = LatencyHistogram()
+    
+    @staticmethod
+    def _chat_key(data: Dict[str, Any]) -> Optional[int]:
+        chat = data.get("event_chat")
+        if chat is not None:
+            return chat.id
+        user = data.get("event_from_user")
+        return user.id if user is not None else None
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = self._chat_key(data)
+        if key is None:
+            return await self._run(handler, event, data, time.monotonic())
+        
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = _ChatQueue()
+        if queue.depth >= self.chat_queue_limit:
+            self.dropped += 1
+            logger.warning("Dropped update for chat %s: %s updates queued", key, queue.depth)
+            await self._answer_dropped(event, data)
+            return None
+        
+        queue.depth += 1
+        queued_at = time.monotonic()
+        try:
+            async with queue.lock:
+                return await self._run(handler, event, data, queued_at)
+        finally:
+            queue.depth -= 1
+            if queue.depth == 0:
+                self._chats.pop(key, None)
+    
+    @staticmethod
+    async def _answer_dropped(event: TelegramObject, data: Dict[str, Any]) -> None:
+        """Answer a dropped callback query, otherwise its button keeps spinning"""
+        callback = event.callback_query if isinstance(event, Update) else None
+        bot = data.get("bot")
+        if callback is None or bot is None:
+            return
+        try:
+            await bot.answer_callback_query(callback.id)
+        except TelegramAPIError as e:
+            logger.warning("Failed to answer dropped callback query: %s", e)
+    
+    async def _run(self, handler, event, data, queued_at: float) -> Any:
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self._latency.observe("queue_wait", time.monotonic() - queued_at)
+        
+        self.running += 1
+        started_at = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            self.running -= 1
+            self.processed += 1
+            self._slots.release()
+            self._latency.observe("handler", time.monotonic() - started_at)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and timing metrics"""
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "queued_chats": len(self._chats),
+            "queued_updates": sum(queue.depth for queue in self._chats.values()),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "latency": self._latency.snapshot(),
+        }
+
+
+update_scheduler = SchedulingMiddleware()
+
 
 class DatabaseMiddleware(BaseMiddleware):
     """Middleware for injecting database session into handler data"""
@@ -59,5 +188,7 @@ class UserMiddleware(BaseMiddleware):
 
 def register_all_middlewares(dp: Dispatcher):
     """Register all middlewares"""
+    # Outer: очередь и лимит применяются до открытия сессии БД
+    dp.update.outer_middleware(update_scheduler)
     dp.update.middleware(DatabaseMiddleware())
     dp.update.middleware(UserMiddleware())
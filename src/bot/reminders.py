@@ -0,0 +1,242 @@
+"""
+Appointment reminders.
+
+Upcoming active appointments are loaded in windows of REMINDER_WINDOW_HOURS
+(by start_time, through a partial index) and kept in a heap ordered by the
+time the reminder is due. Creating, moving or cancelling an appointment
+publishes its id with NOTIFY (see crud.notify_appointment_changed); the
+scheduler re-reads only those appointments instead of rescanning the table.
+Outdated heap entries are skipped lazily when they reach the top.
+
+Messages go through the rate-limited sender (src/bot/sender.py) in the
+reminder lane. Before sending, the reminder is claimed with a conditional UPDATE of
+appointment.reminder_sent_at, so a restart or a second scheduler never sends
+the same reminder twice. The marker is removed again if delivery fails with
+a temporary error.
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from src.bot.sender import PRIORITY_REMINDER, message_sender
+from src.database import crud
+from src.database.base import AsyncSessionLocal, engine
+from src.utils.translations import get_text
+
+logger = logging.getLogger(__name__)
+
+REMINDER_LEAD_HOURS = float(os.getenv("REMINDER_LEAD_HOURS", "24"))
+REMINDER_WINDOW_HOURS = float(os.getenv("REMINDER_WINDOW_HOURS", "6"))
+REMINDER_RETRY_DELAY = float(os.getenv("REMINDER_RETRY_DELAY", "60"))
+REMINDER_LISTEN_RETRY = float(os.getenv("REMINDER_LISTEN_RETRY", "10"))
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "10"))
+
+
+class ReminderScheduler:
+    """Sends one reminder per appointment REMINDER_LEAD_HOURS before it starts"""
+
+    def __init__(
+        self,
+        lead: timedelta = timedelta(hours=REMINDER_LEAD_HOURS),
+        window: timedelta = timedelta(hours=REMINDER_WINDOW_HOURS)
+    ):
+        self.lead = lead
+        self.window = window
+        # (send_at, appointment_id, start_time)
+        self._heap: List[Tuple[datetime, int, datetime]] = []
+        # appointment_id -> start_time of the valid heap entry
+        self._scheduled: Dict[int, datetime] = {}
+        # Appointments with start_time < _loaded_until are known to the heap
+        self._loaded_until: Optional[datetime] = None
+        # Выставляется слушателем после разрыва соединения; сбрасывает окно только _run
+        self._reload = False
+        self._changes: "asyncio.Queue[int]" = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._sending: Set[asyncio.Task] = set()
+        self._claims = asyncio.Semaphore(REMINDER_CONCURRENCY)
+        self.sent = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._listen()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._sending:
+            await asyncio.wait(self._sending, timeout=10)
+        logger.info("Reminder scheduler stopped (sent: %s, failed: %s)", self.sent, self.failed)
+
+    def _schedule(self, appointment_id: int, start_time: datetime) -> None:
+        if self._scheduled.get(appointment_id) == start_time:
+            return
+        self._scheduled[appointment_id] = start_time
+        heapq.heappush(self._heap, (start_time - self.lead, appointment_id, start_time))
+
+    def _unschedule(self, appointment_id: int) -> None:
+        # Запись в куче остаётся и будет пропущена, когда дойдёт до вершины
+        self._scheduled.pop(appointment_id, None)
+
+    async def _load_window(self, now: datetime) -> None:
+        """Extend the loaded range so it covers reminders due before the next window"""
+        horizon = now + self.lead + self.window
+        if self._loaded_until is None:
+            # Первая загрузка: начало уже прошедших, но не напомненных записей
+            self._loaded_until = now
+        while self._loaded_until < horizon:
+            end = self._loaded_until + self.window
+            async with AsyncSessionLocal() as db:
+                pending = await crud.get_pending_reminders(db, self._loaded_until, end)
+            for appointment_id, start_time in pending:
+                self._schedule(appointment_id, start_time)
+            logger.debug("Loaded %s reminders for %s - %s", len(pending), self._loaded_until, end)
+            self._loaded_until = end
+
+    async def _apply_changes(self) -> None:
+        """Re-read appointments announced by NOTIFY"""
+        changed: Set[int] = set()
+        while not self._changes.empty():
+            changed.add(self._changes.get_nowait())
+        if not changed:
+            return
+
+        async with AsyncSessionLocal() as db:
+            pending = await crud.get_reminder_times(db, list(changed))
+        now = datetime.now()
+        for appointment_id in changed:
+            start_time = pending.get(appointment_id)
+            if start_time is None or start_time <= now or start_time >= self._loaded_until:
+                # Отменена, уже напомнена, прошла или будет загружена со своим окном
+                self._unschedule(appointment_id)
+            else:
+                self._schedule(appointment_id, start_time)
+
+    def _next_due(self) -> Optional[datetime]:
+        while self._heap:
+            send_at, appointment_id, start_time = self._heap[0]
+            if self._scheduled.get(appointment_id) == start_time:
+                return send_at
+            heapq.heappop(self._heap)
+        return None
+
+    async def _run(self) -> None:
+        logger.info("Reminder scheduler started (lead: %s, window: %s)", self.lead, self.window)
+        while True:
+            try:
+                if self._reload:
+                    self._reload = False
+                    self._heap.clear()
+                    self._scheduled.clear()
+                    self._loaded_until = None
+                now = datetime.now()
+                await self._load_window(now)
+                await self._apply_changes()
+
+                send_at = self._next_due()
+                if send_at is not None and send_at <= now:
+                    _, appointment_id, start_time = heapq.heappop(self._heap)
+                    self._scheduled.pop(appointment_id, None)
+                    if start_time > now:
+                        self._spawn_send(appointment_id, start_time)
+                    continue
+
+                # Спим до ближайшего напоминания, следующего окна или уведомления
+                wake_at = self._loaded_until - self.lead - self.window / 2
+                if send_at is not None:
+                    wake_at = min(wake_at, send_at)
+                timeout = max((wake_at - now).total_seconds(), 0.1)
+                self._wakeup.clear()
+                if self._changes.empty():
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in reminder scheduler: {e}")
+                await asyncio.sleep(REMINDER_RETRY_DELAY)
+
+    def _spawn_send(self, appointment_id: int, start_time: datetime) -> None:
+        # Доставка идёт через очередь отправителя, цикл планировщика её не ждёт
+        task = asyncio.create_task(self._send(appointment_id, start_time))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, appointment_id: int, start_time: datetime) -> None:
+        async with self._claims:
+            async with AsyncSessionLocal() as db:
+                reminder = await crud.claim_reminder(db, appointment_id, start_time)
+        if reminder is None:
+            return
+
+        text = get_text(
+            "appointment_reminder",
+            reminder["lang"],
+            date=start_time.strftime("%d.%m.%Y"),
+            time=start_time.strftime("%H:%M"),
+            master=reminder["master_name"],
+            procedures=", ".join(reminder["procedure_names"])
+        )
+        try:
+            await message_sender.send_message(int(reminder["telegram_id"]), text, priority=PRIORITY_REMINDER)
+            self.sent += 1
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат не существует: повторять бессмысленно
+            self.failed += 1
+            logger.warning("Reminder for appointment %s not delivered: %s", appointment_id, e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error sending reminder for appointment {appointment_id}: {e}")
+            async with AsyncSessionLocal() as db:
+                await crud.release_reminder(db, appointment_id)
+            retry_at = datetime.now() + timedelta(seconds=REMINDER_RETRY_DELAY)
+            if retry_at < start_time:
+                self._scheduled[appointment_id] = start_time
+                heapq.heappush(self._heap, (retry_at, appointment_id, start_time))
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self._changes.put_nowait(int(payload))
+        except ValueError:
+            return
+        self._wakeup.set()
+
+    async def _listen(self) -> None:
+        """Keep a LISTEN connection open and forward notifications to the scheduler"""
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    driver_connection = raw.driver_connection
+                    await driver_connection.add_listener(crud.APPOINTMENT_CHANGED_CHANNEL, self._on_notify)
+                    logger.info("Listening for appointment changes")
+                    try:
+                        while not driver_connection.is_closed():
+                            await asyncio.sleep(REMINDER_LISTEN_RETRY)
+                    finally:
+                        if not driver_connection.is_closed():
+                            await driver_connection.remove_listener(crud.APPOINTMENT_CHANGED_CHANNEL, self._on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in appointment change listener: {e}")
+
+            # Уведомления за время разрыва потеряны: перечитываем загруженный диапазон.
+            # Сам сброс делает _run, чтобы не менять окно посреди загрузки
+            self._reload = True
+            self._wakeup.set()
+            await asyncio.sleep(REMINDER_LISTEN_RETRY)
@@ -0,0 +1,116 @@
+"""
+Failure handling helpers for outgoing HTTP calls: circuit breaker,
+retry backoff and latency histograms.
+"""
+import bisect
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+
+class CircuitBreaker:
+    """Classic three-state circuit breaker.
+
+    closed    - requests pass, consecutive failures are counted;
+    open      - requests fail fast for ``recovery_timeout`` seconds;
+    half_open - one probe request is let through, its result closes
+                or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 15):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_started_at = None
+        now = time.monotonic()
+        # Зависший или отменённый пробный запрос не должен блокировать цепь навсегда
+        if self._probe_started_at is not None and now - self._probe_started_at < self.recovery_timeout:
+            return False
+        self._probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_started_at = None
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+
+def backoff_delay(attempt: int, base: float = 0.1, cap: float = 2.0) -> float:
+    """Exponential backoff with full jitter for the given attempt (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# Bucket upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram per endpoint"""
+
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self._counts: Dict[str, List[int]] = defaultdict(lambda: [0] * (len(self.buckets_ms) + 1))
+        self._totals: Dict[str, float] = defaultdict(float)
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        ms = seconds * 1000
+        self._counts[endpoint][bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self._totals[endpoint] += ms
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        """Upper bound of the bucket that contains the q-th percentile (ms)"""
+        counts = self._counts.get(endpoint)
+        if not counts:
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets_ms[index] if index < len(self.buckets_ms) else float("inf")
+        return None
+
+    def snapshot(self) -> Dict[str, Dict]:
+        result = {}
+        for endpoint, counts in self._counts.items():
+            total = sum(counts)
+            labels = [f"<={b}ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+            result[endpoint] = {
+                "count": total,
+                "avg_ms": round(self._totals[endpoint] / total, 1) if total else 0,
+                "p50_ms": self.percentile(endpoint, 0.5),
+                "p95_ms": self.percentile(endpoint, 0.95),
+                "p99_ms": self.percentile(endpoint, 0.99),
+                "buckets": dict(zip(labels, counts)),
+            }
+        return result
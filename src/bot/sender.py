@@ -0,0 +1,396 @@
+"""
+Outbound message queue for notifications sent by the bot on its own
+(reminders, cancellation notices, broadcasts).
+
+Messages wait in priority lanes and leave the queue through two token
+buckets: a global one (Telegram allows about 30 messages per second per
+bot) and one per chat (about one message per second). Interactive replies
+made by handlers are not queued, but a request middleware charges them to
+the global bucket, so a large batch of reminders slows down instead of
+competing with users. On 429 the chat is paused for ``retry_after`` seconds
+and the message is put back into its lane. At most one message per chat is
+in flight, so messages of one chat arrive in the order they were queued.
+
+Limits are per process: with several webhook workers, only the first one
+sends notifications.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from src.bot.resilience import LatencyHistogram, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+SENDER_GLOBAL_RATE = float(os.getenv("SENDER_GLOBAL_RATE", "25"))  # messages per second
+SENDER_GLOBAL_BURST = float(os.getenv("SENDER_GLOBAL_BURST", "25"))
+SENDER_CHAT_RATE = float(os.getenv("SENDER_CHAT_RATE", "1"))
+SENDER_CHAT_BURST = float(os.getenv("SENDER_CHAT_BURST", "3"))
+SENDER_CONCURRENCY = int(os.getenv("SENDER_CONCURRENCY", "10"))
+SENDER_MAX_ATTEMPTS = int(os.getenv("SENDER_MAX_ATTEMPTS", "3"))
+SENDER_MAX_CHATS = int(os.getenv("SENDER_MAX_CHATS", "10000"))
+
+# Priority lanes, lower value is sent first
+PRIORITY_CONFIRMATION = 0
+PRIORITY_NOTICE = 1
+PRIORITY_REMINDER = 2
+PRIORITY_BROADCAST = 3
+
+LANE_NAMES = {
+    PRIORITY_CONFIRMATION: "confirmation",
+    PRIORITY_NOTICE: "notice",
+    PRIORITY_REMINDER: "reminder",
+    PRIORITY_BROADCAST: "broadcast",
+}
+
+# Set while the sender itself calls the Bot API (not charged twice)
+_queued_call: contextvars.ContextVar[bool] = contextvars.ContextVar("queued_call", default=False)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now <= self.updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """Seconds until one token is available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: Optional[float] = None) -> None:
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+
+    def charge(self) -> None:
+        """Take a token without waiting; the debt is limited to one burst"""
+        self._refill(time.monotonic())
+        self.tokens = max(self.tokens - 1, -self.capacity)
+
+    def refund(self) -> None:
+        """Return a token taken for a message that was not delivered"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+@dataclass
+class LaneStats:
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    rate_limited: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+        }
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: int
+    text: str
+    priority: int
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    ready_at: float = 0.0
+    seq: int = 0
+    future: Optional[asyncio.Future] = None
+
+
+class MessageSender:
+    """Rate-limited priority queue in front of ``bot.send_message``"""
+
+    def __init__(
+        self,
+        global_rate: float = SENDER_GLOBAL_RATE,
+        global_burst: float = SENDER_GLOBAL_BURST,
+        chat_rate: float = SENDER_CHAT_RATE,
+        chat_burst: float = SENDER_CHAT_BURST,
+        concurrency: int = SENDER_CONCURRENCY,
+        max_attempts: int = SENDER_MAX_ATTEMPTS
+    ):
+        self.bot: Optional[Bot] = None
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self._chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._lanes: Dict[int, Deque[OutboundMessage]] = {priority: deque() for priority in LANE_NAMES}
+        # (ready_at, seq, message): messages waiting for their chat or a retry;
+        # seq is the enqueue order and keeps messages of one chat in order
+        self._delayed: List[Tuple[float, int, OutboundMessage]] = []
+        # chat_id -> message waiting for a retry; later messages of the chat wait for it
+        self._retrying: Dict[int, OutboundMessage] = {}
+        # chat_id -> messages waiting for the chat's message in flight
+        self._busy_chats: Dict[int, List[OutboundMessage]] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._inflight: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[int, LaneStats] = defaultdict(LaneStats)
+        self._latency = LatencyHistogram()
+
+    def start(self, bot: Bot) -> None:
+        if self._task is not None:
+            return
+        self.bot = bot
+        bot.session.middleware(DirectCallBudget(self))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Wait up to ``timeout`` seconds for queued messages, then stop"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+        self._task = None
+        logger.info("Sender stats: %s", self.stats())
+
+    def pending(self) -> int:
+        waiting = sum(len(messages) for messages in self._busy_chats.values())
+        return sum(len(lane) for lane in self._lanes.values()) + len(self._delayed) + len(self._inflight) + waiting
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_NOTICE, **kwargs: Any) -> asyncio.Future:
+        """Queue a message.
+
+        Args:
+            chat_id: Telegram chat id
+            text: Message text
+            priority: One of PRIORITY_* lanes
+            **kwargs: Other ``bot.send_message`` arguments
+
+        Returns:
+            Future with the sent Message, or the delivery error
+        """
+        message = OutboundMessage(
+            chat_id=chat_id,
+            text=text,
+            priority=priority,
+            kwargs=kwargs,
+            future=asyncio.get_running_loop().create_future(),
+            seq=next(self._seq)
+        )
+        self._lanes[priority].append(message)
+        self._stats[priority].queued += 1
+        self._wakeup.set()
+        return message.future
+
+    def chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            # Старые корзины давно заполнены, их можно забыть
+            while len(self._chat_buckets) > SENDER_MAX_CHATS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _release_delayed(self, now: float) -> None:
+        released: List[OutboundMessage] = []
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, message = heapq.heappop(self._delayed)
+            released.append(message)
+        self._return_to_lanes(released)
+
+    def _return_to_lanes(self, released: List[OutboundMessage]) -> None:
+        by_priority: Dict[int, List[OutboundMessage]] = defaultdict(list)
+        for message in released:
+            by_priority[message.priority].append(message)
+        # Отложенные сообщения не теряют места в очереди своего приоритета
+        for priority, messages in by_priority.items():
+            messages.sort(key=lambda message: message.seq)
+            self._lanes[priority].extendleft(reversed(messages))
+
+    def _delay(self, message: OutboundMessage, ready_at: float) -> None:
+        message.ready_at = ready_at
+        heapq.heappush(self._delayed, (ready_at, message.seq, message))
+
+    def _next_message(self, now: float) -> Optional[OutboundMessage]:
+        """Pop the first message whose chat may receive it now"""
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            while lane:
+                message = lane.popleft()
+                retrying = self._retrying.get(message.chat_id)
+                if retrying is not None and retrying is not message:
+                    # Сообщения чата уходят строго по порядку: ждём повтор предыдущего
+                    self._delay(message, max(retrying.ready_at, now) + 0.05)
+                    continue
+                waiting = self._busy_chats.get(message.chat_id)
+                if waiting is not None:
+                    # В чат уже уходит сообщение: следующее ждёт его завершения
+                    waiting.append(message)
+                    continue
+                wait = self.chat_bucket(message.chat_id).wait_time(now)
+                if wait <= 0:
+                    return message
+                self._delay(message, now + wait)
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                now = time.monotonic()
+                self._release_delayed(now)
+
+                wait = self.global_bucket.wait_time(now)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                message = self._next_message(now)
+                if message is None:
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._slots.acquire()
+                self.global_bucket.take(now)
+                self.chat_bucket(message.chat_id).take(now)
+                self._busy_chats[message.chat_id] = []
+                task = asyncio.create_task(self._deliver(message))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in message sender: {e}")
+                await asyncio.sleep(1)
+
+    async def _deliver(self, message: OutboundMessage) -> None:
+        stats = self._stats[message.priority]
+        lane = LANE_NAMES[message.priority]
+        message.attempts += 1
+        token = _queued_call.set(True)
+        started_at = time.monotonic()
+        try:
+            result = await self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except TelegramRetryAfter as e:
+            stats.rate_limited += 1
+            logger.warning("Flood control for chat %s, retry after %s s", message.chat_id, e.retry_after)
+            self.chat_bucket(message.chat_id).pause(e.retry_after)
+            self._requeue(message, e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if message.attempts < self.max_attempts:
+                stats.retried += 1
+                self._requeue(message, backoff_delay(message.attempts, base=1, cap=30))
+            else:
+                self._fail(message, e)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            self._fail(message, e)
+        except Exception as e:
+            logger.error(f"Error sending message to chat {message.chat_id}: {e}")
+            self._fail(message, e)
+        else:
+            stats.sent += 1
+            self._latency.observe(f"{lane}.send", time.monotonic() - started_at)
+            self._latency.observe(f"{lane}.total", time.monotonic() - message.enqueued_at)
+            if not message.future.done():
+                message.future.set_result(result)
+        finally:
+            if self._retrying.get(message.chat_id) is message and message.future.done():
+                del self._retrying[message.chat_id]
+            self._return_to_lanes(self._busy_chats.pop(message.chat_id, []))
+            _queued_call.reset(token)
+            self._slots.release()
+            self._wakeup.set()
+
+    def _requeue(self, message: OutboundMessage, delay: float) -> None:
+        # Повтор не должен пропускать вперёд следующие сообщения того же чата
+        self.chat_bucket(message.chat_id).refund()
+        self._retrying[message.chat_id] = message
+        self._delay(message, time.monotonic() + delay)
+        self._wakeup.set()
+
+    def _fail(self, message: OutboundMessage, error: Exception) -> None:
+        self._stats[message.priority].failed += 1
+        logger.warning("Message to chat %s not delivered: %s", message.chat_id, error)
+        if not message.future.done():
+            message.future.set_exception(error)
+            # Отправитель мог не ждать результат
+            message.future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Delivery counters per lane, queue depth and latency"""
+        return {
+            "lanes": {
+                LANE_NAMES[priority]: {**self._stats[priority].as_dict(), "depth": len(lane)}
+                for priority, lane in self._lanes.items()
+            },
+            "delayed": len(self._delayed),
+            "inflight": len(self._inflight),
+            "latency": self._latency.snapshot(),
+        }
+
+
+class DirectCallBudget(BaseRequestMiddleware):
+    """Charges Bot API calls made outside the queue to the global bucket"""
+
+    def __init__(self, sender: MessageSender):
+        self.sender = sender
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not _queued_call.get() and not isinstance(method, GetUpdates):
+            self.sender.global_bucket.charge()
+        return await make_request(bot, method)
+
+
+message_sender = MessageSender()
@@ -0,0 +1,284 @@
+"""
+Webhook entry point for the bot.
+
+A single aiohttp server accepts updates from Telegram and routes each one to
+one of N worker processes by hashing its chat id. Every worker runs its own
+Bot/Dispatcher pair, so throughput scales with the number of cores, while all
+updates of one chat always land in the same worker and are handled in arrival
+order. Because the routing is stable, the in-memory FSM storage of a chat
+also lives in exactly one worker.
+"""
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import os
+import queue
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Webhook settings from environment variables
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public base URL, e.g. https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 1)))
+WORKER_QUEUE_SIZE = int(os.getenv("BOT_WORKER_QUEUE_SIZE", "1000"))
+WORKER_MAX_CONCURRENCY = int(os.getenv("BOT_WORKER_MAX_CONCURRENCY", "64"))
+
+# Update fields that carry a chat, in the order they are checked
+_CHAT_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+# Update fields that only carry a user
+_USER_UPDATE_FIELDS = (
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+)
+
+
+def extract_chat_id(update: Dict[str, Any]) -> int:
+    """Get the routing key of a raw update.
+
+    Args:
+        update: Update as received from Telegram (decoded JSON)
+
+    Returns:
+        Chat id of the update, user id for chat-less updates,
+        or update_id as a last resort
+    """
+    for field in _CHAT_UPDATE_FIELDS:
+        payload = update.get(field)
+        if payload and payload.get("chat"):
+            return int(payload["chat"]["id"])
+
+    callback_query = update.get("callback_query")
+    if callback_query:
+        message = callback_query.get("message")
+        if message and message.get("chat"):
+            return int(message["chat"]["id"])
+        return int(callback_query["from"]["id"])
+
+    for field in _USER_UPDATE_FIELDS:
+        payload = update.get(field)
+        if payload:
+            user = payload.get("from") or payload.get("user")
+            if user:
+                return int(user["id"])
+
+    return int(update.get("update_id", 0))
+
+
+def worker_index(chat_id: int, workers: int) -> int:
+    """Map a chat id to a worker index (stable across restarts)"""
+    return chat_id % workers
+
+
+class UpdateWorker:
+    """Feeds updates into a dispatcher, one chat at a time.
+
+    Updates of different chats are processed concurrently (up to
+    ``max_concurrency``), updates of the same chat strictly in order.
+    """
+
+    def __init__(self, bot, dispatcher, max_concurrency: int = WORKER_MAX_CONCURRENCY):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tails: Dict[int, asyncio.Task] = {}
+
+    def submit(self, chat_id: int, raw_update: Dict[str, Any]) -> asyncio.Task:
+        """Schedule an update after the previous update of the same chat"""
+        previous = self._tails.get(chat_id)
+        task = asyncio.create_task(self._process(previous, raw_update))
+        self._tails[chat_id] = task
+        task.add_done_callback(lambda done, key=chat_id: self._release(key, done))
+        return task
+
+    def _release(self, chat_id: int, task: asyncio.Task) -> None:
+        if self._tails.get(chat_id) is task:
+            del self._tails[chat_id]
+
+    async def _process(self, previous: Optional[asyncio.Task], raw_update: Dict[str, Any]) -> None:
+        if previous is not None:
+            # Ошибка предыдущего апдейта не должна блокировать следующий
+            await asyncio.gather(previous, return_exceptions=True)
+
+        from aiogram.types import Update
+
+        async with self._semaphore:
+            try:
+                update = Update.model_validate(raw_update, context={"bot": self.bot})
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Failed to process update %s", raw_update.get("update_id"))
+
+    async def drain(self) -> None:
+        """Wait until all scheduled updates are processed"""
+        while self._tails:
+            await asyncio.gather(*list(self._tails.values()), return_exceptions=True)
+
+
+async def _worker_loop(index: int, updates: "multiprocessing.Queue") -> None:
+    """Event loop of a worker process"""
+    from src.bot.main import create_bot, create_dispatcher
+
+    bot = create_bot()
+    dispatcher = create_dispatcher()
+    worker = UpdateWorker(bot, dispatcher)
+    loop = asyncio.get_running_loop()
+
+    await dispatcher.emit_startup(bot=bot, worker_index=index)
+    logger.info("Bot worker %s started", index)
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                break
+            chat_id, raw_update = item
+            worker.submit(chat_id, raw_update)
+        await worker.drain()
+    finally:
+        await dispatcher.emit_shutdown(bot=bot)
+        await bot.session.close()
+        logger.info("Bot worker %s stopped", index)
+
+
+def _worker_main(index: int, updates: "multiprocessing.Queue") -> None:
+    """Entry point of a worker process"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s",
+    )
+    try:
+        asyncio.run(_worker_loop(index, updates))
+    except KeyboardInterrupt:
+        pass
+
+
+class UpdateRouter:
+    """Owns the worker processes and routes raw updates to them"""
+
+    def __init__(self, workers: int = BOT_WORKERS, queue_size: int = WORKER_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._queue_size = queue_size
+
+    def start(self) -> None:
+        """Spawn worker processes"""
+        for index in range(self.workers):
+            updates = self._context.Queue(maxsize=self._queue_size)
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, updates),
+                name=f"bot-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._queues.append(updates)
+            self._processes.append(process)
+        logger.info("Started %s bot workers", self.workers)
+
+    def route(self, raw_update: Dict[str, Any]) -> bool:
+        """Put an update into the queue of its worker.
+
+        Returns:
+            False if the worker queue is full (the caller should ask
+            Telegram to redeliver the update later)
+        """
+        chat_id = extract_chat_id(raw_update)
+        try:
+            self._queues[worker_index(chat_id, self.workers)].put_nowait((chat_id, raw_update))
+            return True
+        except queue.Full:
+            return False
+
+    def stop(self, timeout: float = 30) -> None:
+        """Ask workers to finish queued updates and wait for them"""
+        for updates in self._queues:
+            updates.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, terminating", process.name)
+                process.terminate()
+
+
+def create_webhook_app(router: UpdateRouter, path: str = WEBHOOK_PATH, secret: Optional[str] = WEBHOOK_SECRET) -> web.Application:
+    """Create aiohttp application that accepts Telegram updates"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret:
+            received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(received, secret):
+                return web.Response(status=401)
+
+        try:
+            raw_update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        if not router.route(raw_update):
+            # Telegram повторит доставку, если ответить ошибкой
+            logger.warning("Worker queue is full, rejecting update %s", raw_update.get("update_id"))
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def handle_health(request: web.Request) -> web.Response:
+        return web.json_response({"workers": router.workers})
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get(f"{path}/health", handle_health)
+    return app
+
+
+async def run_webhook(bot) -> None:
+    """Run the webhook server with a pool of worker processes.
+
+    Args:
+        bot: Bot instance used to register the webhook with Telegram
+    """
+    router = UpdateRouter()
+    router.start()
+
+    app = create_webhook_app(router)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("Webhook server listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True,
+        )
+    else:
+        logger.warning("WEBHOOK_URL is not set, webhook is not registered with Telegram")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        # stop() ждёт завершения процессов, не блокируем цикл событий
+        await asyncio.to_thread(router.stop)
+        await bot.session.close()
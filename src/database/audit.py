@@ -0,0 +1,138 @@
+"""
+Buffered admin audit log.
+
+Request handlers call ``audit_log.log()``, which only appends the entry to an
+in-memory queue. A background task writes queued entries to admin_log with
+one multi-row INSERT when AUDIT_BATCH_SIZE entries are waiting or after
+AUDIT_FLUSH_INTERVAL seconds. stop() flushes the rest before shutdown. While
+the database is unavailable, entries stay queued and are retried; beyond
+AUDIT_QUEUE_LIMIT the oldest ones are dropped and counted.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from src.database import crud
+from src.database.base import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2"))
+AUDIT_QUEUE_LIMIT = int(os.getenv("AUDIT_QUEUE_LIMIT", "50000"))
+
+
+class AuditLogWriter:
+    """Collects admin log entries and writes them to the database in batches"""
+
+    def __init__(
+        self,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        queue_limit: int = AUDIT_QUEUE_LIMIT
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_limit = queue_limit
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_flush_ms = 0.0
+
+    def log(self, admin_id: int, action: str, details: str) -> None:
+        """Queue an entry; the time of the action is taken now"""
+        if len(self._queue) >= self.queue_limit:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append({
+            "admin_id": admin_id,
+            "action": action,
+            "details": details,
+            "timestamp": datetime.now()
+        })
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and write everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._queue:
+            if not await self.flush():
+                logger.error(f"Audit log: {len(self._queue)} entries lost on shutdown")
+                break
+        logger.info(f"Audit log writer stopped: {self.stats()}")
+
+    async def flush(self) -> bool:
+        """Write one batch. False if the database write failed"""
+        async with self._flush_lock:
+            batch: List[Dict[str, Any]] = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            if not batch:
+                return True
+
+            started_at = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    saved = await crud.add_admin_logs(db, batch)
+            except Exception as e:
+                # Сбой соединения или сессии (не SQLAlchemyError) - пачка не должна теряться
+                logger.error(f"Error writing audit log batch: {e}")
+                saved = False
+            if not saved:
+                # Возвращаем пачку в начало очереди, порядок записей сохраняется
+                self._queue.extendleft(reversed(batch))
+                self.failed_batches += 1
+                return False
+
+            self.last_flush_ms = (time.perf_counter() - started_at) * 1000
+            self.written += len(batch)
+            self.batches += 1
+            return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self._queue:
+                    # Отмена при остановке не должна прерывать запись пачки
+                    if not await asyncio.shield(self.flush()):
+                        await asyncio.sleep(self.flush_interval)
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in audit log writer: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+audit_log = AuditLogWriter()
@@ -2,12 +2,15 @@
 Оптимизированные CRUD-функции для работы с базой данных
 """
 from typing import List, Dict, Any, Optional, Tuple
-from sqlalchemy import select, update, delete, or_, and_, desc, func
+from sqlalchemy import select, update, delete, or_, and_, desc, func, literal_column, literal, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 from sqlalchemy.sql.expression import text
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 import logging
+import os
+import re
 from datetime import datetime, timedelta
 
 from .models import (
@@ -16,8 +19,10 @@ from .models import (
     Master, MasterProcedure,
     Client, Appointment, Workplace,
     Admin, AdminLog, WorkSlot,
-    AppointmentStatus
+    AppointmentStatus, CalendarOutbox
 )
+from src.utils.phone import PHONE_COUNTRY_CODE, normalize_phone
+from src.utils.translations import get_name, merge_catalog_names
 
 # Настройка логирования
 logging.basicConfig(
@@ -486,6 +491,25 @@ async def delete_procedure(db: AsyncSession, procedure_id: int) -> bool:
         await db.rollback()
         return False
 
+async def get_catalog_names(db: AsyncSession) -> List[Tuple[str, int, str, str]]:
+    """
+    Все переводы названий разделов и процедур: (вид, ID, язык, название)
+    """
+    try:
+        sections = await db.execute(
+            select(SectionTranslation.section_id, SectionTranslation.lang, SectionTranslation.name)
+        )
+        procedures = await db.execute(
+            select(ProcedureTranslation.procedure_id, ProcedureTranslation.lang, ProcedureTranslation.name)
+        )
+        return (
+            [("section", item_id, lang, name) for item_id, lang, name in sections.all()]
+            + [("procedure", item_id, lang, name) for item_id, lang, name in procedures.all()]
+        )
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_catalog_names: {e}")
+        return []
+
 # Функции для работы с рабочими местами
 async def get_workplaces(db: AsyncSession) -> List[Dict[str, Any]]:
     """
@@ -1064,6 +1088,19 @@ async def log_admin_action(db: AsyncSession, admin_id: int, action: str, details
         await db.rollback()
         return False
 
+async def add_admin_logs(db: AsyncSession, entries: List[Dict[str, Any]]) -> bool:
+    """
+    Запись пачки действий администраторов одним INSERT (см. src/database/audit.py)
+    """
+    try:
+        await db.execute(pg_insert(AdminLog).values(entries))
+        await db.commit()
+        return True
+    except SQLAlchemyError as e:
+        logger.error(f"Error in add_admin_logs: {e}")
+        await db.rollback()
+        return False
+
 # Функции для работы с мастерами
 async def get_masters(db: AsyncSession) -> List[Dict[str, Any]]:
     """
@@ -1269,6 +1306,43 @@ async def delete_master(db: AsyncSession, master_id: int) -> bool:
         return False
 
 # Функции для работы с клиентами
+def _client_to_dict(client: Client) -> Dict[str, Any]:
+    return {
+        "id": client.id,
+        "name": client.name,
+        "phone": client.phone,
+        "email": client.email,
+        "telegram_id": client.telegram_id,
+        "lang": client.lang,
+        "time_coeff": client.time_coeff,
+        "is_first_visit": client.is_first_visit,
+        "created_at": client.created_at,
+        "updated_at": client.updated_at
+    }
+
+# Цифры телефона без форматирования. Выражение записано литералами, чтобы
+# совпадать с индексом idx_client_phone_digits_trgm (параметры запроса индекс не используют)
+CLIENT_PHONE_DIGITS = func.regexp_replace(
+    Client.phone, literal_column(r"'\D'"), literal_column("''"), literal_column("'g'")
+)
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _client_search_filter(search: str):
+    """
+    Условие поиска клиента по имени, цифрам телефона и telegram_id
+    """
+    search = search.strip()
+    conditions = [
+        Client.name.ilike(f"%{_escape_like(search)}%"),
+        Client.telegram_id == search
+    ]
+    digits = re.sub(r"\D", "", search)
+    if len(digits) >= 3:
+        conditions.append(CLIENT_PHONE_DIGITS.like(f"%{digits}%"))
+    return or_(*conditions)
+
 async def get_clients(db: AsyncSession) -> List[Dict[str, Any]]:
     """
     Получение всех клиентов
@@ -1278,27 +1352,89 @@ async def get_clients(db: AsyncSession) -> List[Dict[str, Any]]:
         result = await db.execute(query)
         clients = result.scalars().all()
         
-        client_list = []
-        for client in clients:
-            client_dict = {
-                "id": client.id,
-                "name": client.name,
-                "phone": client.phone,
-                "email": client.email,
-                "telegram_id": client.telegram_id,
-                "lang": client.lang,
-                "time_coeff": client.time_coeff,
-                "is_first_visit": client.is_first_visit,
-                "created_at": client.created_at,
-                "updated_at": client.updated_at
-            }
-            client_list.append(client_dict)
-        
-        return client_list
+        return [_client_to_dict(client) for client in clients]
     except SQLAlchemyError as e:
         logger.error(f"Error in get_clients: {e}")
         return []
 
+async def get_clients_page(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+    search: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Страница клиентов (keyset-пагинация по id) с необязательным поиском.
+    next_cursor - id последнего клиента страницы, если есть следующая
+    """
+    try:
+        query = select(Client)
+        if search and search.strip():
+            query = query.where(_client_search_filter(search))
+        if after_id is not None:
+            query = query.where(Client.id > after_id)
+        # Лишняя строка показывает, есть ли следующая страница
+        query = query.order_by(Client.id).limit(limit + 1)
+        result = await db.execute(query)
+        clients = result.scalars().all()
+        
+        has_more = len(clients) > limit
+        clients = clients[:limit]
+        return {
+            "items": [_client_to_dict(client) for client in clients],
+            "next_cursor": clients[-1].id if has_more else None
+        }
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_clients_page: {e}")
+        return {"items": [], "next_cursor": None}
+
+async def search_clients(db: AsyncSession, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Поиск клиентов: точный telegram_id, начало номера телефона, похожее имя.
+    Результаты отсортированы по релевантности
+    """
+    try:
+        query = (query or "").strip()
+        if not query:
+            return []
+        
+        name_score = func.word_similarity(query, Client.name)
+        conditions = [
+            Client.telegram_id == query,
+            # word_similarity выше порога pg_trgm, использует idx_client_name_trgm
+            literal(query).op("<%")(Client.name)
+        ]
+        rank = name_score
+        
+        digits = re.sub(r"\D", "", query)
+        if len(digits) >= 3:
+            prefixes = {digits}
+            if digits.startswith("0"):
+                # Местный номер: 050... совпадает с 38050... (как в normalize_phone)
+                prefixes.add(PHONE_COUNTRY_CODE + digits[1:])
+            # Диапазон вместо LIKE 'prefix%', чтобы индекс работал и с параметрами
+            phone_conditions = [
+                and_(
+                    CLIENT_PHONE_DIGITS.op("~>=~")(prefix),
+                    CLIENT_PHONE_DIGITS.op("~<~")(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+                )
+                for prefix in prefixes
+            ]
+            conditions.extend(phone_conditions)
+            rank = rank + case((or_(*phone_conditions), 2.0), else_=0.0)
+        rank = rank + case((Client.telegram_id == query, 3.0), else_=0.0)
+        
+        result = await db.execute(
+            select(Client)
+            .where(or_(*conditions))
+            .order_by(rank.desc(), Client.id)
+            .limit(limit)
+        )
+        return [_client_to_dict(client) for client in result.scalars().all()]
+    except SQLAlchemyError as e:
+        logger.error(f"Error in search_clients: {e}")
+        return []
+
 async def get_client_by_id(db: AsyncSession, client_id: int) -> Optional[Dict[str, Any]]:
     """
     Получение клиента по ID
@@ -1359,44 +1495,100 @@ async def get_client_by_telegram_id(db: AsyncSession, telegram_id: str) -> Optio
 
 async def create_client(db: AsyncSession, client_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    Создание нового клиента
+    Создание нового клиента. None, если клиент с таким телефоном уже есть
     """
     try:
-        # Проверка на существование клиента с таким же телефоном
-        if client_data.get("phone") and client_data["phone"].strip():
-            phone_query = select(Client).where(Client.phone == client_data["phone"])
-            phone_result = await db.execute(phone_query)
-            existing_client = phone_result.scalars().first()
-            
-            if existing_client:
-                logger.warning(f"Client with phone {client_data['phone']} already exists")
-                return None
+        phone = client_data.get("phone", "") or ""
+        
+        # Проверка дубликата телефона выполняется уникальным индексом в том же запросе
+        stmt = (
+            pg_insert(Client)
+            .values(
+                name=client_data.get("name", ""),
+                phone=phone,
+                phone_normalized=normalize_phone(phone),
+                email=client_data.get("email", "") or "",
+                telegram_id=client_data.get("telegram_id", "") or "",
+                lang=client_data.get("lang", "ru"),
+                time_coeff=client_data.get("time_coeff", 1.0),
+                is_first_visit=client_data.get("is_first_visit", True)
+            )
+            .on_conflict_do_nothing(
+                index_elements=[Client.phone_normalized],
+                index_where=Client.phone_normalized.isnot(None)
+            )
+            .returning(Client.id)
+        )
+        result = await db.execute(stmt)
+        client_id = result.scalar()
+        
+        if client_id is None:
+            logger.warning(f"Client with phone {phone} already exists")
+            await db.rollback()
+            return None
+        
+        await db.commit()
         
-        # Создание нового клиента
-        new_client = Client(
+        # Формируем ответ
+        return await get_client_by_id(db, client_id)
+    except SQLAlchemyError as e:
+        logger.error(f"Error in create_client: {e}")
+        await db.rollback()
+        return None
+
+async def register_client(db: AsyncSession, client_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Регистрация клиента из бота одним запросом (INSERT ... ON CONFLICT).
+    Если клиент с этим телефоном уже заведён администратором без Telegram,
+    к нему привязывается telegram_id. None, если телефон принадлежит
+    другому аккаунту Telegram; ошибки базы данных пробрасываются, чтобы
+    их нельзя было спутать с занятым телефоном
+    """
+    try:
+        phone = client_data.get("phone", "") or ""
+        insert_stmt = pg_insert(Client).values(
             name=client_data.get("name", ""),
-            phone=client_data.get("phone", "") or "",
+            phone=phone,
+            phone_normalized=normalize_phone(phone),
             email=client_data.get("email", "") or "",
-            telegram_id=client_data.get("telegram_id", "") or "",
+            telegram_id=client_data["telegram_id"],
             lang=client_data.get("lang", "ru"),
             time_coeff=client_data.get("time_coeff", 1.0),
             is_first_visit=client_data.get("is_first_visit", True)
         )
+        stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[Client.phone_normalized],
+            index_where=Client.phone_normalized.isnot(None),
+            set_={
+                "telegram_id": insert_stmt.excluded.telegram_id,
+                "name": func.coalesce(func.nullif(Client.name, ""), insert_stmt.excluded.name),
+                "lang": insert_stmt.excluded.lang,
+                "updated_at": func.now()
+            },
+            where=or_(
+                Client.telegram_id.is_(None),
+                Client.telegram_id == "",
+                Client.telegram_id == insert_stmt.excluded.telegram_id
+            )
+        ).returning(Client.id)
+        result = await db.execute(stmt)
+        client_id = result.scalar()
         
-        db.add(new_client)
-        await db.commit()
-        await db.refresh(new_client)
+        if client_id is None:
+            logger.warning(f"Phone {phone} is already registered by another Telegram account")
+            await db.rollback()
+            return None
         
-        # Формируем ответ
-        return await get_client_by_id(db, new_client.id)
+        await db.commit()
+        return await get_client_by_id(db, client_id)
     except SQLAlchemyError as e:
-        logger.error(f"Error in create_client: {e}")
+        logger.error(f"Error in register_client: {e}")
         await db.rollback()
-        return None
+        raise
 
 async def update_client(db: AsyncSession, client_id: int, client_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    Обновление клиента
+    Обновление клиента. None, если клиента нет или телефон занят другим клиентом
     """
     try:
         query = select(Client).where(Client.id == client_id)
@@ -1406,21 +1598,12 @@ async def update_client(db: AsyncSession, client_id: int, client_data: Dict[str,
         if not client:
             return None
         
-        # Проверка на существование клиента с таким же телефоном (кроме текущего)
-        if client_data.get("phone") and client_data["phone"] != client.phone:
-            phone_query = select(Client).where(and_(Client.phone == client_data["phone"], Client.id != client_id))
-            phone_result = await db.execute(phone_query)
-            existing_client = phone_result.scalars().first()
-            
-            if existing_client:
-                logger.warning(f"Another client with phone {client_data['phone']} already exists")
-                return None
-        
         # Обновление полей клиента
         if "name" in client_data:
             client.name = client_data["name"]
         if "phone" in client_data:
             client.phone = client_data["phone"]
+            client.phone_normalized = normalize_phone(client_data["phone"])
         if "email" in client_data:
             client.email = client_data["email"]
         if "telegram_id" in client_data:
@@ -1433,11 +1616,55 @@ async def update_client(db: AsyncSession, client_id: int, client_data: Dict[str,
         
         # Формируем ответ
         return await get_client_by_id(db, client.id)
+    except IntegrityError as e:
+        # Уникальный индекс idx_client_phone_normalized
+        logger.warning(f"Another client with phone {client_data.get('phone')} already exists: {e}")
+        await db.rollback()
+        return None
     except SQLAlchemyError as e:
         logger.error(f"Error in update_client: {e}")
         await db.rollback()
         return None
 
+async def merge_clients(db: AsyncSession, client_id: int, duplicate_ids: List[int]) -> bool:
+    """
+    Слияние дубликатов клиента: записи переносятся на client_id,
+    пустые поля заполняются из дубликатов, дубликаты удаляются
+    """
+    try:
+        result = await db.execute(
+            select(Client).where(Client.id.in_([client_id] + duplicate_ids)).order_by(Client.id)
+        )
+        clients = {client.id: client for client in result.scalars().all()}
+        client = clients.get(client_id)
+        if client is None:
+            return False
+        
+        for duplicate_id in duplicate_ids:
+            duplicate = clients.get(duplicate_id)
+            if duplicate is None:
+                continue
+            for field in ("telegram_id", "email"):
+                if not getattr(client, field) and getattr(duplicate, field):
+                    setattr(client, field, getattr(duplicate, field))
+            # Клиент, уже бывавший в салоне, не считается новым
+            client.is_first_visit = client.is_first_visit and duplicate.is_first_visit
+        
+        await db.execute(
+            update(Appointment)
+            .where(Appointment.client_id.in_(duplicate_ids))
+            .values(client_id=client_id, updated_at=func.now())
+        )
+        await db.execute(delete(Client).where(Client.id.in_(duplicate_ids)))
+        client.updated_at = datetime.utcnow()
+        
+        await db.commit()
+        return True
+    except SQLAlchemyError as e:
+        logger.error(f"Error in merge_clients: {e}")
+        await db.rollback()
+        return False
+
 async def delete_client(db: AsyncSession, client_id: int) -> bool:
     """
     Удаление клиента
@@ -1569,6 +1796,81 @@ async def get_appointments(db: AsyncSession, client_id: Optional[int] = None, ma
         logger.error(f"Error in get_appointments: {e}")
         return []
 
+async def get_appointment_model(db: AsyncSession, appointment_id: int) -> Optional[Appointment]:
+    """
+    Получение объекта записи по ID. Первичный ключ записи - (id, start_time),
+    поэтому db.get(Appointment, id) не подходит
+    """
+    try:
+        result = await db.execute(select(Appointment).where(Appointment.id == appointment_id))
+        return result.scalars().first()
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_appointment_model: {e}")
+        return None
+
+async def get_appointments_by_procedures(
+    db: AsyncSession,
+    procedure_ids: List[int],
+    match_all: bool = False,
+    upcoming_only: bool = True,
+    now: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    Записи с указанными процедурами: со всеми (@>) при match_all, иначе с любой из них (&&).
+    Оба оператора используют GIN-индекс idx_appointment_procedures
+    """
+    if not procedure_ids:
+        return []
+    try:
+        if match_all:
+            condition = Appointment.procedures.contains(procedure_ids)
+        else:
+            condition = Appointment.procedures.overlap(procedure_ids)
+        query = select(Appointment).where(condition)
+        if upcoming_only:
+            query = query.where(
+                Appointment.status == AppointmentStatus.active,
+                Appointment.end_time >= (now or datetime.now())
+            )
+        result = await db.execute(query.order_by(Appointment.start_time))
+        return [
+            {
+                "id": appointment.id,
+                "client_id": appointment.client_id,
+                "master_id": appointment.master_id,
+                "workplace_id": appointment.workplace_id,
+                "procedures": appointment.procedures,
+                "start_time": appointment.start_time,
+                "end_time": appointment.end_time,
+                "status": appointment.status.value
+            }
+            for appointment in result.scalars()
+        ]
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_appointments_by_procedures: {e}")
+        return []
+
+async def count_upcoming_appointments_with_procedure(
+    db: AsyncSession,
+    procedure_id: int,
+    now: Optional[datetime] = None
+) -> Optional[int]:
+    """
+    Число активных предстоящих записей с процедурой (проверка перед удалением процедуры)
+    """
+    try:
+        result = await db.execute(
+            select(func.count()).select_from(Appointment).where(
+                Appointment.procedures.contains([procedure_id]),
+                Appointment.status == AppointmentStatus.active,
+                Appointment.end_time >= (now or datetime.now())
+            )
+        )
+        return result.scalar()
+    except SQLAlchemyError as e:
+        logger.error(f"Error in count_upcoming_appointments_with_procedure: {e}")
+        return None
+
 async def get_appointment_by_id(db: AsyncSession, appointment_id: int) -> Optional[Dict[str, Any]]:
     """
     Получение записи по ID
@@ -1673,6 +1975,12 @@ async def create_appointment(db: AsyncSession, appointment_data: Dict[str, Any])
         )
         
         db.add(new_appointment)
+        await db.flush()
+        
+        # Синхронизация с календарём и уведомление планировщика в той же транзакции
+        enqueue_calendar_sync(db, new_appointment.id)
+        await notify_appointment_changed(db, new_appointment.id)
+        
         await db.commit()
         await db.refresh(new_appointment)
         
@@ -1696,6 +2004,11 @@ async def update_appointment(db: AsyncSession, appointment_id: int, appointment_
             logger.error(f"Appointment with ID {appointment_id} not found")
             return None
         
+        # Запоминаем значения до изменения, чтобы синхронизировать только изменённые поля
+        previous_values = {
+            field: getattr(appointment, field) for field in CALENDAR_SYNC_FIELDS
+        }
+        
         # Обновляем поля записи
         if "client_id" in appointment_data:
             appointment.client_id = appointment_data["client_id"]
@@ -1724,6 +2037,22 @@ async def update_appointment(db: AsyncSession, appointment_id: int, appointment_
         
         appointment.updated_at = datetime.utcnow()
         
+        # Новое время или возврат записи в активные - напоминание отправляется заново
+        if appointment.start_time != previous_values["start_time"] or (
+            AppointmentStatus(appointment.status) == AppointmentStatus.active
+            and previous_values["status"] != AppointmentStatus.active
+        ):
+            appointment.reminder_sent_at = None
+        
+        # Синхронизация с календарём в той же транзакции
+        changed_fields = [
+            field for field in CALENDAR_SYNC_FIELDS
+            if getattr(appointment, field) != previous_values[field]
+        ]
+        if changed_fields:
+            enqueue_calendar_sync(db, appointment.id, changed_fields=changed_fields)
+            await notify_appointment_changed(db, appointment.id)
+        
         await db.commit()
         await db.refresh(appointment)
         
@@ -1734,6 +2063,96 @@ async def update_appointment(db: AsyncSession, appointment_id: int, appointment_
         await db.rollback()
         return None
 
+async def update_appointment_status(
+    db: AsyncSession,
+    appointment_id: int,
+    status: Any,
+    expected_status: Optional[Any] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Изменение статуса записи одним UPDATE ... RETURNING, без загрузки записи
+    и связанных данных. expected_status - менять статус, только если текущий
+    совпадает (например, отменять только активную запись).
+    None, если запись не найдена или её статус не подходит
+    """
+    try:
+        status = AppointmentStatus(status)
+        query = update(Appointment).where(Appointment.id == appointment_id)
+        if expected_status is not None:
+            query = query.where(Appointment.status == AppointmentStatus(expected_status))
+        values = {"status": status, "updated_at": func.now()}
+        if status == AppointmentStatus.active:
+            # Возврат в активные - напоминание отправляется заново
+            values["reminder_sent_at"] = case(
+                (Appointment.status == AppointmentStatus.active, Appointment.reminder_sent_at),
+                else_=None
+            )
+        query = (
+            query
+            .values(**values)
+            .returning(Appointment.id, Appointment.client_id, Appointment.start_time)
+        )
+        row = (await db.execute(query)).first()
+        
+        if row is None:
+            await db.rollback()
+            return None
+        
+        # Календарь и напоминания узнают об изменении в той же транзакции
+        enqueue_calendar_sync(db, appointment_id, changed_fields=["status"])
+        await notify_appointment_changed(db, appointment_id)
+        await db.commit()
+        
+        return {
+            "id": row.id,
+            "client_id": row.client_id,
+            "start_time": row.start_time,
+            "status": status.value
+        }
+    except (SQLAlchemyError, ValueError) as e:
+        logger.error(f"Error in update_appointment_status: {e}")
+        await db.rollback()
+        return None
+
+async def complete_past_appointments(db: AsyncSession, now: Optional[datetime] = None) -> List[int]:
+    """
+    Перевод всех прошедших активных записей в статус completed одним запросом
+    (индекс idx_appointment_active_end). Клиенты с завершённой записью
+    перестают считаться новыми. Возвращает ID завершённых записей
+    """
+    try:
+        now = now or datetime.now()
+        result = await db.execute(
+            update(Appointment)
+            .where(
+                Appointment.status == AppointmentStatus.active,
+                Appointment.end_time <= now,
+                # Отсекает будущие секции таблицы
+                Appointment.start_time <= now
+            )
+            .values(status=AppointmentStatus.completed, updated_at=func.now())
+            .returning(Appointment.id, Appointment.client_id)
+        )
+        rows = result.all()
+        if not rows:
+            await db.rollback()
+            return []
+        
+        client_ids = {row.client_id for row in rows if row.client_id is not None}
+        if client_ids:
+            await db.execute(
+                update(Client)
+                .where(Client.id.in_(client_ids), Client.is_first_visit.is_(True))
+                .values(is_first_visit=False)
+            )
+        
+        await db.commit()
+        return [row.id for row in rows]
+    except SQLAlchemyError as e:
+        logger.error(f"Error in complete_past_appointments: {e}")
+        await db.rollback()
+        return []
+
 async def delete_appointment(db: AsyncSession, appointment_id: int) -> bool:
     """
     Удаление записи
@@ -1746,8 +2165,11 @@ async def delete_appointment(db: AsyncSession, appointment_id: int) -> bool:
         if not appointment:
             return False
         
-        # Удаляем запись
+        # Удаляем запись и событие в календаре
+        if appointment.google_event_id:
+            enqueue_calendar_sync(db, appointment.id, "delete", appointment.google_event_id)
         await db.delete(appointment)
+        await notify_appointment_changed(db, appointment_id)
         await db.commit()
         return True
     except SQLAlchemyError as e:
@@ -1755,6 +2177,322 @@ async def delete_appointment(db: AsyncSession, appointment_id: int) -> bool:
         await db.rollback()
         return False
 
+# Канал PostgreSQL NOTIFY, в который публикуются ID изменённых записей
+APPOINTMENT_CHANGED_CHANNEL = "appointment_changed"
+
+async def notify_appointment_changed(db: AsyncSession, appointment_id: int) -> None:
+    """
+    Уведомление слушателей (планировщик напоминаний) об изменении записи.
+    NOTIFY доставляется только после коммита транзакции
+    """
+    await db.execute(select(func.pg_notify(APPOINTMENT_CHANGED_CHANNEL, str(appointment_id))))
+
+async def get_appointment_render_data(
+    db: AsyncSession,
+    procedure_ids: List[int],
+    master_id: Optional[int],
+    lang: str = "UKR"
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Процедуры и мастер для текста записи одним запросом
+    (имя мастера - скалярный подзапрос к каждой строке процедур).
+    Названия процедур берутся из таблиц переводов (get_name); переводы
+    процедур, которых там ещё нет, догружаются и добавляются в таблицы
+    """
+    try:
+        master_name = select(Master.name).where(Master.id == master_id).scalar_subquery()
+        if not procedure_ids:
+            result = await db.execute(select(master_name))
+            name = result.scalar()
+            return [], ({"id": master_id, "name": name} if name is not None else None)
+        
+        query = (
+            select(
+                Procedure.id,
+                Procedure.base_price,
+                Procedure.discount,
+                master_name.label("master_name")
+            )
+            .where(Procedure.id.in_(procedure_ids))
+        )
+        result = await db.execute(query)
+        
+        procedures: Dict[int, Dict[str, Any]] = {}
+        master = None
+        for proc_id, base_price, discount, master_row_name in result.all():
+            procedures[proc_id] = {
+                "id": proc_id,
+                "name": get_name("procedure", proc_id, lang),
+                "base_price": base_price,
+                "discount": discount or 0
+            }
+            if master is None and master_row_name is not None:
+                master = {"id": master_id, "name": master_row_name}
+        
+        unknown = [proc_id for proc_id, procedure in procedures.items() if procedure["name"] is None]
+        if unknown:
+            names_result = await db.execute(
+                select(ProcedureTranslation.procedure_id, ProcedureTranslation.lang, ProcedureTranslation.name)
+                .where(ProcedureTranslation.procedure_id.in_(unknown))
+            )
+            merge_catalog_names(
+                ("procedure", proc_id, trans_lang, name) for proc_id, trans_lang, name in names_result.all()
+            )
+            for proc_id in unknown:
+                procedures[proc_id]["name"] = get_name("procedure", proc_id, lang, default="")
+        
+        # Порядок процедур как в выборе клиента
+        return [procedures[proc_id] for proc_id in procedure_ids if proc_id in procedures], master
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_appointment_render_data: {e}")
+        return [], None
+
+# Функции для напоминаний о записях
+def _pending_reminder_filter():
+    """
+    Активные записи, напоминание о которых ещё не отправлено
+    """
+    return and_(
+        Appointment.status == AppointmentStatus.active,
+        Appointment.reminder_sent_at.is_(None)
+    )
+
+async def get_pending_reminders(db: AsyncSession, start: datetime, end: datetime) -> List[Tuple[int, datetime]]:
+    """
+    ID и время начала записей в окне [start, end), по которым нужно напоминание
+    """
+    try:
+        query = select(Appointment.id, Appointment.start_time).where(
+            _pending_reminder_filter(),
+            Appointment.start_time >= start,
+            Appointment.start_time < end
+        )
+        result = await db.execute(query)
+        return [(appointment_id, start_time) for appointment_id, start_time in result.all()]
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_pending_reminders: {e}")
+        return []
+
+async def get_reminder_times(db: AsyncSession, appointment_ids: List[int]) -> Dict[int, datetime]:
+    """
+    Время начала указанных записей, если напоминание по ним ещё нужно
+    (отменённые, удалённые и уже напомненные записи в результат не попадают)
+    """
+    if not appointment_ids:
+        return {}
+    try:
+        query = select(Appointment.id, Appointment.start_time).where(
+            _pending_reminder_filter(),
+            Appointment.id.in_(appointment_ids)
+        )
+        result = await db.execute(query)
+        return {appointment_id: start_time for appointment_id, start_time in result.all()}
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_reminder_times: {e}")
+        return {}
+
+async def claim_reminder(db: AsyncSession, appointment_id: int, start_time: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Атомарная отметка об отправке напоминания.
+    Возвращает данные для сообщения или None, если запись уже напомнена,
+    отменена или перенесена (start_time не совпадает)
+    """
+    try:
+        result = await db.execute(
+            update(Appointment)
+            .where(
+                Appointment.id == appointment_id,
+                Appointment.start_time == start_time,
+                _pending_reminder_filter()
+            )
+            # updated_at не трогаем: отметка не меняет саму запись
+            .values(reminder_sent_at=func.now(), updated_at=Appointment.updated_at)
+            .returning(Appointment.client_id, Appointment.master_id, Appointment.procedures)
+        )
+        row = result.first()
+        if row is None:
+            await db.commit()
+            return None
+        client_id, master_id, procedure_ids = row
+        
+        client = await db.get(Client, client_id)
+        master = await db.get(Master, master_id)
+        await db.commit()
+        if client is None or not client.telegram_id:
+            return None
+        
+        names = {}
+        if procedure_ids:
+            names_result = await db.execute(
+                select(ProcedureTranslation.procedure_id, ProcedureTranslation.name).where(
+                    ProcedureTranslation.procedure_id.in_(procedure_ids),
+                    ProcedureTranslation.lang == client.lang
+                )
+            )
+            names = dict(names_result.all())
+        
+        return {
+            "id": appointment_id,
+            "telegram_id": client.telegram_id,
+            "lang": client.lang,
+            "master_name": master.name if master else "",
+            "procedure_names": [names.get(proc_id, f"#{proc_id}") for proc_id in procedure_ids or []],
+            "start_time": start_time
+        }
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Error in claim_reminder: {e}")
+        return None
+
+async def release_reminder(db: AsyncSession, appointment_id: int) -> bool:
+    """
+    Снятие отметки об отправке (сообщение не удалось доставить)
+    """
+    try:
+        await db.execute(
+            update(Appointment)
+            .where(Appointment.id == appointment_id)
+            .values(reminder_sent_at=None, updated_at=Appointment.updated_at)
+        )
+        await db.commit()
+        return True
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Error in release_reminder: {e}")
+        return False
+
+# Функции для ICS-календаря мастера
+def _master_calendar_filter(master_id: int, since: datetime):
+    """
+    Записи, которые попадают в календарь мастера
+    """
+    return and_(
+        Appointment.master_id == master_id,
+        Appointment.status != AppointmentStatus.canceled,
+        Appointment.start_time >= since
+    )
+
+def _calendar_updated_at():
+    """
+    Время изменения события календаря: в нём есть имя и телефон клиента,
+    поэтому учитывается и время изменения клиента
+    """
+    return func.greatest(Appointment.updated_at, Client.updated_at)
+
+async def get_master_calendar_version(db: AsyncSession, master_id: int, since: datetime) -> Optional[Tuple[int, Optional[datetime]]]:
+    """
+    Версия календаря мастера: количество записей и время последнего изменения.
+    Один агрегирующий запрос, без загрузки самих записей
+    """
+    try:
+        query = (
+            select(func.count(Appointment.id), func.max(_calendar_updated_at()))
+            .outerjoin(Client, Client.id == Appointment.client_id)
+            .where(_master_calendar_filter(master_id, since))
+        )
+        result = await db.execute(query)
+        count, last_updated = result.one()
+        return count, last_updated
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_master_calendar_version: {e}")
+        return None
+
+async def get_master_calendar_entries(db: AsyncSession, master_id: int, since: datetime) -> Dict[int, datetime]:
+    """
+    ID и время изменения записей календаря мастера
+    """
+    try:
+        query = (
+            select(Appointment.id, _calendar_updated_at())
+            .outerjoin(Client, Client.id == Appointment.client_id)
+            .where(_master_calendar_filter(master_id, since))
+        )
+        result = await db.execute(query)
+        return {appointment_id: updated_at for appointment_id, updated_at in result.all()}
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_master_calendar_entries: {e}")
+        return {}
+
+async def get_calendar_appointments(db: AsyncSession, appointment_ids: List[int], lang: str = "UKR") -> List[Dict[str, Any]]:
+    """
+    Данные записей для календаря: клиент и названия процедур (два запроса на все записи)
+    """
+    if not appointment_ids:
+        return []
+    try:
+        query = select(Appointment).where(Appointment.id.in_(appointment_ids)).options(
+            joinedload(Appointment.client)
+        )
+        result = await db.execute(query)
+        appointments = result.unique().scalars().all()
+        
+        procedure_ids = {proc_id for appointment in appointments for proc_id in appointment.procedures or []}
+        names = {}
+        if procedure_ids:
+            names_result = await db.execute(
+                select(ProcedureTranslation.procedure_id, ProcedureTranslation.name).where(
+                    ProcedureTranslation.procedure_id.in_(procedure_ids),
+                    ProcedureTranslation.lang == lang
+                )
+            )
+            names = dict(names_result.all())
+        
+        return [
+            {
+                "id": appointment.id,
+                "client_name": appointment.client.name if appointment.client else "",
+                "client_phone": appointment.client.phone if appointment.client else "",
+                "procedure_names": [names.get(proc_id, f"#{proc_id}") for proc_id in appointment.procedures or []],
+                "start_time": appointment.start_time,
+                "end_time": appointment.end_time,
+                "status": appointment.status.value,
+                "created_at": appointment.created_at,
+                # Как в _calendar_updated_at
+                "updated_at": max(
+                    (value for value in (
+                        appointment.updated_at, appointment.client.updated_at if appointment.client else None
+                    ) if value is not None),
+                    default=None
+                )
+            }
+            for appointment in appointments
+        ]
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_calendar_appointments: {e}")
+        return []
+
+# Функции для работы с очередью синхронизации календаря
+
+# Синхронизация с Google Calendar включена (иначе очередь не заполняется:
+# без воркера её некому разбирать)
+CALENDAR_SYNC_ENABLED = os.getenv("CALENDAR_SYNC_ENABLED", "false").lower() == "true"
+
+# Поля записи, которые отражаются в событии календаря
+CALENDAR_SYNC_FIELDS = ("client_id", "master_id", "procedures", "start_time", "end_time", "status")
+
+def enqueue_calendar_sync(
+    db: AsyncSession,
+    appointment_id: int,
+    operation: str = "upsert",
+    google_event_id: Optional[str] = None,
+    changed_fields: Optional[List[str]] = None
+) -> None:
+    """
+    Добавление задачи синхронизации записи с Google Calendar.
+    Задача сохраняется в той же транзакции, что и изменение записи,
+    и обрабатывается фоновым воркером (src/utils/calendar_outbox.py).
+    changed_fields=None означает, что событие нужно собрать целиком.
+    Если синхронизация выключена, задача не создаётся
+    """
+    if not CALENDAR_SYNC_ENABLED:
+        return
+    db.add(CalendarOutbox(
+        appointment_id=appointment_id,
+        operation=operation,
+        google_event_id=google_event_id,
+        changed_fields=changed_fields
+    ))
+
 # Функция для расчета продолжительности приема
 async def calculate_appointment_duration(db: AsyncSession, procedure_ids: List[int], time_coeff: float = 1.0, is_first_visit: bool = False) -> int:
     """
@@ -2007,9 +2745,6 @@ async def add_database_indexes(db: AsyncSession) -> None:
         await db.execute(
             text("CREATE INDEX IF NOT EXISTS idx_appointment_master_id ON appointment (master_id)")
         )
-        await db.execute(
-            text("CREATE INDEX IF NOT EXISTS idx_appointment_procedure_id ON appointment (procedure_id)")
-        )
         await db.execute(
             text("CREATE INDEX IF NOT EXISTS idx_appointment_workplace_id ON appointment (workplace_id)")
         )
@@ -2017,6 +2752,51 @@ async def add_database_indexes(db: AsyncSession) -> None:
             text("CREATE INDEX IF NOT EXISTS idx_appointment_status ON appointment (status)")
         )
         
+        # Поиск клиентов: триграммы по имени и цифрам телефона, точный telegram_id
+        await db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_client_name_trgm ON client USING gin (name gin_trgm_ops)")
+        )
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_client_phone_digits_trgm ON client "
+                 "USING gin ((regexp_replace(phone, '\\D', '', 'g')) gin_trgm_ops)")
+        )
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_client_phone_digits_prefix ON client "
+                 "((regexp_replace(phone, '\\D', '', 'g')) text_pattern_ops)")
+        )
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_client_telegram_id ON client (telegram_id)")
+        )
+        
+        # Один клиент на номер телефона. Пока в базе есть дубликаты, индекс не
+        # создаётся: их нужно объединить скриптом dedupe_clients.py
+        try:
+            async with db.begin_nested():
+                await db.execute(
+                    text("CREATE UNIQUE INDEX IF NOT EXISTS idx_client_phone_normalized ON client (phone_normalized) "
+                         "WHERE phone_normalized IS NOT NULL")
+                )
+        except IntegrityError as e:
+            logger.warning(f"Unique phone index not created, run dedupe_clients.py: {e}")
+        
+        # Поиск записей по процедурам: procedures @> ARRAY[...] / && ARRAY[...]
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_appointment_procedures ON appointment USING gin (procedures)")
+        )
+        
+        # Индекс для завершения прошедших записей (только активные)
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_appointment_active_end ON appointment (end_time) "
+                 "WHERE status = 'active'")
+        )
+        
+        # Индекс для загрузки окна напоминаний (только неотправленные активные записи)
+        await db.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_appointment_reminder_pending ON appointment (start_time) "
+                 "WHERE status = 'active' AND reminder_sent_at IS NULL")
+        )
+        
         await db.commit()
         logger.info("Database indexes added successfully")
     except SQLAlchemyError as e:
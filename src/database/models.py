@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, ARRAY, Text, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, Enum, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -13,11 +14,20 @@ class AppointmentStatus(enum.Enum):
 
 class Client(Base):
     __tablename__ = "client"
+    # Нужен для ON CONFLICT в crud.register_client; на существующей базе
+    # создаётся migrations/add_client_phone_normalized.sql
+    __table_args__ = (
+        Index(
+            "idx_client_phone_normalized", "phone_normalized",
+            unique=True, postgresql_where=text("phone_normalized IS NOT NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(String(100), nullable=True)
     name = Column(String(100), nullable=False)
     phone = Column(String(20), nullable=True)
+    phone_normalized = Column(String(16), nullable=True)
     email = Column(String(100), nullable=True)
     lang = Column(String(10), nullable=False, server_default="ru")
     time_coeff = Column(Float, nullable=False, server_default="1.0")
@@ -127,16 +137,21 @@ class WorkSlot(Base):
 
 class Appointment(Base):
     __tablename__ = "appointment"
+    # Секции по месяцам start_time, см. src/database/partitions.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (start_time)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Ключ секционирования должен входить в первичный ключ
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     client_id = Column(Integer, ForeignKey("client.id", ondelete="CASCADE"))
     master_id = Column(Integer, ForeignKey("master.id", ondelete="CASCADE"))
     workplace_id = Column(Integer, ForeignKey("workplace.id", ondelete="CASCADE"))
-    procedures = Column(ARRAY(Integer), nullable=False)  # Array of procedure IDs
-    start_time = Column(DateTime, nullable=False)
+    # Array of procedure IDs; GIN index idx_appointment_procedures for @> / &&
+    procedures = Column(ARRAY(Integer), nullable=False)
+    start_time = Column(DateTime, primary_key=True)
     end_time = Column(DateTime, nullable=False)
     status = Column(Enum(AppointmentStatus), default=AppointmentStatus.active)
     google_event_id = Column(String(100), nullable=True)
+    reminder_sent_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -153,6 +168,8 @@ class Admin(Base):
     username = Column(String(100), nullable=False)
     password_hash = Column(String(255), nullable=False)
     is_superadmin = Column(Boolean, default=False)
+    # Увеличение версии отзывает все выданные токены
+    token_version = Column(Integer, nullable=False, server_default="0")
     created_at = Column(DateTime, server_default=func.now())
 
     logs = relationship("AdminLog", back_populates="admin")
@@ -160,11 +177,39 @@ class Admin(Base):
 
 class AdminLog(Base):
     __tablename__ = "admin_log"
+    # Секции по месяцам, см. src/database/partitions.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Ключ секционирования должен входить в первичный ключ
+    id = Column(Integer, primary_key=True, autoincrement=True)
     admin_id = Column(Integer, ForeignKey("admin.id", ondelete="CASCADE"))
     action = Column(String(255), nullable=False)
-    timestamp = Column(DateTime, server_default=func.now())
+    timestamp = Column(DateTime, primary_key=True, server_default=func.now())
     details = Column(Text, nullable=True)
 
     admin = relationship("Admin", back_populates="logs")
+
+
+class CalendarOutbox(Base):
+    __tablename__ = "calendar_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Без внешнего ключа: задача на удаление события должна пережить удаление записи
+    appointment_id = Column(Integer, nullable=False, index=True)
+    operation = Column(String(20), nullable=False)  # upsert / delete
+    google_event_id = Column(String(100), nullable=True)
+    changed_fields = Column(ARRAY(String(50)), nullable=True)  # NULL - все поля
+    attempts = Column(Integer, nullable=False, server_default="0")
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    # Строка взята воркером; до available_at (аренда) её не берут другие воркеры
+    claimed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class CalendarSyncState(Base):
+    __tablename__ = "calendar_sync_state"
+
+    calendar_id = Column(String(255), primary_key=True)
+    sync_token = Column(Text, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
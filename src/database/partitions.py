@@ -0,0 +1,190 @@
+"""
+Monthly range partitions.
+
+Tables declared with ``postgresql_partition_by = "RANGE (<column>)"`` get one
+partition per calendar month, named ``<table>_pYYYYMM``, plus a
+``<table>_default`` partition that catches rows outside the created range.
+The maintenance task keeps PARTITION_MONTHS_AHEAD future partitions ready;
+rows that already landed in the default partition are moved into the new
+partition when it is created. Partitions past the table's retention are
+removed with DETACH + DROP (instant compared to a DELETE over the whole
+table) or, for archived tables, detached and moved to the archive schema,
+so queries on the live table only ever see a bounded number of partitions.
+"""
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import text
+
+from src.database.base import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))
+ADMIN_LOG_RETENTION_MONTHS = int(os.getenv("ADMIN_LOG_RETENTION_MONTHS", "12"))
+APPOINTMENT_ARCHIVE_MONTHS = int(os.getenv("APPOINTMENT_ARCHIVE_MONTHS", "24"))
+ARCHIVE_SCHEMA = os.getenv("ARCHIVE_SCHEMA", "archive")
+
+
+@dataclass(frozen=True)
+class PartitionPolicy:
+    table: str
+    column: str
+    # Секции старше этого числа месяцев удаляются (None - хранить бессрочно)
+    retention_months: Optional[int] = None
+    # Секции старше этого числа месяцев переносятся в схему ARCHIVE_SCHEMA
+    archive_months: Optional[int] = None
+    # Секция, в которой есть такие строки, не архивируется
+    archive_blocker: Optional[str] = None
+
+
+PARTITION_POLICIES: List[PartitionPolicy] = [
+    PartitionPolicy("admin_log", "timestamp", retention_months=ADMIN_LOG_RETENTION_MONTHS or None),
+    PartitionPolicy(
+        "appointment", "start_time",
+        archive_months=APPOINTMENT_ARCHIVE_MONTHS or None,
+        archive_blocker="status = 'active'"
+    ),
+]
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    month_index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+async def list_partitions(db: AsyncSession, table: str) -> List[str]:
+    """Names of the partitions attached to the table"""
+    result = await db.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table}
+    )
+    return [row[0] for row in result]
+
+
+async def ensure_partitions(db: AsyncSession, policy: PartitionPolicy, first_month: datetime, months: int) -> List[str]:
+    """Create the default partition and monthly partitions starting at first_month"""
+    table = policy.table
+    existing = set(await list_partitions(db, table))
+    created = []
+
+    if f"{table}_default" not in existing:
+        await db.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        created.append(f"{table}_default")
+
+    month = month_start(first_month)
+    for _ in range(months):
+        next_month = add_months(month, 1)
+        name = partition_name(table, month)
+        if name not in existing:
+            # Строки этого месяца, уже попавшие в секцию по умолчанию, переносятся в новую
+            await db.execute(text(
+                f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            await db.execute(text(
+                f"WITH moved AS (DELETE FROM {table}_default "
+                f"WHERE \"{policy.column}\" >= '{month:%Y-%m-%d}' AND \"{policy.column}\" < '{next_month:%Y-%m-%d}' "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            ))
+            await db.execute(text(
+                f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"
+            ))
+            created.append(name)
+        month = next_month
+    return created
+
+
+async def _expired_partitions(db: AsyncSession, table: str, before: datetime) -> List[str]:
+    """Monthly partitions that end before the given month"""
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{6}})$")
+    expired = []
+    for name in await list_partitions(db, table):
+        match = pattern.match(name)
+        if match and add_months(datetime.strptime(match.group(1), "%Y%m"), 1) <= before:
+            expired.append(name)
+    return sorted(expired)
+
+
+async def drop_partitions_before(db: AsyncSession, table: str, before: datetime) -> List[str]:
+    """Detach and drop monthly partitions that end before the given month"""
+    dropped = []
+    for name in await _expired_partitions(db, table, before):
+        await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+async def archive_partitions_before(db: AsyncSession, policy: PartitionPolicy, before: datetime) -> List[str]:
+    """Detach monthly partitions that end before the given month and move them to ARCHIVE_SCHEMA"""
+    archived = []
+    await db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+    for name in await _expired_partitions(db, policy.table, before):
+        if policy.archive_blocker:
+            blocked = await db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE {policy.archive_blocker})"))
+            if blocked:
+                logger.warning(f"Partition {name} not archived: has rows with {policy.archive_blocker}")
+                continue
+        await db.execute(text(f"ALTER TABLE {policy.table} DETACH PARTITION {name}"))
+        await db.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+        archived.append(name)
+    return archived
+
+
+async def maintain_partitions(db: AsyncSession, now: Optional[datetime] = None) -> None:
+    """Create upcoming partitions and drop or archive expired ones for every policy"""
+    current = month_start(now or datetime.now())
+    for policy in PARTITION_POLICIES:
+        try:
+            # API и бот могут обслуживать секции одновременно
+            await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": policy.table})
+            created = await ensure_partitions(db, policy, current, PARTITION_MONTHS_AHEAD + 1)
+            removed = []
+            if policy.retention_months:
+                removed += await drop_partitions_before(
+                    db, policy.table, add_months(current, -policy.retention_months)
+                )
+            if policy.archive_months:
+                removed += await archive_partitions_before(
+                    db, policy, add_months(current, -policy.archive_months)
+                )
+            await db.commit()
+            if created or removed:
+                logger.info(f"Partitions of {policy.table}: created {created}, removed {removed}")
+        except SQLAlchemyError as e:
+            logger.error(f"Error in maintain_partitions for {policy.table}: {e}")
+            await db.rollback()
+
+
+async def run_partition_maintenance(interval: float = PARTITION_MAINTENANCE_INTERVAL) -> None:
+    """Run partition maintenance forever (until cancelled)"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await maintain_partitions(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in partition maintenance: {e}")
+        await asyncio.sleep(interval)
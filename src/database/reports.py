@@ -0,0 +1,249 @@
+"""
+Salon reports.
+
+Daily aggregates live in materialized views that are refreshed in the
+background with REFRESH MATERIALIZED VIEW CONCURRENTLY (readers are not
+blocked); report requests only read and sum the small per-day rows:
+
+- report_daily_revenue: per day, master and procedure - booked and completed
+  procedures and revenue of completed ones (base_price minus discount %)
+- report_daily_master: per day and master - appointments by status, booked
+  minutes and work slot minutes (utilization = booked / slot minutes)
+
+Revenue uses the current procedure prices: the schema keeps no price history.
+
+REPORT_VIEWS is the only definition of the views: they are created on API
+startup or with ``python -m src.database.reports``. Every API process runs
+the refresh loop; an advisory lock lets only one of them refresh at a time,
+the others skip that round.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import text
+
+from src.database.base import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+REPORTS_REFRESH_INTERVAL = float(os.getenv("REPORTS_REFRESH_INTERVAL", "600"))
+
+# Имя представления -> (запрос, столбцы уникального индекса для CONCURRENTLY)
+REPORT_VIEWS = {
+    "report_daily_revenue": (
+        """
+        SELECT
+            CAST(a.start_time AS date) AS day,
+            a.master_id,
+            p.id AS procedure_id,
+            count(*) FILTER (WHERE a.status <> 'canceled') AS booked,
+            count(*) FILTER (WHERE a.status = 'completed') AS completed,
+            COALESCE(sum(p.base_price * (1 - COALESCE(p.discount, 0) / 100.0))
+                     FILTER (WHERE a.status = 'completed'), 0) AS revenue
+        FROM appointment a
+        CROSS JOIN LATERAL unnest(a.procedures) AS ap(procedure_id)
+        JOIN procedure p ON p.id = ap.procedure_id
+        WHERE a.master_id IS NOT NULL
+        GROUP BY 1, 2, 3
+        """,
+        "day, master_id, procedure_id"
+    ),
+    "report_daily_master": (
+        """
+        WITH booked AS (
+            SELECT
+                CAST(start_time AS date) AS day,
+                master_id,
+                count(*) AS appointments,
+                count(*) FILTER (WHERE status = 'completed') AS completed,
+                count(*) FILTER (WHERE status = 'canceled') AS canceled,
+                COALESCE(sum(EXTRACT(EPOCH FROM end_time - start_time) / 60)
+                         FILTER (WHERE status <> 'canceled'), 0) AS booked_minutes
+            FROM appointment
+            WHERE master_id IS NOT NULL
+            GROUP BY 1, 2
+        ), slots AS (
+            SELECT
+                CAST(start_time AS date) AS day,
+                master_id,
+                sum(EXTRACT(EPOCH FROM end_time - start_time) / 60) AS slot_minutes
+            FROM work_slot
+            WHERE master_id IS NOT NULL
+            GROUP BY 1, 2
+        )
+        SELECT
+            COALESCE(booked.day, slots.day) AS day,
+            COALESCE(booked.master_id, slots.master_id) AS master_id,
+            COALESCE(booked.appointments, 0) AS appointments,
+            COALESCE(booked.completed, 0) AS completed,
+            COALESCE(booked.canceled, 0) AS canceled,
+            COALESCE(booked.booked_minutes, 0) AS booked_minutes,
+            COALESCE(slots.slot_minutes, 0) AS slot_minutes
+        FROM booked
+        FULL OUTER JOIN slots ON slots.day = booked.day AND slots.master_id = booked.master_id
+        """,
+        "day, master_id"
+    ),
+}
+
+# Время последнего обновления представлений, выполненного этим процессом
+report_refreshed_at: Optional[datetime] = None
+
+
+async def create_report_views(db: AsyncSession) -> None:
+    """Create report views and their unique indexes if they don't exist"""
+    try:
+        for name, (query, key) in REPORT_VIEWS.items():
+            await db.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query}"))
+            await db.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{name} ON {name} ({key})"))
+        await db.commit()
+    except SQLAlchemyError as e:
+        logger.error(f"Error in create_report_views: {e}")
+        await db.rollback()
+
+
+async def refresh_report_views(db: AsyncSession) -> bool:
+    """Refresh report views without blocking readers.
+
+    False if the refresh failed or another process is refreshing the views.
+    """
+    global report_refreshed_at
+    try:
+        # Представления обновляет только один процесс API, остальные пропускают
+        result = await db.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": "report_views"}
+        )
+        if not result.scalar():
+            await db.rollback()
+            return False
+        for name in REPORT_VIEWS:
+            await db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}"))
+        await db.commit()
+        report_refreshed_at = datetime.now()
+        return True
+    except SQLAlchemyError as e:
+        logger.error(f"Error in refresh_report_views: {e}")
+        await db.rollback()
+        return False
+
+
+async def get_report(
+    db: AsyncSession,
+    date_from: date,
+    date_to: date,
+    master_id: Optional[int] = None,
+    lang: str = "UKR"
+) -> Optional[Dict[str, Any]]:
+    """Report for the period [date_from, date_to] read from the report views"""
+    try:
+        params = {"date_from": date_from, "date_to": date_to, "master_id": master_id, "lang": lang}
+        master_filter = "AND r.master_id = :master_id" if master_id is not None else ""
+
+        result = await db.execute(text(f"""
+            SELECT
+                r.master_id, m.name AS master_name,
+                sum(r.appointments) AS appointments, sum(r.completed) AS completed,
+                sum(r.canceled) AS canceled,
+                sum(r.booked_minutes) AS booked_minutes, sum(r.slot_minutes) AS slot_minutes,
+                COALESCE(max(rev.revenue), 0) AS revenue
+            FROM report_daily_master r
+            JOIN master m ON m.id = r.master_id
+            LEFT JOIN (
+                SELECT master_id, sum(revenue) AS revenue
+                FROM report_daily_revenue
+                WHERE day BETWEEN :date_from AND :date_to
+                GROUP BY master_id
+            ) rev ON rev.master_id = r.master_id
+            WHERE r.day BETWEEN :date_from AND :date_to {master_filter}
+            GROUP BY r.master_id, m.name
+            ORDER BY m.name
+        """), params)
+        masters = []
+        for row in result:
+            masters.append({
+                "master_id": row.master_id,
+                "master_name": row.master_name,
+                "appointments": int(row.appointments),
+                "completed": int(row.completed),
+                "canceled": int(row.canceled),
+                "cancel_rate": round(int(row.canceled) / int(row.appointments), 4) if row.appointments else 0.0,
+                "booked_minutes": float(row.booked_minutes),
+                "slot_minutes": float(row.slot_minutes),
+                # None, если у мастера не было рабочих слотов
+                "utilization": round(float(row.booked_minutes) / float(row.slot_minutes), 4) if row.slot_minutes else None,
+                "revenue": round(float(row.revenue), 2),
+            })
+
+        result = await db.execute(text(f"""
+            SELECT
+                r.procedure_id, pt.name AS procedure_name,
+                sum(r.booked) AS booked, sum(r.completed) AS completed, sum(r.revenue) AS revenue
+            FROM report_daily_revenue r
+            LEFT JOIN procedure_translation pt ON pt.procedure_id = r.procedure_id AND pt.lang = :lang
+            WHERE r.day BETWEEN :date_from AND :date_to {master_filter}
+            GROUP BY r.procedure_id, pt.name
+            ORDER BY revenue DESC
+        """), params)
+        procedures = [
+            {
+                "procedure_id": row.procedure_id,
+                "procedure_name": row.procedure_name,
+                "booked": int(row.booked),
+                "completed": int(row.completed),
+                "revenue": round(float(row.revenue), 2),
+            }
+            for row in result
+        ]
+
+        result = await db.execute(text(f"""
+            SELECT r.day, sum(r.completed) AS completed, sum(r.revenue) AS revenue
+            FROM report_daily_revenue r
+            WHERE r.day BETWEEN :date_from AND :date_to {master_filter}
+            GROUP BY r.day
+            ORDER BY r.day
+        """), params)
+        daily = [
+            {"day": row.day, "completed_procedures": int(row.completed), "revenue": round(float(row.revenue), 2)}
+            for row in result
+        ]
+
+        return {
+            "date_from": date_from,
+            "date_to": date_to,
+            "masters": masters,
+            "procedures": procedures,
+            "daily": daily,
+            "refreshed_at": report_refreshed_at,
+        }
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_report: {e}")
+        return None
+
+
+async def run_report_refresh(interval: float = REPORTS_REFRESH_INTERVAL) -> None:
+    """Refresh report views forever (until cancelled)"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await refresh_report_views(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in report refresh: {e}")
+        await asyncio.sleep(interval)
+
+
+async def _create_views() -> None:
+    async with AsyncSessionLocal() as db:
+        await create_report_views(db)
+
+
+if __name__ == "__main__":
+    # Создание представлений без запуска API: python -m src.database.reports
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_create_views())
@@ -0,0 +1,186 @@
+"""
+Schedule occupancy heatmaps.
+
+Work slots (capacity) and non-canceled appointments (booked time) for a date
+range are loaded as plain (group, start, end) rows - no ORM objects - into
+NumPy arrays of minutes since the start of the range. Every interval is
+spread over a timeline of HEATMAP_BUCKET_MINUTES buckets with a difference
+array: the partial first and last buckets get their exact minutes, the full
+buckets in between are marked by +1/-1 and recovered with one cumsum. The
+timeline is then folded into a weekday x bucket-of-day matrix per master or
+workplace; occupancy = booked minutes / slot minutes in each cell.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import DateTime
+
+from src.database.models import Appointment, AppointmentStatus, Master, WorkSlot, Workplace
+
+logger = logging.getLogger(__name__)
+
+HEATMAP_BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // HEATMAP_BUCKET_MINUTES
+
+# Группировка: столбец слота, столбец записи, модель с названиями
+HEATMAP_GROUPS = {
+    "master": (WorkSlot.master_id, Appointment.master_id, Master),
+    "workplace": (WorkSlot.workplace_id, Appointment.workplace_id, Workplace),
+}
+
+
+def _minutes_since(column, start: datetime):
+    return func.extract("epoch", column - literal(start, DateTime)) / 60
+
+
+async def _load_intervals(db: AsyncSession, query) -> np.ndarray:
+    """Rows (group_id, start_minute, end_minute) as a float array; NULL ids become NaN"""
+    result = await db.execute(query)
+    return np.array(result.all(), dtype=float).reshape(-1, 3)
+
+
+def bucket_minutes(
+    group_idx: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    groups: int,
+    buckets: int
+) -> np.ndarray:
+    """Minutes covered in every (group, bucket) cell by intervals [start, end) given in minutes"""
+    step = HEATMAP_BUCKET_MINUTES
+    starts = np.clip(starts, 0, buckets * step)
+    ends = np.clip(ends, 0, buckets * step)
+    keep = ends > starts
+    group_idx, starts, ends = group_idx[keep], starts[keep], ends[keep]
+
+    first = (starts // step).astype(np.int64)
+    # Конец ровно на границе относится к предыдущей корзине
+    last = (np.ceil(ends / step) - 1).astype(np.int64)
+    same = first == last
+
+    # Строка на группу, +1 столбец под -1 после последней корзины
+    width = buckets + 1
+    size = groups * width
+    row = group_idx * width
+
+    spans = ~same
+    partial = np.zeros(size)
+    partial += np.bincount(row[same] + first[same], weights=ends[same] - starts[same], minlength=size)
+    partial += np.bincount(row[spans] + first[spans], weights=(first[spans] + 1) * step - starts[spans], minlength=size)
+    partial += np.bincount(row[spans] + last[spans], weights=ends[spans] - last[spans] * step, minlength=size)
+
+    # Полные корзины между первой и последней: +1 / -1 и накопленная сумма
+    full = spans & (last > first + 1)
+    marks = np.bincount(row[full] + first[full] + 1, minlength=size)
+    marks -= np.bincount(row[full] + last[full], minlength=size)
+    covered = np.cumsum(marks.reshape(groups, width), axis=1) * step
+
+    return (partial.reshape(groups, width) + covered)[:, :buckets]
+
+
+def fold_by_weekday(timeline: np.ndarray, first_day: date) -> np.ndarray:
+    """Fold a (groups, days * BUCKETS_PER_DAY) timeline into (groups, 7, BUCKETS_PER_DAY)"""
+    groups = timeline.shape[0]
+    days = timeline.reshape(groups, timeline.shape[1] // BUCKETS_PER_DAY, BUCKETS_PER_DAY)
+    # Дополняем до целых недель, суммируем недели и сдвигаем так, чтобы 0 был понедельником
+    padded = np.pad(days, ((0, 0), (0, -days.shape[1] % 7), (0, 0)))
+    weeks = padded.reshape(groups, padded.shape[1] // 7, 7, BUCKETS_PER_DAY).sum(axis=1)
+    return np.roll(weeks, first_day.weekday(), axis=1)
+
+
+def build_heatmaps(
+    slots: np.ndarray,
+    appointments: np.ndarray,
+    first_day: date,
+    days: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Group ids and (groups, 7, BUCKETS_PER_DAY) matrices of slot and booked minutes"""
+    slots = slots[~np.isnan(slots[:, 0])]
+    appointments = appointments[~np.isnan(appointments[:, 0])]
+    group_ids, inverse = np.unique(np.concatenate([slots[:, 0], appointments[:, 0]]), return_inverse=True)
+    slot_idx, appointment_idx = inverse[:len(slots)], inverse[len(slots):]
+
+    buckets = days * BUCKETS_PER_DAY
+    capacity = bucket_minutes(slot_idx, slots[:, 1], slots[:, 2], len(group_ids), buckets)
+    booked = bucket_minutes(appointment_idx, appointments[:, 1], appointments[:, 2], len(group_ids), buckets)
+    return group_ids.astype(np.int64), fold_by_weekday(capacity, first_day), fold_by_weekday(booked, first_day)
+
+
+def occupancy(capacity: np.ndarray, booked: np.ndarray) -> np.ndarray:
+    """booked / capacity, NaN where there was no capacity"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(capacity > 0, booked / capacity, np.nan)
+
+
+def _heatmap_rows(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    rounded = np.round(matrix, 3)
+    return [[None if np.isnan(value) else float(value) for value in row] for row in rounded]
+
+
+async def get_occupancy_heatmaps(
+    db: AsyncSession,
+    date_from: date,
+    date_to: date,
+    group_by: str = "master"
+) -> Optional[Dict[str, Any]]:
+    """Weekday x time-of-day occupancy per master or workplace for [date_from, date_to]"""
+    slot_column, appointment_column, model = HEATMAP_GROUPS[group_by]
+    start = datetime.combine(date_from, time.min)
+    end = datetime.combine(date_to + timedelta(days=1), time.min)
+    days = (date_to - date_from).days + 1
+
+    try:
+        slots = await _load_intervals(db, select(
+            slot_column, _minutes_since(WorkSlot.start_time, start), _minutes_since(WorkSlot.end_time, start)
+        ).where(WorkSlot.start_time < end, WorkSlot.end_time > start))
+        appointments = await _load_intervals(db, select(
+            appointment_column, _minutes_since(Appointment.start_time, start), _minutes_since(Appointment.end_time, start)
+        ).where(
+            # Условие по start_time отсекает лишние секции appointment
+            Appointment.start_time < end,
+            Appointment.start_time >= start - timedelta(days=1),
+            Appointment.end_time > start,
+            Appointment.status != AppointmentStatus.canceled
+        ))
+        result = await db.execute(select(model.id, model.name))
+        names = dict(result.all())
+    except SQLAlchemyError as e:
+        logger.error(f"Error in get_occupancy_heatmaps: {e}")
+        return None
+
+    # Расчёт по году данных занимает доли секунды, но не должен держать цикл событий
+    group_ids, capacity, booked = await asyncio.to_thread(build_heatmaps, slots, appointments, date_from, days)
+    total_capacity = capacity.sum(axis=0)
+    total_booked = booked.sum(axis=0)
+
+    items = []
+    for i, group_id in enumerate(group_ids.tolist()):
+        slot_minutes = float(capacity[i].sum())
+        booked_minutes = float(booked[i].sum())
+        items.append({
+            "id": group_id,
+            "name": names.get(group_id),
+            "slot_hours": round(slot_minutes / 60, 2),
+            "booked_hours": round(booked_minutes / 60, 2),
+            "occupancy": round(booked_minutes / slot_minutes, 4) if slot_minutes else None,
+            "heatmap": _heatmap_rows(occupancy(capacity[i], booked[i])),
+        })
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "group_by": group_by,
+        "bucket_minutes": HEATMAP_BUCKET_MINUTES,
+        "total": {
+            "slot_hours": round(float(total_capacity.sum()) / 60, 2),
+            "booked_hours": round(float(total_booked.sum()) / 60, 2),
+            "heatmap": _heatmap_rows(occupancy(total_capacity, total_booked)),
+        },
+        "items": items,
+    }
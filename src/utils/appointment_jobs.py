@@ -0,0 +1,34 @@
+"""
+Periodic appointment status job.
+
+Active appointments whose end_time has passed are switched to completed
+with one UPDATE ... RETURNING (crud.complete_past_appointments), and their
+clients stop being first-time visitors. Keeping finished appointments out of
+the 'active' status keeps the partial indexes on status = 'active' small.
+"""
+import asyncio
+import logging
+import os
+
+from src.database import crud
+from src.database.base import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+APPOINTMENT_COMPLETE_INTERVAL = float(os.getenv("APPOINTMENT_COMPLETE_INTERVAL", "300"))
+
+
+async def run_appointment_completion_worker(interval: float = APPOINTMENT_COMPLETE_INTERVAL) -> None:
+    """Complete past appointments forever (until cancelled)"""
+    logger.info("Appointment completion worker started")
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                completed = await crud.complete_past_appointments(db)
+            if completed:
+                logger.info(f"Completed {len(completed)} past appointments")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in appointment completion worker: {e}")
+        await asyncio.sleep(interval)
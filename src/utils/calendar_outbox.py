@@ -0,0 +1,479 @@
+"""
+Background worker that syncs appointments with Google Calendar.
+
+Push: appointment changes are written to the calendar_outbox table in the
+same transaction as the appointment itself (see crud.enqueue_calendar_sync),
+so booking never waits for Google. The worker claims pending rows with
+SELECT ... FOR UPDATE SKIP LOCKED and commits the claim as a lease
+(claimed_at, available_at = now + CALENDAR_CLAIM_LEASE) before calling
+Google, so no transaction stays open during network calls and several
+workers can run side by side; rows of a crashed worker are picked up again
+when the lease expires. The worker collapses all rows of one appointment
+into a single operation (insert, PATCH of the changed fields only, or
+delete) and sends the operations of the whole batch as Calendar batch
+requests (up to 50 calls per HTTP request). google_event_id is stored back
+into the appointment.
+
+Pull: remote edits are read incrementally with a syncToken and applied to
+the appointments they belong to (matched by the appointment_id private
+extended property).
+
+Usage:
+    python -m src.utils.calendar_outbox
+    python -m src.utils.calendar_outbox --resync 2024-05   # re-push a month
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from googleapiclient.errors import HttpError
+from sqlalchemy import select, update, delete, insert, func, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from src.database.base import AsyncSessionLocal
+from src.database import crud
+from src.database.crud import CALENDAR_SYNC_ENABLED
+from src.database.models import (
+    Appointment, AppointmentStatus, CalendarOutbox, CalendarSyncState, ProcedureTranslation
+)
+from src.utils import google_calendar
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "2"))
+CALENDAR_PULL_INTERVAL = float(os.getenv("CALENDAR_PULL_INTERVAL", "60"))
+CALENDAR_SYNC_BATCH_SIZE = int(os.getenv("CALENDAR_SYNC_BATCH_SIZE", "200"))
+CALENDAR_LANG = os.getenv("CALENDAR_LANG", "UKR")
+CALENDAR_CLAIM_LEASE = timedelta(seconds=float(os.getenv("CALENDAR_CLAIM_LEASE", "300")))
+MAX_RETRY_DELAY = 3600
+
+# Private extended property that links an event to its appointment
+APPOINTMENT_PROPERTY = "appointment_id"
+
+# Event fields affected by appointment fields
+EVENT_FIELDS = {
+    "start_time": {"start"},
+    "end_time": {"end"},
+    "procedures": {"summary", "description"},
+    "client_id": {"summary", "description"},
+    "master_id": {"summary", "description"},
+}
+
+
+@dataclass
+class CalendarOperation:
+    """One calendar call planned for an appointment"""
+    request_id: str
+    appointment_id: int
+    kind: str  # insert / patch / delete
+    event_id: Optional[str] = None
+    body: Dict[str, Any] = field(default_factory=dict)
+
+    def build_request(self, service):
+        events = service.events()
+        calendar_id = google_calendar.calendar_service.calendar_id
+        if self.kind == "insert":
+            return events.insert(calendarId=calendar_id, body=self.body)
+        if self.kind == "patch":
+            return events.patch(calendarId=calendar_id, eventId=self.event_id, body=self.body)
+        return events.delete(calendarId=calendar_id, eventId=self.event_id)
+
+
+def _is_not_found(error: Optional[Exception]) -> bool:
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff for failed rows"""
+    return timedelta(seconds=min(MAX_RETRY_DELAY, 2 ** attempts))
+
+
+async def _procedure_names(db: AsyncSession, procedure_ids: Iterable[int]) -> Dict[int, str]:
+    procedure_ids = set(procedure_ids)
+    if not procedure_ids:
+        return {}
+    result = await db.execute(
+        select(ProcedureTranslation.procedure_id, ProcedureTranslation.name)
+        .where(
+            ProcedureTranslation.procedure_id.in_(procedure_ids),
+            ProcedureTranslation.lang == CALENDAR_LANG
+        )
+    )
+    return dict(result.all())
+
+
+def build_event(appointment: Appointment, procedure_names: Dict[int, str], fields: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """Build event resource for an appointment.
+
+    Args:
+        appointment: Appointment with loaded client and master
+        procedure_names: Procedure names by ID
+        fields: Event fields to include (None - full event for insert)
+    """
+    names = [procedure_names.get(proc_id, f"#{proc_id}") for proc_id in appointment.procedures or []]
+    client = appointment.client
+    description_lines = [
+        f"Клиент: {client.name if client else ''}",
+        f"Телефон: {client.phone or ''}" if client else "",
+        f"Мастер: {appointment.master.name if appointment.master else ''}",
+        f"Процедуры: {', '.join(names)}",
+    ]
+    event = google_calendar.build_event_body(
+        summary=f"{', '.join(names)} — {client.name if client else ''}",
+        description="\n".join(line for line in description_lines if line),
+        start_time=appointment.start_time,
+        end_time=appointment.end_time,
+        private_properties={APPOINTMENT_PROPERTY: str(appointment.id)},
+    )
+    if fields is None:
+        return event
+    return {key: value for key, value in event.items() if key in fields}
+
+
+def _event_fields(rows: List[CalendarOutbox]) -> Optional[Set[str]]:
+    """Union of event fields touched by the outbox rows (None - all fields)"""
+    fields: Set[str] = set()
+    for row in rows:
+        if row.changed_fields is None:
+            return None
+        for changed in row.changed_fields:
+            fields |= EVENT_FIELDS.get(changed, set())
+    return fields
+
+
+def plan_operations(
+    appointment_id: int,
+    appointment: Optional[Appointment],
+    rows: List[CalendarOutbox],
+    procedure_names: Dict[int, str]
+) -> List[CalendarOperation]:
+    """Collapse outbox rows of one appointment into calendar operations"""
+    if appointment is None:
+        # Запись удалена: удаляем события, если они были созданы
+        event_ids = sorted({row.google_event_id for row in rows if row.google_event_id})
+        return [
+            CalendarOperation(f"{appointment_id}:{index}", appointment_id, "delete", event_id)
+            for index, event_id in enumerate(event_ids)
+        ]
+
+    if appointment.status == AppointmentStatus.canceled:
+        if not appointment.google_event_id:
+            return []
+        return [CalendarOperation(str(appointment_id), appointment_id, "delete", appointment.google_event_id)]
+
+    if not appointment.google_event_id:
+        return [CalendarOperation(str(appointment_id), appointment_id, "insert", body=build_event(appointment, procedure_names))]
+
+    fields = _event_fields(rows)
+    body = build_event(appointment, procedure_names, fields)
+    if not body:
+        return []
+    return [CalendarOperation(str(appointment_id), appointment_id, "patch", appointment.google_event_id, body)]
+
+
+async def _store_event_id(db: AsyncSession, appointment_id: int, event_id: Optional[str]) -> None:
+    # updated_at не трогаем: это служебное поле, а не изменение записи
+    await db.execute(
+        update(Appointment)
+        .where(Appointment.id == appointment_id)
+        .values(google_event_id=event_id, updated_at=Appointment.updated_at)
+    )
+
+
+async def _load_appointments(db: AsyncSession, appointment_ids: Iterable[int]) -> Dict[int, Appointment]:
+    result = await db.execute(
+        select(Appointment)
+        .where(Appointment.id.in_(list(appointment_ids)))
+        .options(joinedload(Appointment.client), joinedload(Appointment.master))
+    )
+    return {appointment.id: appointment for appointment in result.unique().scalars().all()}
+
+
+async def _claim_rows(db: AsyncSession, batch_size: int) -> "OrderedDict[int, List[CalendarOutbox]]":
+    """Lock pending rows, lease them and commit; rows grouped by appointment"""
+    result = await db.execute(
+        select(CalendarOutbox)
+        .where(CalendarOutbox.available_at <= func.now())
+        .order_by(CalendarOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    grouped: "OrderedDict[int, List[CalendarOutbox]]" = OrderedDict()
+    for row in result.scalars().all():
+        grouped.setdefault(row.appointment_id, []).append(row)
+
+    # Строки одной записи могут оказаться у разных воркеров: сериализуем по записи.
+    # После блокировки проверяем, не синхронизирует ли её уже другой воркер
+    for appointment_id in list(grouped):
+        locked = await db.scalar(select(func.pg_try_advisory_xact_lock(appointment_id)))
+        in_flight = locked and await db.scalar(
+            select(func.count()).select_from(CalendarOutbox).where(
+                CalendarOutbox.appointment_id == appointment_id,
+                CalendarOutbox.claimed_at.is_not(None),
+                CalendarOutbox.available_at > func.now(),
+                CalendarOutbox.id.not_in([row.id for row in grouped[appointment_id]])
+            )
+        )
+        if not locked or in_flight:
+            del grouped[appointment_id]
+
+    claimed_ids = [row.id for group in grouped.values() for row in group]
+    if claimed_ids:
+        await db.execute(
+            update(CalendarOutbox)
+            .where(CalendarOutbox.id.in_(claimed_ids))
+            .values(claimed_at=func.now(), available_at=func.now() + CALENDAR_CLAIM_LEASE)
+        )
+    await db.commit()
+    return grouped
+
+
+async def process_outbox_batch(batch_size: int = CALENDAR_SYNC_BATCH_SIZE) -> int:
+    """Process one batch of pending outbox rows.
+
+    Returns:
+        Number of outbox rows synced or postponed after an error
+    """
+    async with AsyncSessionLocal() as db:
+        grouped = await _claim_rows(db, batch_size)
+        if not grouped:
+            return 0
+
+        appointments = await _load_appointments(db, grouped)
+        procedure_names = await _procedure_names(
+            db, (proc_id for a in appointments.values() for proc_id in a.procedures or [])
+        )
+        # Чтение закончено: не держим транзакцию открытой во время запросов к Google
+        await db.commit()
+
+        operations: List[CalendarOperation] = []
+        for appointment_id, group in grouped.items():
+            operations.extend(plan_operations(
+                appointment_id, appointments.get(appointment_id), group, procedure_names
+            ))
+
+        failed: Dict[int, Exception] = {}
+        try:
+            results = await google_calendar.calendar_service.execute_batch(
+                [(op.request_id, op.build_request) for op in operations]
+            )
+        except Exception as e:
+            logger.error(f"Calendar batch request failed: {e}")
+            results = {}
+            failed = {op.appointment_id: e for op in operations}
+
+        # Событие удалено в календаре: создаём его заново отдельной пачкой
+        event_ids: Dict[int, Optional[str]] = {}
+        recreate: List[CalendarOperation] = []
+        for op in operations:
+            if op.appointment_id in failed:
+                continue
+            response, error = results.get(op.request_id, (None, RuntimeError("No response in batch")))
+            if error is None or (_is_not_found(error) and op.kind == "delete"):
+                if op.kind == "insert":
+                    event_ids[op.appointment_id] = response["id"]
+                elif op.kind == "delete" and op.appointment_id in appointments:
+                    event_ids[op.appointment_id] = None
+            elif _is_not_found(error) and op.kind == "patch":
+                appointment = appointments[op.appointment_id]
+                recreate.append(CalendarOperation(
+                    op.request_id, op.appointment_id, "insert", body=build_event(appointment, procedure_names)
+                ))
+            else:
+                failed[op.appointment_id] = error
+
+        if recreate:
+            try:
+                results = await google_calendar.calendar_service.execute_batch(
+                    [(op.request_id, op.build_request) for op in recreate]
+                )
+            except Exception as e:
+                results = {op.request_id: (None, e) for op in recreate}
+            for op in recreate:
+                response, error = results.get(op.request_id, (None, RuntimeError("No response in batch")))
+                if error is None:
+                    event_ids[op.appointment_id] = response["id"]
+                else:
+                    failed[op.appointment_id] = error
+
+        for appointment_id, event_id in event_ids.items():
+            await _store_event_id(db, appointment_id, event_id)
+
+        done_ids: List[int] = []
+        for appointment_id, group in grouped.items():
+            error = failed.get(appointment_id)
+            if error is None:
+                done_ids.extend(row.id for row in group)
+                continue
+            logger.error(f"Error syncing appointment {appointment_id} to calendar: {error}")
+            for row in group:
+                await db.execute(
+                    update(CalendarOutbox)
+                    .where(CalendarOutbox.id == row.id)
+                    .values(
+                        attempts=row.attempts + 1,
+                        last_error=str(error)[:1000],
+                        claimed_at=None,
+                        available_at=func.now() + _retry_delay(row.attempts + 1)
+                    )
+                )
+
+        if done_ids:
+            await db.execute(delete(CalendarOutbox).where(CalendarOutbox.id.in_(done_ids)))
+        await db.commit()
+
+        if operations:
+            logger.info(f"Calendar sync: {len(operations)} operations for {len(grouped)} appointments, {len(failed)} failed")
+        return sum(len(group) for group in grouped.values())
+
+
+async def apply_remote_changes(db: AsyncSession, events: List[Dict[str, Any]]) -> int:
+    """Reconcile changed calendar events into appointments.
+
+    Only events created by this application (with the appointment_id
+    private property) are taken into account. Remote edits are written
+    directly, without enqueueing them back to the outbox; the reminder
+    scheduler is notified like for any other appointment change.
+
+    Returns:
+        Number of updated appointments
+    """
+    by_appointment: Dict[int, Dict[str, Any]] = {}
+    for event in events:
+        private = (event.get("extendedProperties") or {}).get("private") or {}
+        appointment_id = private.get(APPOINTMENT_PROPERTY)
+        if appointment_id and str(appointment_id).isdigit():
+            by_appointment[int(appointment_id)] = event
+
+    if not by_appointment:
+        return 0
+
+    appointments = await _load_appointments(db, by_appointment)
+    updated = 0
+    for appointment_id, event in by_appointment.items():
+        appointment = appointments.get(appointment_id)
+        # Событие могло быть пересоздано: учитываем только актуальное
+        if appointment is None or appointment.google_event_id != event.get("id"):
+            continue
+
+        values: Dict[str, Any] = {}
+        if event.get("status") == "cancelled":
+            if appointment.status == AppointmentStatus.active:
+                values = {"status": AppointmentStatus.canceled, "google_event_id": None}
+        else:
+            start_time = google_calendar.parse_event_time(event.get("start"))
+            end_time = google_calendar.parse_event_time(event.get("end"))
+            if start_time and start_time != appointment.start_time:
+                # Напоминание о прежнем времени не относится к новому
+                values["start_time"] = start_time
+                values["reminder_sent_at"] = None
+            if end_time and end_time != appointment.end_time:
+                values["end_time"] = end_time
+
+        if values:
+            await db.execute(update(Appointment).where(Appointment.id == appointment_id).values(**values))
+            await crud.notify_appointment_changed(db, appointment_id)
+            updated += 1
+
+    return updated
+
+
+async def pull_remote_changes() -> int:
+    """Read calendar changes since the last sync token and apply them.
+
+    Returns:
+        Number of updated appointments
+    """
+    calendar_id = google_calendar.calendar_service.calendar_id
+    async with AsyncSessionLocal() as db:
+        state = await db.get(CalendarSyncState, calendar_id)
+        if state is None:
+            state = CalendarSyncState(calendar_id=calendar_id)
+            db.add(state)
+
+        try:
+            events, next_token = await google_calendar.list_changed_events(state.sync_token)
+        except google_calendar.SyncTokenExpired:
+            logger.warning("Calendar sync token expired, running full sync")
+            events, next_token = await google_calendar.list_changed_events(None)
+
+        updated = await apply_remote_changes(db, events)
+        state.sync_token = next_token
+        await db.commit()
+
+        if updated:
+            logger.info(f"Calendar pull: {len(events)} changed events, {updated} appointments updated")
+        return updated
+
+
+async def enqueue_resync(start_date: datetime, end_date: datetime) -> int:
+    """Queue a full resync of all appointments in the period.
+
+    Returns:
+        Number of queued appointments
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            insert(CalendarOutbox).from_select(
+                ["appointment_id", "operation"],
+                select(Appointment.id, literal("upsert")).where(
+                    Appointment.start_time >= start_date,
+                    Appointment.start_time < end_date
+                )
+            )
+        )
+        await db.commit()
+        return result.rowcount
+
+
+async def run_calendar_outbox_worker(
+    interval: float = CALENDAR_SYNC_INTERVAL,
+    pull_interval: float = CALENDAR_PULL_INTERVAL
+) -> None:
+    """Drain the outbox and pull remote changes forever (until cancelled)"""
+    logger.info("Calendar sync worker started")
+    last_pull = 0.0
+    while True:
+        processed = 0
+        try:
+            processed = await process_outbox_batch()
+            if pull_interval and time.monotonic() - last_pull >= pull_interval:
+                last_pull = time.monotonic()
+                await pull_remote_changes()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in calendar sync worker: {e}")
+
+        # Пока очередь не пуста, берём следующую пачку сразу
+        if not processed:
+            await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Google Calendar sync worker")
+    parser.add_argument("--resync", metavar="YYYY-MM", help="Queue all appointments of the month and exit")
+    args = parser.parse_args()
+
+    if args.resync:
+        month_start = datetime.strptime(args.resync, "%Y-%m")
+        month_end = (month_start + timedelta(days=32)).replace(day=1)
+        queued = asyncio.run(enqueue_resync(month_start, month_end))
+        print(f"Queued {queued} appointments for calendar resync")
+    else:
+        try:
+            asyncio.run(run_calendar_outbox_worker())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,227 @@
+"""
+Local stand-in for the Google Calendar API (events resource only).
+
+Keeps events in memory and answers the same JSON the real API returns, so
+the calendar integration can be exercised without network access or OAuth.
+Supports insert/get/list/update/patch/delete, batch requests
+(POST /batch/calendar/v3, multipart/mixed) and incremental listing with
+syncToken/nextSyncToken.
+
+Usage:
+    python -m src.utils.fake_calendar_server --port 8090 --latency 200
+
+    GOOGLE_CALENDAR_API_URL=http://localhost:8090/calendar/v3/
+"""
+import argparse
+import asyncio
+import datetime
+import email.parser
+import email.policy
+import json
+import re
+import uuid
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from aiohttp import web
+
+API_PREFIX = "/calendar/v3"
+BATCH_PATH = "/batch/calendar/v3"
+BATCH_LIMIT = 50
+
+_EVENTS_RE = re.compile(r"^" + API_PREFIX + r"/calendars/(?P<calendar_id>[^/]+)/events(?:/(?P<event_id>[^/?]+))?$")
+
+_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 410: "Gone"}
+
+
+def _now() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _error(code: int, reason: str) -> Tuple[int, Dict[str, Any]]:
+    return code, {"error": {"code": code, "message": _REASONS.get(code, reason), "errors": [{"reason": reason}]}}
+
+
+class FakeCalendar:
+    """In-memory calendar storage"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.events: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.requests: Counter = Counter()
+        # Номер последнего изменения: из него строятся sync-токены
+        self.sequence = 0
+        self._changed_at: Dict[Tuple[str, str], int] = {}
+
+    def calendar(self, calendar_id: str) -> Dict[str, Dict[str, Any]]:
+        return self.events.setdefault(calendar_id, {})
+
+    def store(self, calendar_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.sequence += 1
+        event["updated"] = _now()
+        event["etag"] = f'"{uuid.uuid4().hex}"'
+        event.setdefault("status", "confirmed")
+        self.calendar(calendar_id)[event["id"]] = event
+        self._changed_at[(calendar_id, event["id"])] = self.sequence
+        return event
+
+    async def delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Optional[Dict[str, Any]]) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Execute one API call.
+
+        Returns:
+            HTTP status and JSON body (None for empty responses)
+        """
+        match = _EVENTS_RE.match(path)
+        if not match:
+            return _error(404, "notFound")
+        calendar_id = match.group("calendar_id")
+        event_id = match.group("event_id")
+        calendar = self.calendar(calendar_id)
+
+        if event_id is None:
+            if method == "POST":
+                self.requests["insert"] += 1
+                event = dict(body or {})
+                event["id"] = event.get("id") or uuid.uuid4().hex
+                return 200, self.store(calendar_id, event)
+            if method == "GET":
+                self.requests["list"] += 1
+                return self.list_events(calendar_id, query)
+            return _error(400, "badRequest")
+
+        event = calendar.get(event_id)
+        if method == "GET":
+            self.requests["get"] += 1
+            if event is None or event["status"] == "cancelled":
+                return _error(404, "notFound")
+            return 200, event
+        if method in ("PUT", "PATCH"):
+            self.requests[method.lower()] += 1
+            if event is None or event["status"] == "cancelled":
+                return _error(404, "notFound")
+            updated = {**event, **(body or {})} if method == "PATCH" else dict(body or {})
+            updated["id"] = event_id
+            return 200, self.store(calendar_id, updated)
+        if method == "DELETE":
+            self.requests["delete"] += 1
+            if event is None or event["status"] == "cancelled":
+                return _error(410, "deleted")
+            event["status"] = "cancelled"
+            self.store(calendar_id, event)
+            return 204, None
+        return _error(400, "badRequest")
+
+    def list_events(self, calendar_id: str, query: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        sync_token = query.get("syncToken")
+        since = 0
+        if sync_token:
+            if not sync_token.startswith("s") or not sync_token[1:].isdigit():
+                return _error(410, "fullSyncRequired")
+            since = int(sync_token[1:])
+
+        show_deleted = query.get("showDeleted") == "true" or bool(sync_token)
+        events = [
+            event for event_id, event in self.calendar(calendar_id).items()
+            if self._changed_at[(calendar_id, event_id)] > since
+            and (show_deleted or event["status"] != "cancelled")
+        ]
+        events.sort(key=lambda event: self._changed_at[(calendar_id, event["id"])])
+
+        offset = int(query.get("pageToken") or 0)
+        limit = int(query.get("maxResults") or 250)
+        page = events[offset:offset + limit]
+        response: Dict[str, Any] = {"kind": "calendar#events", "items": page}
+        if offset + limit < len(events):
+            response["nextPageToken"] = str(offset + limit)
+        else:
+            response["nextSyncToken"] = f"s{self.sequence}"
+        return 200, response
+
+
+def _parse_http_request(raw: str) -> Tuple[str, str, Dict[str, str], Optional[Dict[str, Any]]]:
+    """Parse an HTTP request embedded into a batch part"""
+    head, _, body = raw.replace("\r\n", "\n").partition("\n\n")
+    lines = head.split("\n")
+    method, target = lines[0].split(" ")[:2]
+    parts = urlsplit(target)
+    query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+    payload = json.loads(body) if body.strip() else None
+    return method, parts.path, query, payload
+
+
+def _http_response(status: int, payload: Optional[Dict[str, Any]]) -> str:
+    reason = _REASONS.get(status, "OK")
+    if payload is None:
+        return f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\n\r\n"
+    body = json.dumps(payload)
+    return f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=UTF-8\r\nContent-Length: {len(body)}\r\n\r\n{body}"
+
+
+def create_app(latency: float = 0) -> web.Application:
+    """Create aiohttp application that emulates the events resource"""
+    fake = FakeCalendar(latency)
+
+    async def handle_api(request: web.Request) -> web.Response:
+        await fake.delay()
+        body = await request.json() if request.can_read_body else None
+        status, payload = fake.handle(request.method, request.path, dict(request.query), body)
+        if payload is None:
+            return web.Response(status=status)
+        return web.json_response(payload, status=status)
+
+    async def handle_batch(request: web.Request) -> web.Response:
+        await fake.delay()
+        fake.requests["batch"] += 1
+        raw = await request.read()
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + request.headers["Content-Type"].encode() + b"\r\n\r\n" + raw
+        )
+        parts = list(message.iter_parts())
+        if len(parts) > BATCH_LIMIT:
+            status, payload = _error(400, "batchSizeTooLarge")
+            return web.json_response(payload, status=status)
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        chunks = []
+        for part in parts:
+            content_id = part.get("Content-ID", "")
+            method, path, query, body = _parse_http_request(part.get_payload())
+            status, payload = fake.handle(method, path, query, body)
+            response_id = content_id.replace("<", "<response-", 1)
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {response_id}\r\n\r\n"
+                + _http_response(status, payload) + "\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return web.Response(
+            body="".join(chunks).encode(),
+            headers={"Content-Type": f"multipart/mixed; boundary={boundary}"}
+        )
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": dict(fake.requests),
+            "events": {cid: len(events) for cid, events in fake.events.items()},
+        })
+
+    app = web.Application()
+    app["fake_calendar"] = fake
+    app.router.add_post(BATCH_PATH, handle_batch)
+    app.router.add_route("*", API_PREFIX + "/calendars/{calendar_id}/events", handle_api)
+    app.router.add_route("*", API_PREFIX + "/calendars/{calendar_id}/events/{event_id}", handle_api)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google Calendar API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=int, default=0, help="Artificial latency per request, ms")
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency / 1000), host=args.host, port=args.port)
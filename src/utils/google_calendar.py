@@ -1,59 +1,281 @@
 import os
+import asyncio
 import datetime
-from typing import Optional, Dict, Any
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, List, Tuple
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
 
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
 import json
 
+logger = logging.getLogger(__name__)
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# Base URL of the Calendar API, e.g. http://localhost:8090/calendar/v3/ for the fake server
+GOOGLE_CALENDAR_API_URL = os.getenv("GOOGLE_CALENDAR_API_URL")
+GOOGLE_CALENDAR_ID = os.getenv("GOOGLE_CALENDAR_ID", "primary")
+TIMEZONE = os.getenv("TIMEZONE", "Europe/Kiev")
+
+# Google accepts at most 50 calls in one batch request
+BATCH_LIMIT = 50
+
+
+class SyncTokenExpired(Exception):
+    """The sync token is no longer valid, a full sync is required"""
+
+
+class CalendarAuthError(Exception):
+    """No usable Google credentials; run ``python -m src.utils.google_calendar`` once"""
 
-def get_credentials():
+
+def get_credentials(interactive: bool = False):
     """Get valid user credentials from storage.
 
+    The browser login flow is started only when ``interactive`` is true
+    (setup command); the API and workers must not wait for a login.
+
+    Args:
+        interactive: Allow the local-server login flow
+
     Returns:
         Credentials, the obtained credential.
+
+    Raises:
+        CalendarAuthError: No valid token and interactive login not allowed
     """
     creds = None
     token_path = os.getenv("GOOGLE_CALENDAR_TOKEN", "token.json")
     credentials_path = os.getenv("GOOGLE_CALENDAR_CREDENTIALS", "credentials.json")
-    
+
     # The file token.json stores the user's access and refresh tokens
     if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_info(
-            json.load(open(token_path)), SCOPES
-        )
-    
+        with open(token_path) as token:
+            creds = Credentials.from_authorized_user_info(json.load(token), SCOPES)
+
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+        elif not interactive:
+            raise CalendarAuthError(
+                f"No valid Google Calendar token in {token_path}; "
+                "authorize once with: python -m src.utils.google_calendar"
+            )
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
                 credentials_path, SCOPES
             )
             creds = flow.run_local_server(port=0)
-        
+
         # Save the credentials for the next run
         with open(token_path, 'w') as token:
             token.write(creds.to_json())
-    
+
     return creds
 
 
+class CalendarService:
+    """Google Calendar client that does not block the event loop.
+
+    Credentials and the discovery document are loaded once per process.
+    googleapiclient objects are not thread-safe, so every executor thread
+    gets its own service object built from the cached document. Calls run
+    in a bounded thread pool, and the number of calls in flight is limited
+    by a semaphore so that a slow Google does not exhaust the pool.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_concurrency: int = None,
+        api_url: Optional[str] = GOOGLE_CALENDAR_API_URL,
+        calendar_id: str = GOOGLE_CALENDAR_ID
+    ):
+        """Initialize the service.
+
+        Args:
+            max_workers: Size of the thread pool (defaults to GOOGLE_CALENDAR_WORKERS env var or 4)
+            max_concurrency: Max calls in flight (defaults to GOOGLE_CALENDAR_CONCURRENCY env var or 8)
+            api_url: Custom API base URL (local fake server in tests)
+            calendar_id: Calendar to work with
+        """
+        self.max_workers = max_workers or int(os.getenv("GOOGLE_CALENDAR_WORKERS", "4"))
+        self.max_concurrency = max_concurrency or int(os.getenv("GOOGLE_CALENDAR_CONCURRENCY", "8"))
+        self.api_url = api_url
+        self.calendar_id = calendar_id
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+        self._discovery_doc: Optional[str] = None
+        self._local = threading.local()
+        self.batch_uri = self._batch_uri(api_url)
+
+    @staticmethod
+    def _batch_uri(api_url: Optional[str]) -> str:
+        """Batch endpoint for the API host (not derived by googleapiclient for custom endpoints)"""
+        if not api_url:
+            return "https://www.googleapis.com/batch/calendar/v3"
+        parts = urlsplit(api_url)
+        return f"{parts.scheme}://{parts.netloc}/batch/calendar/v3"
+
+    def _get_credentials(self):
+        """Get cached credentials, refreshing them only when expired"""
+        with self._credentials_lock:
+            creds = self._credentials
+            if creds is None:
+                if self.api_url and not os.path.exists(os.getenv("GOOGLE_CALENDAR_TOKEN", "token.json")):
+                    # Локальный fake-сервер не требует авторизации
+                    creds = AnonymousCredentials()
+                else:
+                    creds = get_credentials()
+                self._credentials = creds
+            elif not creds.valid and getattr(creds, "refresh_token", None):
+                creds.refresh(Request())
+            return creds
+
+    def _get_discovery_doc(self) -> str:
+        if self._discovery_doc is None:
+            self._discovery_doc = get_static_doc('calendar', 'v3')
+        return self._discovery_doc
+
+    def get_service(self):
+        """Get the service object of the current thread"""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            client_options = {"api_endpoint": self.api_url} if self.api_url else None
+            service = build_from_document(
+                self._get_discovery_doc(),
+                credentials=self._get_credentials(),
+                client_options=client_options
+            )
+            self._local.service = service
+        return service
+
+    async def run(self, call: Callable[[Any], Any]) -> Any:
+        """Run ``call(service)`` in the thread pool.
+
+        Args:
+            call: Function that receives the thread's service object
+
+        Returns:
+            Result of the call
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="google-calendar"
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, lambda: call(self.get_service()))
+
+    async def execute(self, build_request: Callable[[Any], Any]) -> Any:
+        """Build a request from the service and execute it in the thread pool"""
+        return await self.run(lambda service: build_request(service).execute())
+
+    async def execute_batch(self, calls: List[Tuple[str, Callable[[Any], Any]]]) -> Dict[str, Tuple[Any, Optional[Exception]]]:
+        """Execute many requests with as few HTTP calls as possible.
+
+        Args:
+            calls: Pairs (request_id, function that builds the request from the service)
+
+        Returns:
+            Mapping request_id -> (response, exception)
+        """
+        results: Dict[str, Tuple[Any, Optional[Exception]]] = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        def run_chunk(service, chunk):
+            batch = BatchHttpRequest(callback=callback, batch_uri=self.batch_uri)
+            for request_id, build_request in chunk:
+                batch.add(build_request(service), request_id=request_id)
+            batch.execute()
+
+        chunks = [calls[i:i + BATCH_LIMIT] for i in range(0, len(calls), BATCH_LIMIT)]
+        await asyncio.gather(*(
+            self.run(lambda service, chunk=chunk: run_chunk(service, chunk)) for chunk in chunks
+        ))
+        return results
+
+    def shutdown(self):
+        """Stop the thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+calendar_service = CalendarService()
+
+
 def get_calendar_service():
     """Get a Google Calendar service instance.
 
     Returns:
         A Google Calendar service instance.
     """
-    creds = get_credentials()
-    service = build('calendar', 'v3', credentials=creds)
-    return service
+    return calendar_service.get_service()
+
+
+def _event_time(value: datetime.datetime) -> Dict[str, str]:
+    """Format time for Google Calendar API"""
+    return {
+        'dateTime': value.isoformat(),
+        'timeZone': TIMEZONE,
+    }
+
+
+def parse_event_time(value: Dict[str, str]) -> Optional[datetime.datetime]:
+    """Convert event start/end to naive local time (as stored in the database)"""
+    date_time = value.get('dateTime') if value else None
+    if not date_time:
+        return None
+    parsed = datetime.datetime.fromisoformat(date_time.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(ZoneInfo(TIMEZONE)).replace(tzinfo=None)
+    return parsed
+
+
+def build_event_body(
+    summary: Optional[str] = None,
+    description: Optional[str] = None,
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+    attendees: Optional[list] = None,
+    private_properties: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Build event resource from the provided fields only (suitable for PATCH)"""
+    event: Dict[str, Any] = {}
+    if summary is not None:
+        event['summary'] = summary
+    if description is not None:
+        event['description'] = description
+    if start_time is not None:
+        event['start'] = _event_time(start_time)
+    if end_time is not None:
+        event['end'] = _event_time(end_time)
+    if attendees:
+        event['attendees'] = [{'email': email} for email in attendees]
+    if private_properties:
+        event['extendedProperties'] = {'private': private_properties}
+    return event
 
 
 async def create_calendar_event(
@@ -75,34 +297,13 @@ async def create_calendar_event(
     Returns:
         Created event details
     """
-    service = get_calendar_service()
-    
-    # Format time for Google Calendar API
-    start_time_str = start_time.isoformat()
-    end_time_str = end_time.isoformat()
-    
     # Prepare event data
-    event = {
-        'summary': summary,
-        'description': description,
-        'start': {
-            'dateTime': start_time_str,
-            'timeZone': os.getenv("TIMEZONE", "Europe/Kiev"),
-        },
-        'end': {
-            'dateTime': end_time_str,
-            'timeZone': os.getenv("TIMEZONE", "Europe/Kiev"),
-        },
-    }
-    
-    # Add attendees if provided
-    if attendees:
-        event['attendees'] = [{'email': email} for email in attendees]
-    
+    event = build_event_body(summary, description, start_time, end_time, attendees)
+
     # Create the event
-    event = service.events().insert(calendarId='primary', body=event).execute()
-    
-    return event
+    return await calendar_service.execute(
+        lambda service: service.events().insert(calendarId=calendar_service.calendar_id, body=event)
+    )
 
 
 async def update_calendar_event(
@@ -126,41 +327,14 @@ async def update_calendar_event(
     Returns:
         Updated event details
     """
-    service = get_calendar_service()
-    
-    # Get the existing event
-    event = service.events().get(calendarId='primary', eventId=event_id).execute()
-    
-    # Update fields if provided
-    if summary:
-        event['summary'] = summary
-    
-    if description:
-        event['description'] = description
-    
-    if start_time:
-        start_time_str = start_time.isoformat()
-        event['start'] = {
-            'dateTime': start_time_str,
-            'timeZone': os.getenv("TIMEZONE", "Europe/Kiev"),
-        }
-    
-    if end_time:
-        end_time_str = end_time.isoformat()
-        event['end'] = {
-            'dateTime': end_time_str,
-            'timeZone': os.getenv("TIMEZONE", "Europe/Kiev"),
-        }
-    
-    if attendees:
-        event['attendees'] = [{'email': email} for email in attendees]
-    
-    # Update the event
-    updated_event = service.events().update(
-        calendarId='primary', eventId=event_id, body=event
-    ).execute()
-    
-    return updated_event
+    # PATCH: отправляем только изменённые поля, без предварительного GET
+    event = build_event_body(summary, description, start_time, end_time, attendees)
+
+    return await calendar_service.execute(
+        lambda service: service.events().patch(
+            calendarId=calendar_service.calendar_id, eventId=event_id, body=event
+        )
+    )
 
 
 async def delete_calendar_event(event_id: str) -> bool:
@@ -172,13 +346,13 @@ async def delete_calendar_event(event_id: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    service = get_calendar_service()
-    
     try:
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
+        await calendar_service.execute(
+            lambda service: service.events().delete(calendarId=calendar_service.calendar_id, eventId=event_id)
+        )
         return True
     except Exception as e:
-        print(f"Error deleting event: {e}")
+        logger.error(f"Error deleting event: {e}")
         return False
 
 
@@ -191,11 +365,54 @@ async def get_calendar_event(event_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         Event details or None if not found
     """
-    service = get_calendar_service()
-    
     try:
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
-        return event
+        return await calendar_service.execute(
+            lambda service: service.events().get(calendarId=calendar_service.calendar_id, eventId=event_id)
+        )
     except Exception as e:
-        print(f"Error getting event: {e}")
+        logger.error(f"Error getting event: {e}")
         return None
+
+
+async def list_changed_events(sync_token: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get events changed since the previous sync.
+
+    Args:
+        sync_token: Token from the previous call (None - full sync)
+
+    Returns:
+        Changed events (including cancelled ones) and the token for the next call
+
+    Raises:
+        SyncTokenExpired: If Google no longer accepts the token
+    """
+    def list_pages(service):
+        events: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            params = {
+                'calendarId': calendar_service.calendar_id,
+                'maxResults': 250,
+                'showDeleted': True,
+                'pageToken': page_token,
+            }
+            if sync_token:
+                params['syncToken'] = sync_token
+            try:
+                response = service.events().list(**params).execute()
+            except HttpError as e:
+                if e.resp.status == 410:
+                    raise SyncTokenExpired() from e
+                raise
+            events.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return events, response.get('nextSyncToken')
+
+    return await calendar_service.run(list_pages)
+
+
+if __name__ == "__main__":
+    # Одноразовая авторизация: открывает браузер и сохраняет token.json
+    get_credentials(interactive=True)
+    print("Google Calendar token saved")
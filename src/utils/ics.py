@@ -0,0 +1,212 @@
+"""
+ICS (iCalendar) feed of a master's appointments.
+
+Calendar clients poll the feed; each poll costs one aggregate query
+(count + max(updated_at)) at most every ICS_CHECK_INTERVAL seconds. When
+the version changes, only appointments whose updated_at differs from the
+cached one are loaded and rendered again, the rest of the VEVENT blocks are
+reused. The version also gives ETag/Last-Modified for 304 responses.
+Events show the client's name and phone, so a client update counts as a
+change of the client's appointments.
+
+Feed URLs are protected by an HMAC token. Without ICS_SECRET or a
+non-default API_SECRET_KEY the tokens could be computed by anyone, so the
+feed is disabled (ICS_ENABLED is False).
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import crud
+
+TIMEZONE = os.getenv("TIMEZONE", "Europe/Kiev")
+# Значение API_SECRET_KEY по умолчанию из примера конфигурации
+DEFAULT_SECRET_KEY = "your_secret_key_for_jwt"
+_api_secret = os.getenv("API_SECRET_KEY")
+ICS_SECRET = os.getenv("ICS_SECRET") or (_api_secret if _api_secret != DEFAULT_SECRET_KEY else None)
+ICS_ENABLED = bool(ICS_SECRET)
+ICS_CHECK_INTERVAL = float(os.getenv("ICS_CHECK_INTERVAL", "15"))
+ICS_HISTORY_DAYS = int(os.getenv("ICS_HISTORY_DAYS", "30"))
+ICS_LANG = os.getenv("ICS_LANG", "UKR")
+ICS_DOMAIN = os.getenv("ICS_DOMAIN", "beauty-salon")
+
+
+def feed_token(master_id: int) -> str:
+    """Secret token for the feed URL (calendar clients cannot send auth headers)"""
+    if not ICS_ENABLED:
+        raise RuntimeError("ICS feed is disabled: set ICS_SECRET or API_SECRET_KEY")
+    digest = hmac.new(ICS_SECRET.encode(), f"ics:{master_id}".encode(), hashlib.sha256)
+    return digest.hexdigest()[:32]
+
+
+def verify_feed_token(master_id: int, token: str) -> bool:
+    if not ICS_ENABLED:
+        return False
+    return hmac.compare_digest(feed_token(master_id), token or "")
+
+
+def _escape(value: str) -> str:
+    """Escape TEXT value (RFC 5545, 3.3.11)"""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold content line to 75 octets (RFC 5545, 3.1)"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Не разрезаем многобайтный символ UTF-8
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        limit = 74  # продолжение начинается с пробела
+    return "\r\n ".join(parts)
+
+
+def _local_time(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _utc_time(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_event(appointment: Dict[str, Any]) -> str:
+    """Render one VEVENT block"""
+    procedures = ", ".join(appointment["procedure_names"])
+    client = appointment["client_name"]
+    contact = f"{client} {appointment['client_phone'] or ''}".strip()
+    stamp = appointment["updated_at"] or appointment["created_at"] or datetime.utcnow()
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:appointment-{appointment['id']}@{ICS_DOMAIN}",
+        f"DTSTAMP:{_utc_time(stamp)}",
+        f"LAST-MODIFIED:{_utc_time(stamp)}",
+        f"DTSTART;TZID={TIMEZONE}:{_local_time(appointment['start_time'])}",
+        f"DTEND;TZID={TIMEZONE}:{_local_time(appointment['end_time'])}",
+        f"SUMMARY:{_escape(procedures + ' — ' + client)}",
+        f"DESCRIPTION:{_escape(contact)}",
+        "STATUS:CONFIRMED",
+        "END:VEVENT",
+    ]
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def render_calendar(name: str, events: List[str]) -> str:
+    header = "\r\n".join(_fold(line) for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:-//{ICS_DOMAIN}//appointments//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+        f"X-WR-TIMEZONE:{TIMEZONE}",
+    ]) + "\r\n"
+    return header + "".join(events) + "END:VCALENDAR\r\n"
+
+
+@dataclass
+class IcsFeed:
+    master_id: int
+    version: Tuple[int, Optional[datetime]] = (0, None)
+    checked_at: float = 0.0
+    # appointment_id -> (updated_at, VEVENT)
+    events: Dict[int, Tuple[datetime, str]] = field(default_factory=dict)
+    body: bytes = b""
+    etag: str = ""
+    last_modified: Optional[str] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def not_modified(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """Check conditional request headers"""
+        if if_none_match:
+            return self.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        return bool(if_modified_since and self.last_modified and if_modified_since == self.last_modified)
+
+
+class IcsFeedCache:
+    """Per-master cache of rendered ICS feeds"""
+
+    def __init__(self, check_interval: float = ICS_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._feeds: Dict[int, IcsFeed] = {}
+
+    async def get_feed(self, db: AsyncSession, master_id: int) -> Optional[IcsFeed]:
+        """Get the feed, regenerating changed events if needed (None if there is no such master)"""
+        feed = self._feeds.setdefault(master_id, IcsFeed(master_id=master_id))
+        if feed.body and time.monotonic() - feed.checked_at < self.check_interval:
+            return feed
+
+        async with feed.lock:
+            if feed.body and time.monotonic() - feed.checked_at < self.check_interval:
+                return feed
+
+            since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=ICS_HISTORY_DAYS)
+            version = await crud.get_master_calendar_version(db, master_id, since)
+            if version is None:
+                return feed if feed.body else None
+
+            if not feed.body or version != feed.version:
+                master = await crud.get_master_by_id(db, master_id)
+                if master is None:
+                    self._feeds.pop(master_id, None)
+                    return None
+                await self._regenerate(db, feed, master["name"], since)
+                feed.version = version
+                count, last_updated = version
+                stamp = last_updated.timestamp() if last_updated else 0
+                feed.etag = f'"{master_id}-{count}-{stamp:.6f}"'
+                feed.last_modified = (
+                    format_datetime(last_updated.replace(tzinfo=timezone.utc), usegmt=True)
+                    if last_updated else None
+                )
+
+            feed.checked_at = time.monotonic()
+            return feed
+
+    async def _regenerate(self, db: AsyncSession, feed: IcsFeed, master_name: str, since: datetime) -> None:
+        entries = await crud.get_master_calendar_entries(db, feed.master_id, since)
+
+        # Перерисовываем только новые и изменённые записи
+        stale_ids = [
+            appointment_id for appointment_id, updated_at in entries.items()
+            if appointment_id not in feed.events or feed.events[appointment_id][0] != updated_at
+        ]
+        appointments = await crud.get_calendar_appointments(db, stale_ids, ICS_LANG)
+
+        events = {appointment_id: feed.events[appointment_id] for appointment_id in entries if appointment_id in feed.events}
+        for appointment in appointments:
+            events[appointment["id"]] = (appointment["updated_at"], render_event(appointment))
+
+        feed.events = events
+        ordered = sorted(events.items(), key=lambda item: item[0])
+        feed.body = render_calendar(master_name, [vevent for _, (_, vevent) in ordered]).encode("utf-8")
+
+    def invalidate(self, master_id: Optional[int] = None) -> None:
+        if master_id is None:
+            self._feeds.clear()
+        else:
+            self._feeds.pop(master_id, None)
+
+
+ics_feed_cache = IcsFeedCache()
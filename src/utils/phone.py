@@ -0,0 +1,57 @@
+"""
+Phone number normalization to E.164 (+<country code><number>).
+
+Numbers entered without a country code are treated as local numbers of
+PHONE_COUNTRY_CODE: "050 123 45 67", "(050)1234567" and "+38 050 123-45-67"
+all become "+380501234567". The normalized value is stored in
+client.phone_normalized and is unique, so one phone belongs to one client
+regardless of how it was typed.
+"""
+import os
+import re
+from typing import Optional
+
+PHONE_COUNTRY_CODE = os.getenv("PHONE_COUNTRY_CODE", "380")
+# Длина номера без кода страны и без ведущего 0 (для Украины 9 цифр)
+PHONE_NATIONAL_LENGTH = int(os.getenv("PHONE_NATIONAL_LENGTH", "9"))
+
+# E.164: не больше 15 цифр, короче 8 цифр номеров не бывает
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+_NOT_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone: Optional[str], country_code: str = PHONE_COUNTRY_CODE) -> Optional[str]:
+    """Normalize a free-form phone number to E.164.
+
+    Args:
+        phone: Phone as entered by the user
+        country_code: Country code for numbers entered without one
+
+    Returns:
+        Phone like "+380501234567" or None if it is empty or not a phone number
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = _NOT_DIGITS.sub("", phone)
+    if not digits:
+        return None
+
+    if phone.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        # Международный префикс вместо "+"
+        digits = digits[2:]
+    elif digits.startswith(country_code) and len(digits) == len(country_code) + PHONE_NATIONAL_LENGTH:
+        pass
+    elif digits.startswith("0") and len(digits) == PHONE_NATIONAL_LENGTH + 1:
+        # Местный формат с ведущим 0: 050...
+        digits = country_code + digits[1:]
+    elif len(digits) == PHONE_NATIONAL_LENGTH:
+        digits = country_code + digits
+
+    if not E164_MIN_DIGITS <= len(digits) <= E164_MAX_DIGITS:
+        return None
+    return f"+{digits}"
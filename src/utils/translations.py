@@ -1,4 +1,9 @@
-from typing import Dict, Any
+import logging
+import string
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
 
 # Translations for common phrases
 TRANSLATIONS = {
@@ -170,6 +175,22 @@ TRANSLATIONS = {
         "RUS": "Пожалуйста, введите ваш номер телефона:"
     },
     
+    # Invalid phone
+    "invalid_phone": {
+        "UKR": "Не вдалося розпізнати номер телефону. Введіть його у форматі +380501234567 або 0501234567:",
+        "ENG": "Could not recognize the phone number. Please enter it as +380501234567 or 0501234567:",
+        "POR": "Não foi possível reconhecer o número de telefone. Insira-o no formato +380501234567 ou 0501234567:",
+        "RUS": "Не удалось распознать номер телефона. Введите его в формате +380501234567 или 0501234567:"
+    },
+    
+    # Phone already registered
+    "phone_already_registered": {
+        "UKR": "Цей номер телефону вже зареєстровано іншим акаунтом Telegram. Введіть інший номер або зверніться до адміністратора:",
+        "ENG": "This phone number is already registered by another Telegram account. Enter another number or contact the administrator:",
+        "POR": "Este número de telefone já está registrado por outra conta do Telegram. Insira outro número ou contate o administrador:",
+        "RUS": "Этот номер телефона уже зарегистрирован другим аккаунтом Telegram. Введите другой номер или обратитесь к администратору:"
+    },
+    
     # Registration completed
     "registration_completed": {
         "UKR": "Дякуємо за реєстрацію! Тепер ви можете записатися на процедури.",
@@ -178,6 +199,43 @@ TRANSLATIONS = {
         "RUS": "Спасибо за регистрацию! Теперь вы можете записаться на процедуры."
     },
     
+    # Appointment reminder
+    "appointment_reminder": {
+        "UKR": "⏰ Нагадуємо про ваш запис {date} о {time}.\n<b>Майстер:</b> {master}\n<b>Процедури:</b> {procedures}",
+        "ENG": "⏰ Reminder: your appointment is on {date} at {time}.\n<b>Master:</b> {master}\n<b>Procedures:</b> {procedures}",
+        "POR": "⏰ Lembrete: o seu agendamento é em {date} às {time}.\n<b>Mestre:</b> {master}\n<b>Procedimentos:</b> {procedures}",
+        "RUS": "⏰ Напоминаем о вашей записи {date} в {time}.\n<b>Мастер:</b> {master}\n<b>Процедуры:</b> {procedures}"
+    },
+    
+    # Appointment details labels
+    "label_procedures": {
+        "UKR": "Процедури",
+        "ENG": "Procedures",
+        "POR": "Procedimentos",
+        "RUS": "Процедуры"
+    },
+    
+    "label_master": {
+        "UKR": "Майстер",
+        "ENG": "Master",
+        "POR": "Mestre",
+        "RUS": "Мастер"
+    },
+    
+    "label_date": {
+        "UKR": "Дата",
+        "ENG": "Date",
+        "POR": "Data",
+        "RUS": "Дата"
+    },
+    
+    "label_time": {
+        "UKR": "Час",
+        "ENG": "Time",
+        "POR": "Hora",
+        "RUS": "Время"
+    },
+    
     # Admin welcome
     "admin_welcome": {
         "UKR": "Вітаємо в адміністративній панелі! Оберіть опцію:",
@@ -196,6 +254,69 @@ TRANSLATIONS = {
 }
 
 
+# Supported languages; unknown codes fall back to the default one
+LANGUAGES = ("UKR", "ENG", "POR", "RUS")
+DEFAULT_LANG = "UKR"
+
+_formatter = string.Formatter()
+
+
+class Template:
+    """Translation text with its format fields parsed once"""
+    
+    __slots__ = ("text", "pieces", "simple")
+    
+    def __init__(self, text: str):
+        self.text = text
+        # (literal, field name or None)
+        self.pieces: Tuple[Tuple[str, Optional[str]], ...] = ()
+        self.simple = True
+        pieces = []
+        for literal, field_name, format_spec, conversion in _formatter.parse(text):
+            if field_name is not None and (format_spec or conversion or not field_name.isidentifier()):
+                # Сложные поля ({0}, {x.y}, {x:.2f}) форматируем обычным str.format
+                self.simple = False
+            pieces.append((literal, field_name))
+        self.pieces = tuple(pieces)
+    
+    def render(self, kwargs: Dict[str, Any]) -> str:
+        if not self.simple:
+            return self.text.format(**kwargs)
+        parts = []
+        for literal, field_name in self.pieces:
+            parts.append(literal)
+            if field_name is not None:
+                parts.append(format(kwargs[field_name]))
+        return "".join(parts)
+
+
+def _compile_tables(translations: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Template]]:
+    """Build per-language flat tables, filling gaps from the default language"""
+    tables: Dict[str, Dict[str, Template]] = {lang: {} for lang in LANGUAGES}
+    for key, texts in translations.items():
+        default = texts.get(DEFAULT_LANG)
+        missing = [lang for lang in LANGUAGES if lang not in texts]
+        if missing:
+            logger.warning("Translation %r has no text for %s", key, ", ".join(missing))
+        for lang in LANGUAGES:
+            text = texts.get(lang, default)
+            if text is not None:
+                tables[lang][key] = Template(text)
+    return tables
+
+
+_TABLES = _compile_tables(TRANSLATIONS)
+_DEFAULT_TABLE = _TABLES[DEFAULT_LANG]
+_reported_missing: Set[str] = set()
+
+
+def _missing(key: str) -> str:
+    if key not in _reported_missing:
+        _reported_missing.add(key)
+        logger.warning("Missing translation: %s", key)
+    return f"Missing translation: {key}"
+
+
 def get_text(key: str, lang: str = "UKR", **kwargs) -> str:
     """
     Get translated text for the given key and language
@@ -208,18 +329,47 @@ def get_text(key: str, lang: str = "UKR", **kwargs) -> str:
     Returns:
         Translated text
     """
-    # Default to UKR if language not found
-    if lang not in ["UKR", "ENG", "POR", "RUS"]:
-        lang = "UKR"
-    
-    # Get text for the key and language
-    text = TRANSLATIONS.get(key, {}).get(lang, TRANSLATIONS.get(key, {}).get("UKR", f"Missing translation: {key}"))
+    template = _TABLES.get(lang, _DEFAULT_TABLE).get(key)
+    if template is None:
+        return _missing(key)
+    if not kwargs:
+        return template.text
+    return template.render(kwargs)
+
+
+def _name_key(kind: str, item_id: int) -> str:
+    return f"{kind}:{item_id}"
+
+
+def merge_catalog_names(rows: Iterable[Tuple[str, int, str, str]]) -> None:
+    """
+    Merge names of sections/procedures (from the database or the API) into the tables
     
-    # Format text with provided parameters
-    if kwargs:
-        text = text.format(**kwargs)
+    Args:
+        rows: (kind, item id, language code, name), kind is "section" or "procedure"
+    """
+    for kind, item_id, lang, name in rows:
+        table = _TABLES.get(lang)
+        if table is not None and name:
+            table[_name_key(kind, item_id)] = Template(name.replace("{", "{{").replace("}", "}}"))
+
+
+def get_name(kind: str, item_id: int, lang: str = "UKR", default: Optional[str] = None) -> Optional[str]:
+    """
+    Get a catalog name merged with merge_catalog_names
     
-    return text
+    Args:
+        kind: "section" or "procedure"
+        item_id: Section or procedure ID
+        lang: Language code
+        default: Value returned if the name is unknown
+        
+    Returns:
+        Name in the requested language, in the default language or default
+    """
+    key = _name_key(kind, item_id)
+    template = _TABLES.get(lang, _DEFAULT_TABLE).get(key) or _DEFAULT_TABLE.get(key)
+    return template.render({}) if template is not None else default
 
 
 def format_date(date, lang: str = "UKR") -> str:
@@ -271,6 +421,36 @@ def format_price(price: float, lang: str = "UKR") -> str:
     return f"{price:.2f}₴"
 
 
+class DetailsCache:
+    """
+    LRU cache of rendered appointment details.
+    Keys are (appointment id, updated_at, lang): any change of the appointment
+    changes updated_at, so entries never need explicit invalidation
+    """
+    
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+    
+    def get(self, appointment_id: int, updated_at: Any, lang: str) -> Optional[str]:
+        key = (appointment_id, updated_at, lang)
+        details = self._entries.get(key)
+        if details is not None:
+            self._entries.move_to_end(key)
+        return details
+    
+    def set(self, appointment_id: int, updated_at: Any, lang: str, details: str) -> str:
+        key = (appointment_id, updated_at, lang)
+        self._entries[key] = details
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return details
+
+
+details_cache = DetailsCache()
+
+
 def format_appointment_details(appointment: Dict[str, Any], procedures: list, master: Dict[str, Any], lang: str = "UKR") -> str:
     """
     Format appointment details for display
@@ -288,27 +468,11 @@ def format_appointment_details(appointment: Dict[str, Any], procedures: list, ma
     date_str = format_date(appointment["start_time"], lang)
     time_str = format_time(appointment["start_time"], lang)
     
-    # Texts based on language
-    if lang == "UKR":
-        procedures_label = "Процедури"
-        master_label = "Майстер"
-        date_label = "Дата"
-        time_label = "Час"
-    elif lang == "ENG":
-        procedures_label = "Procedures"
-        master_label = "Master"
-        date_label = "Date"
-        time_label = "Time"
-    elif lang == "POR":
-        procedures_label = "Procedimentos"
-        master_label = "Mestre"
-        date_label = "Data"
-        time_label = "Hora"
-    else:  # RUS
-        procedures_label = "Процедуры"
-        master_label = "Мастер"
-        date_label = "Дата"
-        time_label = "Время"
+    # Labels from the compiled tables
+    procedures_label = get_text("label_procedures", lang)
+    master_label = get_text("label_master", lang)
+    date_label = get_text("label_date", lang)
+    time_label = get_text("label_time", lang)
     
     # Format procedures list
     procedures_text = "\n".join([f"- {proc['name']} ({format_price(proc['base_price'], lang)})" for proc in procedures])